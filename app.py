@@ -1,13 +1,18 @@
 from __future__ import annotations
 
 import json
-import math
+import logging
 import os
 import glob
-import shutil
+import math
+import base64
+import tempfile
 import threading
+import time
+from http import HTTPStatus
+from urllib.parse import quote
 from pathlib import Path
-from typing import Dict, Generator, Iterable, List, Optional, Tuple
+from typing import Callable, Dict, Generator, Iterable, List, Optional, Tuple
 
 from flask import (
     Flask,
@@ -18,8 +23,8 @@ from flask import (
     send_from_directory,
     stream_with_context,
 )
+from flask.typing import ResponseReturnValue
 from werkzeug.utils import secure_filename
-from pydub import AudioSegment
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
@@ -28,26 +33,135 @@ load_dotenv()
 # 第三方 ASR
 import dashscope
 
+from audio_meta import probe_audio
+from audio_splitter import ENCODING_PROFILES, PROFILE_MP3_32K
+from autotune import SEGMENT_AUTO, EncodingDecision, LatencyModel, choose_encoding_profile, choose_segment_length
+from cache_manager import CacheManager
+from chunked_upload import UploadError, UploadManager, remove_empty_dir
+from exporters import CONTENT_TYPES, EXPORT_FORMATS, iter_export
+from jobs import Job, JobRegistry, new_job_id
+from log_setup import LOG_FORMAT_TEXT, SAMPLED, setup_logging
+from metrics import ACTIVE_RUNS, ACTIVE_STREAMS, REGISTRY, STAGE_SECONDS
+from job_queue import RUN_FINISHED, TranscriptionQueue
+from asr_backends import (
+    ASR_BACKENDS,
+    BACKEND_DASHSCOPE,
+    BACKEND_FASTER_WHISPER,
+    ASRBackend,
+    BackendCapabilities,
+    FasterWhisperEngine,
+    LocalBatchBackend,
+    StubEngine,
+)
+from asr_pool import KeyedRateLimiter
+from asr_resilience import ASRCallError, CircuitBreaker, RetryPolicy, resilient_stream
+from pipeline import (
+    SEGMENT_FIXED,
+    SEGMENT_MODES,
+    STORAGE_DISK,
+    PipelineContext,
+    TranscriptionRequest,
+    run_transcription,
+)
+from segment_cache import (
+    content_cache_dir,
+    get_content_hash,
+    plan_segments,
+    register_content_hash,
+    save_stream_with_hash,
+)
+from transcript_store import TranscriptStore
+
 # ========== 配置 ==========
 class Config:
-    # 路径
+    # 路径（上传目录与缓存目录可用环境变量改到别处，如基准测试使用临时目录）
     BASE_DIR = Path(__file__).resolve().parent
-    UPLOAD_FOLDER = BASE_DIR / "uploads"
-    CACHE_BASE_DIR = BASE_DIR / "split_audio_transcribe"
+    UPLOAD_FOLDER = Path(os.getenv("UPLOAD_FOLDER") or BASE_DIR / "uploads")
+    CACHE_BASE_DIR = Path(os.getenv("CACHE_BASE_DIR") or BASE_DIR / "split_audio_transcribe")
+    TRANSCRIPT_DB_PATH = CACHE_BASE_DIR / "transcripts.sqlite3"
+    # 任务与后台转录队列（含每次转录的事件日志）
+    JOB_DB_PATH = CACHE_BASE_DIR / "jobs.sqlite3"
+    # 分片缓存容量预算（超出后按 LRU 淘汰）与最长保留天数，0 表示不限制
+    CACHE_MAX_BYTES = int(float(os.getenv("CACHE_MAX_MB", "2048")) * 1024 * 1024)
+    CACHE_MAX_AGE_DAYS = float(os.getenv("CACHE_MAX_AGE_DAYS", "30"))
 
     # 上传限制与安全
-    MAX_CONTENT_LENGTH = 1024 * 1024 * 100  # 100MB
+    MAX_CONTENT_LENGTH = 1024 * 1024 * 100  # 100MB（单个请求体上限，分块上传的每个分块也受此限制）
+    # 分块上传：建议分块大小与单个文件上限
+    UPLOAD_CHUNK_SIZE = 1024 * 1024 * 8  # 8MB
+    UPLOAD_MAX_FILE_BYTES = int(float(os.getenv("UPLOAD_MAX_FILE_MB", "4096")) * 1024 * 1024)
     ALLOWED_EXTENSIONS = {"wav", "mp3", "m4a", "mp4", "mov", "aac", "flac", "ogg"}
 
     # 默认兼容历史文件名
     DEFAULT_AUDIO_FILENAME = "output_clip.wav"
 
     # ASR 参数
+    # ASR 后端：dashscope（默认，在线）、faster-whisper（本地离线）、stub（确定性假后端，用于测试）
+    ASR_BACKEND = os.getenv("ASR_BACKEND", BACKEND_DASHSCOPE).strip().lower()
     ASR_MODEL = "qwen3-asr-flash"
     ASR_SEGMENT_MAX_SECONDS = 180
+    # 默认分段方式：fixed 按固定时长切分；vad 在目标时长附近的静音处切分并去掉长静音
+    SEGMENT_MODE = os.getenv("SEGMENT_MODE", SEGMENT_FIXED).strip().lower()
+    # 片段存储：disk 写入分片缓存（默认）；memory 解码一次后在内存中编码，不写缓存
+    SEGMENT_STORAGE = os.getenv("SEGMENT_STORAGE", STORAGE_DISK).strip().lower()
+    # 内存片段是否以 base64 data URI 内联提交给 ASR；关闭时写入临时文件再提交
+    ASR_INLINE_AUDIO = os.getenv("ASR_INLINE_AUDIO", "true").strip().lower() not in ("0", "false", "no")
+    # 单个转录请求内同时进行的 ASR 调用数，以及每个 API Key 每秒发起的调用上限（<=0 不限速）
+    ASR_MAX_CONCURRENCY = int(os.getenv("ASR_MAX_CONCURRENCY", "4"))
+    ASR_RATE_LIMIT_PER_SECOND = float(os.getenv("ASR_RATE_LIMIT_PER_SECOND", "5"))
+    # 可重试错误（限流、5xx、网络错误）的重试次数与指数退避参数（秒）
+    ASR_MAX_RETRIES = int(os.getenv("ASR_MAX_RETRIES", "3"))
+    ASR_RETRY_BASE_SECONDS = float(os.getenv("ASR_RETRY_BASE_SECONDS", "0.5"))
+    ASR_RETRY_MAX_SECONDS = float(os.getenv("ASR_RETRY_MAX_SECONDS", "8"))
+    # 单个片段（含重试）的截止时间（秒），<=0 表示不限
+    ASR_SEGMENT_TIMEOUT_SECONDS = float(os.getenv("ASR_SEGMENT_TIMEOUT_SECONDS", "300"))
+    # 连续失败多少次后熔断，以及熔断后的冷却时间（秒）
+    ASR_BREAKER_THRESHOLD = int(os.getenv("ASR_BREAKER_THRESHOLD", "5"))
+    ASR_BREAKER_COOLDOWN_SECONDS = float(os.getenv("ASR_BREAKER_COOLDOWN_SECONDS", "30"))
+    # 同时运行的后台转录数
+    TRANSCRIBE_WORKERS = int(os.getenv("TRANSCRIBE_WORKERS", "2"))
+    # 已结束的转录及其事件日志保留的天数，<=0 表示不清理
+    RUN_RETENTION_DAYS = float(os.getenv("RUN_RETENTION_DAYS", "7"))
+    # 导入模块时即启动转录工作线程并恢复上次未完成的转录（批量命令行等只复用配置的进程关闭）
+    TRANSCRIBE_QUEUE_AUTOSTART = os.getenv("TRANSCRIBE_QUEUE_AUTOSTART", "true").strip().lower() not in ("0", "false", "no")
+    # 本地后端：模型、设备与批量推理参数（同一窗口内到达的片段合并为一次推理，最多 LOCAL_ASR_BATCH_SIZE 个）
+    LOCAL_ASR_MODEL = os.getenv("LOCAL_ASR_MODEL", "small")
+    LOCAL_ASR_DEVICE = os.getenv("LOCAL_ASR_DEVICE", "cpu")
+    LOCAL_ASR_COMPUTE_TYPE = os.getenv("LOCAL_ASR_COMPUTE_TYPE", "int8")
+    LOCAL_ASR_BATCH_SIZE = int(os.getenv("LOCAL_ASR_BATCH_SIZE", "8"))
+    LOCAL_ASR_BATCH_WINDOW_MS = float(os.getenv("LOCAL_ASR_BATCH_WINDOW_MS", "50"))
+    # 本地推理单个片段（含排队）的超时：固定秒数 + 每秒音频的秒数；超时的片段记为错误（不自动重试）
+    LOCAL_ASR_TIMEOUT_SECONDS = float(os.getenv("LOCAL_ASR_TIMEOUT_SECONDS", "60"))
+    LOCAL_ASR_TIMEOUT_PER_AUDIO_SECOND = float(os.getenv("LOCAL_ASR_TIMEOUT_PER_AUDIO_SECOND", "4"))
+
+    # 自动调优
+    # 片段编码：mp3_32k（默认）等固定编码；auto 在启动时的后台线程中实测各编码速度，按“编码耗时 + 上传耗时”最小选择，
+    # 实测完成前仍用 mp3_32k。更换编码后已有分片缓存不再命中
+    ENCODING_PROFILE = os.getenv("ENCODING_PROFILE", PROFILE_MP3_32K.name).strip().lower()
+    # 估算上传耗时所用的上行带宽（Mbit/s）
+    ASR_UPLOAD_MBPS = float(os.getenv("ASR_UPLOAD_MBPS", "10"))
+    # segment_duration=auto 时 ASR 单次调用延迟的先验：固定开销（秒）+ 每秒音频的处理耗时（秒），有实测数据后在线修正
+    ASR_LATENCY_OVERHEAD_SECONDS = float(os.getenv("ASR_LATENCY_OVERHEAD_SECONDS", "1.5"))
+    ASR_LATENCY_PER_AUDIO_SECOND = float(os.getenv("ASR_LATENCY_PER_AUDIO_SECOND", "0.05"))
 
     # SSE
     SSE_CONTENT_TYPE = "text/event-stream; charset=utf-8"
+    # 无新事件时发送注释行保活的间隔（秒）
+    SSE_KEEPALIVE_SECONDS = 15
+    # 同一片段的转录增量在此时间窗口（毫秒）内合并为一条 delta 事件，0 表示不合并
+    SSE_PARTIAL_WINDOW_MS = float(os.getenv("SSE_PARTIAL_WINDOW_MS", "250"))
+    # 每个转录在内存中保留的最近事件数，以及最多保留多少个转录的事件；更早的事件从 SQLite 读取
+    SSE_EVENT_BUFFER = int(os.getenv("SSE_EVENT_BUFFER", "1024"))
+    SSE_EVENT_BUFFER_RUNS = int(os.getenv("SSE_EVENT_BUFFER_RUNS", "64"))
+
+    # 转录搜索单次最多返回的结果数
+    SEARCH_MAX_RESULTS = 200
+
+    # 日志：text（默认）或 json（每行一条，含 job_id / run_id / segment 字段）；文件名为空时只输出到控制台
+    LOG_FORMAT = os.getenv("LOG_FORMAT", LOG_FORMAT_TEXT).strip().lower()
+    LOG_FILE = os.getenv("LOG_FILE", "transcription.log")
+    # 每个 ASR chunk、每次进度更新等高频 DEBUG 日志的保留比例（0-1）
+    LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "0.1"))
 
 
 # ========== 应用初始化 ==========
@@ -55,62 +169,56 @@ app = Flask(__name__)
 app.config["UPLOAD_FOLDER"] = str(Config.UPLOAD_FOLDER)
 app.config["MAX_CONTENT_LENGTH"] = Config.MAX_CONTENT_LENGTH
 
-# 配置详细日志记录
-import logging
-from logging.handlers import RotatingFileHandler
-
-# 设置日志级别
+# 日志：记录线程只入队，格式化与写控制台/轮转文件在后台线程完成
 log_level = logging.DEBUG if os.getenv("FLASK_DEBUG", "").lower() == "true" else logging.INFO
-
-# 配置控制台日志
-console_handler = logging.StreamHandler()
-console_handler.setLevel(log_level)
-console_formatter = logging.Formatter(
-    '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    datefmt='%Y-%m-%d %H:%M:%S'
-)
-console_handler.setFormatter(console_formatter)
-
-# 配置文件日志（轮转日志，最大10MB，保留5个备份）
-file_handler = RotatingFileHandler(
-    'transcription.log', 
-    maxBytes=10*1024*1024,  # 10MB
-    backupCount=5,
-    encoding='utf-8'
-)
-file_handler.setLevel(log_level)
-file_formatter = logging.Formatter(
-    '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    datefmt='%Y-%m-%d %H:%M:%S'
-)
-file_handler.setFormatter(file_formatter)
-
-# 配置应用日志
+setup_logging(log_level, Config.LOG_FILE, Config.LOG_FORMAT, Config.LOG_SAMPLE_RATE)
+# app.logger 的记录传递给根日志统一处理，避免重复输出
 app.logger.setLevel(log_level)
-app.logger.addHandler(console_handler)
-app.logger.addHandler(file_handler)
-
-# 配置根日志
-logging.basicConfig(
-    level=log_level,
-    handlers=[console_handler, file_handler]
-)
+app.logger.handlers.clear()
+app.logger.propagate = True
+logger = logging.getLogger(__name__)
 
 Config.UPLOAD_FOLDER.mkdir(parents=True, exist_ok=True)
 Config.CACHE_BASE_DIR.mkdir(parents=True, exist_ok=True)
 
-# 线程安全的当前音频文件名
-_current_audio_filename = Config.DEFAULT_AUDIO_FILENAME
-_current_audio_lock = threading.Lock()
+# ASR 识别语言与定制化上下文（同时参与转录缓存的键）
+asr_language = os.getenv("ASR_LANGUAGE", "")
+asr_system_content = os.getenv("ASR_SYSTEM_CONTENT", "")
 
-def get_current_audio_filename() -> str:
-    with _current_audio_lock:
-        return _current_audio_filename
+# 片段级转录结果缓存，跨请求、跨进程重启复用
+transcript_store = TranscriptStore(Config.TRANSCRIPT_DB_PATH)
+
+# 分块可续传上传会话
+upload_manager = UploadManager(Config.UPLOAD_FOLDER)
+
+# 分片缓存索引：维护占用统计并按容量/时间淘汰
+cache_manager = CacheManager(
+    Config.CACHE_BASE_DIR,
+    max_bytes=Config.CACHE_MAX_BYTES,
+    max_age_s=Config.CACHE_MAX_AGE_DAYS * 86400,
+)
 
-def set_current_audio_filename(name: str) -> None:
-    with _current_audio_lock:
-        global _current_audio_filename
-        _current_audio_filename = name
+# 每次上传对应一个任务，任务之间的音频、进度与结果相互独立；任务持久化，服务重启后仍可查询
+job_registry = JobRegistry(db_path=Config.JOB_DB_PATH)
+# 未指定 job_id 的请求使用默认音频文件对应的固定任务
+DEFAULT_JOB_ID = "default"
+
+# 同一 API Key 的所有请求共享限速配额
+asr_rate_limiter = KeyedRateLimiter(Config.ASR_RATE_LIMIT_PER_SECOND)
+# 所有转录共享同一熔断器：ASR 服务持续异常时快速失败，而不是让每个片段各自重试到超时
+asr_breaker = CircuitBreaker(Config.ASR_BREAKER_THRESHOLD, Config.ASR_BREAKER_COOLDOWN_SECONDS)
+# 最近 ASR 调用的耗时，用于 segment_duration=auto 时选择分段时长
+asr_latency = LatencyModel(Config.ASR_LATENCY_OVERHEAD_SECONDS, Config.ASR_LATENCY_PER_AUDIO_SECOND)
+
+def resolve_job() -> Tuple[Optional[Job], Optional[str]]:
+    # 按查询参数 job_id 查找任务；未提供时回退到默认音频文件
+    job_id = (request.args.get("job_id") or "").strip()
+    if not job_id:
+        return job_registry.get_or_create(DEFAULT_JOB_ID, Config.DEFAULT_AUDIO_FILENAME), None
+    job = job_registry.get(job_id)
+    if job is None:
+        return None, f"任务 {job_id} 不存在或已过期"
+    return job, None
 
 
 # ========== 通用工具 ==========
@@ -119,8 +227,30 @@ def allowed_file(filename: str) -> bool:
     return ext in Config.ALLOWED_EXTENSIONS
 
 def safe_join_uploads(filename: str) -> Path:
-    # 限制只能访问 uploads 下的文件
-    return Config.UPLOAD_FOLDER / Path(filename).name
+    # 限制只能访问 uploads 下的文件：最多保留“任务 ID/文件名”一级子目录，各路径成分都经过 secure_filename
+    parts = [p for p in (secure_filename(part) for part in Path(filename).parts[-2:]) if p not in ("", ".", "..")]
+    return Config.UPLOAD_FOLDER.joinpath(*parts) if parts else Config.UPLOAD_FOLDER / "_"
+
+
+def new_upload_target(filename: str) -> Tuple[str, str, Path]:
+    # 每次上传存放在以新任务 ID 命名的子目录中，同名文件互不覆盖：返回 (任务 ID, 存放路径（相对 uploads）, 绝对路径)。
+    # 子目录由实际写入文件的一方创建，失败的上传不留下空目录
+    job_id = new_job_id()
+    stored_name = f"{job_id}/{filename}"
+    return job_id, stored_name, safe_join_uploads(stored_name)
+
+
+def is_served_upload(filename: str) -> bool:
+    # 只对外提供已落盘的音频：排除 .partial 下的分块、写入中的临时文件与 .sha256 等附属文件
+    parts = Path(filename).parts
+    return 0 < len(parts) <= 2 and not any(p.startswith(".") for p in parts) and allowed_file(filename)
+
+
+def upload_response(job: Job):
+    return jsonify({
+        "url": f"/uploads/{job.storage_name}", "filename": job.filename,
+        "content_hash": job.content_hash, "job_id": job.job_id,
+    }), 200
 
 def make_json_error(message: str, status: int = 400, extra: Optional[Dict] = None):
     payload = {"error": message}
@@ -128,32 +258,31 @@ def make_json_error(message: str, status: int = 400, extra: Optional[Dict] = Non
         payload.update(extra)
     return jsonify(payload), status
 
-def sse_event(data: Dict) -> str:
-    # 仅使用 data 行，兼容当前前端实现
-    return f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+SSE_HEADERS = {
+    "Content-Type": Config.SSE_CONTENT_TYPE,
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no",
+}
+
+def sse_event(data: Dict, event_id: Optional[int] = None) -> str:
+    return sse_frame(json.dumps(data, ensure_ascii=False), event_id)
+
+def sse_frame(payload: str, event_id: Optional[int] = None) -> str:
+    # payload 为已序列化的 JSON；带 id 行时浏览器断线重连会通过 Last-Event-ID 回传
+    prefix = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{prefix}data: {payload}\n\n"
 
 def get_env_or_none(name: str) -> Optional[str]:
     v = os.getenv(name, "").strip()
     return v or None
 
 def get_audio_duration_seconds(file_path: Path) -> float:
-    ext = file_path.suffix.lower().lstrip(".")
-    fmt_hint = "mp4" if ext in ("m4a", "mp4", "mov") else (ext if ext else None)
-    audio = AudioSegment.from_file(file_path, format=fmt_hint)
-    return len(audio) / 1000.0
-
-def compute_cache_dir(start_s: int, end_s: int, segment_s: int) -> Path:
-    return Config.CACHE_BASE_DIR / f"cache_{start_s}_{end_s}_{segment_s}"
-
-def get_dir_size_bytes(path: Path) -> int:
-    total = 0
-    for p in path.rglob("*"):
-        if p.is_file():
-            try:
-                total += p.stat().st_size
-            except OSError:
-                pass
-    return total
+    # 只读取文件头信息，不解码音频；结果按文件缓存
+    return probe_audio(file_path).duration_s
+
+def compute_cache_dir(content_hash: str) -> Path:
+    # 缓存按音频内容寻址，不同上传的相同区间不会互相复用
+    return content_cache_dir(Config.CACHE_BASE_DIR, content_hash)
 
 def parse_float_arg(name: str, default: float) -> Tuple[Optional[float], Optional[str]]:
     raw = request.args.get(name, None)
@@ -164,10 +293,6 @@ def parse_float_arg(name: str, default: float) -> Tuple[Optional[float], Optiona
     except Exception:
         return None, f"参数 {name} 必须为数字"
 
-def estimate_segments(start_s: int, end_s: int, segment_s: int) -> int:
-    duration = max(0, end_s - start_s)
-    return max(1, math.ceil(duration / max(1, segment_s)))
-
 def clamp_end_time_by_duration(start_time: float, end_time: float, duration: float) -> float:
     if duration <= 0:
         return start_time
@@ -175,9 +300,13 @@ def clamp_end_time_by_duration(start_time: float, end_time: float, duration: flo
 
 
 # ========== ASR 客户端 ==========
-class ASRClient:
+class ASRClient(ASRBackend):
+    # DashScope 在线后端
     def __init__(self, api_key: Optional[str]):
         self.api_key = api_key
+        self.capabilities = BackendCapabilities(BACKEND_DASHSCOPE, Config.ASR_MODEL, Config.ASR_SEGMENT_MAX_SECONDS)
+        self.retry_policy = RetryPolicy(Config.ASR_MAX_RETRIES, Config.ASR_RETRY_BASE_SECONDS, Config.ASR_RETRY_MAX_SECONDS)
+        self.breaker = asr_breaker
 
     def ensure_ready(self) -> Optional[str]:
         if not self.api_key:
@@ -185,11 +314,40 @@ class ASRClient:
         return None
 
     def stream_transcribe_file(self, segment_file: Path) -> Iterable[str]:
-        import logging
-        logger = logging.getLogger(__name__)
-        
-        logger.info(f"[ASR] Starting transcription for file: {segment_file}")
-        
+        return self._stream_transcribe(f"file://{segment_file.resolve()}", segment_file.name)
+
+    def stream_transcribe_bytes(self, data: bytes, fmt: str = "mp3") -> Iterable[str]:
+        # 内存中编码的片段：默认以 data URI 内联提交，不落盘；ASR_INLINE_AUDIO=false 时退回临时文件
+        label = f"<memory {len(data)} bytes>"
+        if Config.ASR_INLINE_AUDIO:
+            audio = f"data:audio/{fmt};base64,{base64.b64encode(data).decode('ascii')}"
+            yield from self._stream_transcribe(audio, label)
+            return
+        fd, tmp_name = tempfile.mkstemp(prefix=".asr-", suffix=f".{fmt}")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            yield from self._stream_transcribe(f"file://{Path(tmp_name).resolve()}", label)
+        finally:
+            try:
+                os.remove(tmp_name)
+            except OSError:
+                pass
+
+    def _stream_transcribe(self, audio: str, label: str) -> Iterable[str]:
+        # 可重试的错误按指数退避重试，整个片段（含重试）受 ASR_SEGMENT_TIMEOUT_SECONDS 约束
+        timeout_s = Config.ASR_SEGMENT_TIMEOUT_SECONDS
+        return resilient_stream(
+            lambda remaining: self._stream_once(audio, label, remaining),
+            label,
+            policy=self.retry_policy,
+            breaker=self.breaker,
+            timeout_s=timeout_s if timeout_s > 0 else None,
+        )
+
+    def _stream_once(self, audio: str, label: str, timeout_s: Optional[float] = None) -> Iterable[str]:
+        logger.debug("[ASR] Starting transcription for file: %s", label)
+
         messages = [
             {
                 "role": "system",
@@ -201,13 +359,12 @@ class ASRClient:
             {
                 "role": "user",
                 "content": [
-                    {"audio": f"file://{segment_file.resolve()}"},
+                    {"audio": audio},
                 ]
             }
         ]
 
         try:
-            logger.info(f"[ASR] Calling dashscope API for file: {segment_file.name}")
             response = dashscope.MultiModalConversation.call(
                 api_key=self.api_key,
                 model=Config.ASR_MODEL,
@@ -215,10 +372,12 @@ class ASRClient:
                 result_format="message",
                 asr_options={"language": asr_language, "enable_lid": True, "enable_itn": True},
                 stream=True,
+                # 底层 HTTP 读超时不超过片段剩余时间
+                **({"request_timeout": max(1, math.ceil(timeout_s))} if timeout_s else {}),
             )
-            logger.info(f"[ASR] API call initiated for file: {segment_file.name}")
+            logger.debug("[ASR] API call initiated for file: %s", label)
         except Exception as e:
-            logger.error(f"[ASR] API call failed for file {segment_file.name}: {e}")
+            logger.error("[ASR] API call failed for file %s: %s", label, e)
             raise
 
         chunk_count = 0
@@ -227,6 +386,13 @@ class ASRClient:
         # 兼容两种 chunk 结构
         for chunk in response:
             chunk_count += 1
+            logger.debug("[ASR] Chunk %s received for file: %s", chunk_count, label, extra=SAMPLED)
+            # 限流、服务端错误等以非 200 的 chunk 返回，交给重试逻辑判断是否重试
+            status_code = chunk.get("status_code") if isinstance(chunk, dict) else getattr(chunk, "status_code", None)
+            if status_code is not None and status_code != HTTPStatus.OK:
+                code = chunk.get("code") if isinstance(chunk, dict) else getattr(chunk, "code", None)
+                message = chunk.get("message") if isinstance(chunk, dict) else getattr(chunk, "message", None)
+                raise ASRCallError(f"ASR 调用失败 ({status_code} {code}): {message}", status_code, code)
             try:
                 # dict 风格
                 if isinstance(chunk, dict) and "output" in chunk:
@@ -247,10 +413,217 @@ class ASRClient:
                         yield text
             except Exception as e:
                 # 记录单个 chunk 错误，但不中断整个流
-                logger.warning(f"[ASR] Error processing chunk {chunk_count} for file {segment_file.name}: {e}")
+                logger.warning("[ASR] Error processing chunk %s for file %s: %s", chunk_count, label, e)
                 continue
         
-        logger.info(f"[ASR] Transcription completed for file: {segment_file.name} - chunks processed: {chunk_count}, text yielded: {text_yielded}")
+        logger.info("[ASR] Transcription completed for file: %s - chunks processed: %s, text yielded: %s", label, chunk_count, text_yielded)
+
+
+_asr_client: Optional[ASRBackend] = None
+_asr_client_key: Optional[Tuple[str, Optional[str]]] = None
+_asr_client_lock = threading.Lock()
+
+
+def create_asr_backend(name: str, api_key: Optional[str]) -> ASRBackend:
+    if name == BACKEND_DASHSCOPE:
+        return ASRClient(api_key=api_key)
+    if name not in ASR_BACKENDS:
+        raise ValueError(f"未知的 ASR_BACKEND: {name}，可选: {list(ASR_BACKENDS)}")
+    if name == BACKEND_FASTER_WHISPER:
+        engine = FasterWhisperEngine(
+            Config.LOCAL_ASR_MODEL, Config.LOCAL_ASR_DEVICE, Config.LOCAL_ASR_COMPUTE_TYPE, Config.LOCAL_ASR_BATCH_SIZE,
+        )
+    else:
+        engine = StubEngine()
+    return LocalBatchBackend(
+        engine,
+        name,
+        max_segment_s=Config.ASR_SEGMENT_MAX_SECONDS,
+        batch_size=Config.LOCAL_ASR_BATCH_SIZE,
+        window_s=Config.LOCAL_ASR_BATCH_WINDOW_MS / 1000,
+        timeout_base_s=Config.LOCAL_ASR_TIMEOUT_SECONDS,
+        timeout_per_audio_s=Config.LOCAL_ASR_TIMEOUT_PER_AUDIO_SECOND,
+        language=asr_language,
+    )
+
+
+def get_asr_client() -> ASRBackend:
+    # 进程内复用同一个 ASR 后端（共享重试策略、熔断状态或已加载的本地模型），配置或 API Key 变化时重建
+    global _asr_client, _asr_client_key
+    key = (Config.ASR_BACKEND, get_env_or_none("DASHSCOPE_API_KEY") if Config.ASR_BACKEND == BACKEND_DASHSCOPE else None)
+    with _asr_client_lock:
+        if _asr_client is None or _asr_client_key != key:
+            _asr_client = create_asr_backend(*key)
+            _asr_client_key = key
+        return _asr_client
+
+
+ENCODING_AUTO = "auto"
+# 默认编码，也是 auto 实测完成前（或实测失败时）使用的编码
+DEFAULT_ENCODING = EncodingDecision(PROFILE_MP3_32K, 0.0, 0.0)
+
+_encoding: Optional[EncodingDecision] = None
+_encoding_lock = threading.Lock()
+
+
+def calibrate_encoding() -> EncodingDecision:
+    # 确定片段编码，之后整个进程沿用，分片缓存文件名随之固定；auto 需实测各编码速度（数秒），
+    # 由启动时的后台线程（批量命令行在开始前）调用，不占用请求路径
+    global _encoding
+    with _encoding_lock:
+        if _encoding is None:
+            name = Config.ENCODING_PROFILE
+            if name == ENCODING_AUTO:
+                try:
+                    _encoding = choose_encoding_profile(
+                        ENCODING_PROFILES.values(), Config.ASR_UPLOAD_MBPS * 1_000_000 / 8,
+                    )
+                    logger.info("[TUNE] Selected encoding profile: %s", _encoding.to_dict())
+                except Exception:
+                    logger.exception("[TUNE] Encoding calibration failed, using %s", DEFAULT_ENCODING.profile.name)
+                    _encoding = DEFAULT_ENCODING
+            elif name in ENCODING_PROFILES:
+                _encoding = EncodingDecision(ENCODING_PROFILES[name], 0.0, 0.0)
+            else:
+                raise ValueError(f"未知的 ENCODING_PROFILE: {name}，可选: {[ENCODING_AUTO, *ENCODING_PROFILES]}")
+        return _encoding
+
+
+def get_encoding_decision() -> EncodingDecision:
+    # 不等待实测：auto 的实测尚未完成时使用默认编码
+    if _encoding is not None:
+        return _encoding
+    if Config.ENCODING_PROFILE == ENCODING_AUTO:
+        return DEFAULT_ENCODING
+    return calibrate_encoding()
+
+
+if Config.ENCODING_PROFILE == ENCODING_AUTO:
+    threading.Thread(target=calibrate_encoding, name="encoding-calibration", daemon=True).start()
+
+
+def build_pipeline_context(asr_client: ASRBackend) -> PipelineContext:
+    # 转录流水线的共享依赖（缓存、限速器、ASR 配置），后台转录与批量命令行共用
+    caps = asr_client.capabilities
+    return PipelineContext(
+        asr_client=asr_client,
+        transcript_store=transcript_store,
+        cache_manager=cache_manager,
+        cache_base_dir=Config.CACHE_BASE_DIR,
+        asr_model=caps.model,
+        asr_language=asr_language,
+        asr_system_content=asr_system_content,
+        # 批量后端需要足够多的并发片段才能攒满一批；本地后端不限速
+        max_concurrency=max(Config.ASR_MAX_CONCURRENCY, caps.batch_size),
+        rate_limiter=asr_rate_limiter if caps.remote else None,
+        max_segment_s=min(Config.ASR_SEGMENT_MAX_SECONDS, caps.max_segment_s),
+        segment_storage=Config.SEGMENT_STORAGE,
+        partial_window_s=Config.SSE_PARTIAL_WINDOW_MS / 1000,
+        encoding=get_encoding_decision().profile,
+        latency_model=asr_latency,
+    )
+
+
+# ========== 后台转录 ==========
+# 任务状态中记录的转录参数
+JOB_PARAMS = ("start_time", "end_time", "segment_duration", "segment_mode")
+
+
+def track_job_event(job: Job, event: Dict) -> None:
+    # 把转录事件反映到任务的结果与进度上
+    kind = event.get("type")
+    if kind == "segment_done":
+        job.add_result(event["timestamp"], event["text"])
+    elif kind == "progress":
+        job.set_progress(event["percent"])
+    elif kind == "done":
+        job.finish()
+
+
+def sync_job_with_run(job: Job, run: Dict) -> None:
+    # 任务订阅已有的 run 时，按事件日志补齐此前的结果与进度；之后的事件由工作线程直接更新。
+    # 工作线程先写日志再更新订阅的任务，因此重置之前被它更新过的事件都能在回放中读到
+    job.start({k: run["params"][k] for k in JOB_PARAMS if k in run["params"]})
+    seq = 0
+    while True:
+        rows = transcription_queue.read(run["run_id"], seq)
+        if not rows:
+            return
+        for seq, payload in rows:
+            track_job_event(job, json.loads(payload))
+
+
+def run_transcription_job(run: Dict, emit: Callable[[Dict], None]) -> None:
+    # 由转录队列的工作线程调用，事件同时用于更新所有订阅该 run 的任务的状态
+    params = run["params"]
+    job_registry.get_or_create(run["job_id"], params["filename"])
+
+    def subscribed_jobs() -> List[Job]:
+        # 转录过程中仍可能有新的任务订阅，每次按最新的订阅者列表更新
+        return [j for j in map(job_registry.get, transcription_queue.subscribers(run["run_id"])) if j is not None]
+
+    asr_client = get_asr_client()
+    asr_err = asr_client.ensure_ready()
+    if asr_err:
+        raise RuntimeError(asr_err)
+
+    ctx = build_pipeline_context(asr_client)
+    segment_s = params["segment_duration"]
+    tuning = None
+    if segment_s == SEGMENT_AUTO:
+        # 按实测 ASR 延迟、并发数与限速选择分段时长
+        rate = Config.ASR_RATE_LIMIT_PER_SECOND if asr_client.capabilities.remote else 0.0
+        decision = choose_segment_length(
+            params["start_time"], params["end_time"], ctx.max_concurrency, asr_latency, rate, ctx.max_segment_s,
+        )
+        segment_s = decision.segment_s
+        tuning = {"segment": decision.to_dict(), "encoding": get_encoding_decision().to_dict()}
+        logger.info("[TUNE] Auto segment duration: %s", tuning["segment"])
+
+    req = TranscriptionRequest(
+        audio_path=safe_join_uploads(params.get("audio_file") or params["filename"]),
+        content_hash=params["content_hash"],
+        start_s=params["start_time"],
+        end_s=params["end_time"],
+        segment_s=segment_s,
+        segment_mode=params.get("segment_mode", SEGMENT_FIXED),
+    )
+
+    def emit_and_track(event: Dict) -> None:
+        kind = event.get("type")
+        if kind == "segments" and tuning is not None:
+            event = {**event, "tuning": tuning}
+        # 先写入事件日志再更新任务：新订阅的任务在 sync_job_with_run 中重置后回放日志，
+        # 即使重置抹掉了这里对它的更新，该事件也已在日志中，不会丢失（重复应用是幂等的）
+        emit(event)
+        if kind in ("segment_done", "progress", "done"):
+            for job in subscribed_jobs():
+                track_job_event(job, event)
+
+    for job in subscribed_jobs():
+        job.start({k: params[k] for k in JOB_PARAMS if k in params})
+    try:
+        with ACTIVE_RUNS.track(), STAGE_SECONDS.time(stage="pipeline"):
+            run_transcription(req, ctx, emit_and_track)
+    except Exception as e:
+        for job in subscribed_jobs():
+            job.finish(error=str(e))
+        raise
+
+
+# 转录在后台工作线程中运行，SSE 连接断开不影响转录
+transcription_queue = TranscriptionQueue(
+    Config.JOB_DB_PATH,
+    run_transcription_job,
+    workers=Config.TRANSCRIBE_WORKERS,
+    buffer_events=Config.SSE_EVENT_BUFFER,
+    buffer_runs=Config.SSE_EVENT_BUFFER_RUNS,
+    retention_s=Config.RUN_RETENTION_DAYS * 86400,
+)
+# WSGI 服务器导入本模块时立即启动，上次进程退出时未完成的转录不必等到下一次提交才恢复；
+# 直接运行时在 __main__ 中启动（调试重载器的父进程不启动）
+if __name__ != "__main__" and Config.TRANSCRIBE_QUEUE_AUTOSTART:
+    transcription_queue.start()
 
 
 # ========== 路由 ==========
@@ -277,239 +650,351 @@ def upload_file():
     if not filename or not allowed_file(filename):
         return make_json_error(f"不支持的文件类型，仅允许: {sorted(Config.ALLOWED_EXTENSIONS)}", 400)
 
-    target_path = safe_join_uploads(filename)
+    job_id, stored_name, target_path = new_upload_target(filename)
     try:
-        file.save(str(target_path))
+        target_path.parent.mkdir(parents=True, exist_ok=True)
+        # 流式写盘并同时计算内容哈希，后续缓存直接以哈希为键
+        content_hash = save_stream_with_hash(file.stream, target_path)
     except Exception as e:
+        remove_empty_dir(target_path.parent)
         app.logger.exception("保存文件失败")
         return make_json_error("文件保存失败", 500, {"detail": str(e)})
 
-    set_current_audio_filename(filename)
-    return jsonify({"url": f"/uploads/{filename}", "filename": filename}), 200
+    return upload_response(job_registry.create(filename, content_hash, stored_name, job_id))
+
 
+@app.route("/upload/init", methods=["POST"])
+def upload_init():
+    payload = request.get_json(silent=True) or {}
+    filename = secure_filename(str(payload.get("filename") or ""))
+    if not filename or not allowed_file(filename):
+        return make_json_error(f"不支持的文件类型，仅允许: {sorted(Config.ALLOWED_EXTENSIONS)}", 400)
+    try:
+        size = int(payload.get("size"))
+    except (TypeError, ValueError):
+        return make_json_error("参数 size 必须为整数", 400)
+    if size > Config.UPLOAD_MAX_FILE_BYTES:
+        return make_json_error(f"文件大小不能超过 {Config.UPLOAD_MAX_FILE_BYTES // (1024 * 1024)}MB", 413)
 
-@app.route("/uploads/<filename>")
+    try:
+        session = upload_manager.init(filename, size)
+    except UploadError as e:
+        return make_json_error(str(e), e.status, e.extra)
+    session["chunk_size"] = Config.UPLOAD_CHUNK_SIZE
+    return jsonify(session), 200
+
+
+@app.route("/upload/<upload_id>", methods=["GET"])
+def upload_status(upload_id):
+    # 续传前查询已接收的字节数
+    try:
+        return jsonify(upload_manager.status(upload_id)), 200
+    except UploadError as e:
+        return make_json_error(str(e), e.status, e.extra)
+
+
+@app.route("/upload/<upload_id>", methods=["PUT"])
+def upload_chunk(upload_id):
+    try:
+        offset = int(request.args.get("offset", ""))
+    except ValueError:
+        return make_json_error("参数 offset 必须为整数", 400)
+    try:
+        # 直接从请求流读取并追加写盘，不经过 request.files 的整体缓存
+        result = upload_manager.put_chunk(upload_id, offset, request.stream, Config.MAX_CONTENT_LENGTH)
+    except UploadError as e:
+        return make_json_error(str(e), e.status, e.extra)
+    return jsonify(result), 200
+
+
+@app.route("/upload/<upload_id>/complete", methods=["POST"])
+def upload_complete(upload_id):
+    try:
+        filename = upload_manager.status(upload_id)["filename"]
+        job_id, stored_name, target_path = new_upload_target(filename)
+        target_path, content_hash = upload_manager.complete(upload_id, target_path)
+    except UploadError as e:
+        return make_json_error(str(e), e.status, e.extra)
+    except Exception as e:
+        app.logger.exception("保存文件失败")
+        return make_json_error("文件保存失败", 500, {"detail": str(e)})
+
+    register_content_hash(target_path, content_hash)
+    return upload_response(job_registry.create(filename, content_hash, stored_name, job_id))
+
+
+@app.route("/uploads/<path:filename>")
 def uploaded_file(filename):
     # send_from_directory 内部已处理基本的安全性
+    if not is_served_upload(filename):
+        return make_json_error("文件不存在", 404)
     return send_from_directory(app.config["UPLOAD_FOLDER"], filename)
 
 
 @app.route("/audio/metadata", methods=["GET"])
 def audio_metadata():
-    filename = get_current_audio_filename()
-    audio_path = safe_join_uploads(filename)
+    job, err = resolve_job()
+    if err:
+        return make_json_error(err, 404)
+    filename = job.filename
+    audio_path = safe_join_uploads(job.storage_name)
     if not audio_path.exists():
-        return jsonify({"exists": False}), 200
+        return jsonify({"exists": False, "job_id": job.job_id}), 200
     try:
-        duration = get_audio_duration_seconds(audio_path)
-        return jsonify({"exists": True, "duration": duration, "filename": filename}), 200
+        meta = probe_audio(audio_path)
+        return jsonify({"exists": True, "duration": meta.duration_s, "filename": filename, "job_id": job.job_id, **meta.to_dict()}), 200
     except Exception as e:
         app.logger.exception("读取音频元数据失败")
-        return jsonify({"exists": True, "error": str(e), "filename": filename}), 500
+        return jsonify({"exists": True, "error": str(e), "filename": filename, "job_id": job.job_id}), 500
 
 
-@app.route("/cache/info", methods=["GET"])
-def cache_info():
-    if not Config.CACHE_BASE_DIR.exists():
-        return jsonify({"exists": False, "size_bytes": 0, "caches": []})
+@app.route("/jobs/<job_id>", methods=["GET"])
+def job_status(job_id):
+    # 任务状态、进度与已完成的分段结果
+    job = job_registry.get(job_id)
+    if job is None:
+        return make_json_error(f"任务 {job_id} 不存在或已过期", 404)
+    return jsonify(job.to_dict()), 200
 
-    caches = []
-    for d in Config.CACHE_BASE_DIR.iterdir():
-        if d.is_dir() and d.name.startswith("cache_"):
-            caches.append({"dir": d.name, "size_bytes": get_dir_size_bytes(d)})
 
-    total = sum(c["size_bytes"] for c in caches)
-    return jsonify({"exists": True, "size_bytes": total, "caches": caches})
+@app.route("/search", methods=["GET"])
+def search_transcripts():
+    # 在所有已转录的片段中全文检索（多个检索词用空格分隔，取交集），返回带时间戳的命中片段与对应的任务
+    query = (request.args.get("q") or "").strip()
+    if not query:
+        return make_json_error("缺少检索词 q", 400)
+    try:
+        limit = min(Config.SEARCH_MAX_RESULTS, max(1, int(request.args.get("limit", "20"))))
+    except ValueError:
+        return make_json_error("参数 limit 必须为整数", 400)
+    content_hash = request.args.get("content_hash") or None
+    if request.args.get("job_id") and not content_hash:
+        job, err = resolve_job()
+        if err:
+            return make_json_error(err, 404)
+        content_hash = job.content_hash
+    t0 = time.perf_counter()
+    hits = transcript_store.search(query, limit, content_hash=content_hash, model=request.args.get("model") or None)
+    jobs = job_registry.find_by_content(h["content_hash"] for h in hits)
+    for hit in hits:
+        hit["jobs"] = jobs.get(hit["content_hash"], [])
+    return jsonify({
+        "query": query,
+        "hits": hits,
+        "took_ms": round((time.perf_counter() - t0) * 1000, 2),
+    }), 200
+
+
+@app.route("/export", methods=["GET"])
+def export_transcript():
+    # 从转录缓存流式导出一段录音的完整转录稿（txt / srt / vtt / json），按 content_hash 或 job_id 指定录音
+    fmt = (request.args.get("format") or "srt").strip().lower()
+    if fmt not in EXPORT_FORMATS:
+        return make_json_error(f"参数 format 仅支持: {list(EXPORT_FORMATS)}", 400)
+    content_hash = request.args.get("content_hash") or None
+    name = content_hash[:12] if content_hash else ""
+    if not content_hash:
+        job, err = resolve_job()
+        if err:
+            return make_json_error(err, 404)
+        name = Path(job.filename).stem
+        try:
+            content_hash = job.content_hash or get_content_hash(safe_join_uploads(job.storage_name))
+        except OSError:
+            return make_json_error(f"音频文件 {job.filename} 不存在", 404)
+    start_time, err = parse_float_arg("start_time", 0.0)
+    if err:
+        return make_json_error(err, 400)
+    end_time, err = parse_float_arg("end_time", math.inf)
+    if err:
+        return make_json_error(err, 400)
+
+    segments = transcript_store.iter_segments(
+        content_hash,
+        start_ms=round(start_time * 1000),
+        end_ms=None if math.isinf(end_time) else round(end_time * 1000),
+        model=request.args.get("model") or None,
+    )
+    body = iter_export(segments, fmt, {"content_hash": content_hash})
+    return Response(stream_with_context(body), content_type=CONTENT_TYPES[fmt], headers={
+        "Content-Disposition": f"attachment; filename*=UTF-8''{quote(name or 'transcript')}.{fmt}",
+    })
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    # Prometheus 文本格式；各阶段耗时、片段数、缓存命中、活跃连接等
+    return Response(REGISTRY.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@app.route("/cache/info", methods=["GET"])
+def cache_info():
+    # 直接读取缓存索引的汇总，不再遍历磁盘
+    info = cache_manager.info()
+    info["exists"] = Config.CACHE_BASE_DIR.exists()
+    return jsonify(info)
 
 
 @app.route("/cache/clear", methods=["POST"])
 def cache_clear():
-    cleared = 0
-    if Config.CACHE_BASE_DIR.exists():
-        for d in Config.CACHE_BASE_DIR.iterdir():
-            if d.is_dir() and d.name.startswith("cache_"):
-                shutil.rmtree(d, ignore_errors=True)
-                cleared += 1
+    cleared = cache_manager.clear()
     return jsonify({"cleared_dirs": cleared}), 200
 
 
-@app.route("/transcribe/stream")
-def transcribe_audio_stream():
+def prepare_transcription_stream() -> Tuple[Optional[str], int, Optional[ResponseReturnValue]]:
+    # 校验当前请求的参数并提交（或附着到）后台转录，返回 (run_id, 续读起点, None)；
+    # 参数错误等情况返回 (None, 0, 响应)。WSGI 与 ASGI 两种服务方式共用。
     # 添加详细的请求日志
-    app.logger.info(f"[TRANSCRIBE] Starting transcription request - start_time: {request.args.get('start_time')}, end_time: {request.args.get('end_time')}, segment_duration: {request.args.get('segment_duration')}")
+    app.logger.info("[TRANSCRIBE] Starting transcription request - start_time: %s, end_time: %s, segment_duration: %s", request.args.get('start_time'), request.args.get('end_time'), request.args.get('segment_duration'))
     
     try:
         # 参数解析与校验
         start_time, err = parse_float_arg("start_time", 0.0)
         if err:
-            app.logger.warning(f"[TRANSCRIBE] Invalid start_time parameter: {request.args.get('start_time')}")
-            return make_json_error(err, 400)
+            app.logger.warning("[TRANSCRIBE] Invalid start_time parameter: %s", request.args.get('start_time'))
+            return None, 0, make_json_error(err, 400)
         
         end_time, err = parse_float_arg("end_time", 60.0)
         if err:
-            app.logger.warning(f"[TRANSCRIBE] Invalid end_time parameter: {request.args.get('end_time')}")
-            return make_json_error(err, 400)
+            app.logger.warning("[TRANSCRIBE] Invalid end_time parameter: %s", request.args.get('end_time'))
+            return None, 0, make_json_error(err, 400)
             
-        segment_duration, err = parse_float_arg("segment_duration", 60.0)
+        # segment_duration=auto：提交时只记录 auto，开始转录时再按实测 ASR 延迟选择
+        auto_segment = (request.args.get("segment_duration") or "").strip().lower() == SEGMENT_AUTO
+        segment_duration, err = (None, None) if auto_segment else parse_float_arg("segment_duration", 60.0)
+        if err:
+            app.logger.warning("[TRANSCRIBE] Invalid segment_duration parameter: %s", request.args.get('segment_duration'))
+            return None, 0, make_json_error(err, 400)
+
+        app.logger.info("[TRANSCRIBE] Parsed parameters - start_time: %s, end_time: %s, segment_duration: %s", start_time, end_time, segment_duration)
+
+        if not auto_segment and (segment_duration is None or segment_duration <= 0):
+            app.logger.warning("[TRANSCRIBE] Invalid segment_duration: %s", segment_duration)
+            return None, 0, make_json_error("分割单位时长必须大于0", 400)
+        if not auto_segment and segment_duration > Config.ASR_SEGMENT_MAX_SECONDS:
+            app.logger.warning("[TRANSCRIBE] Segment duration too large: %s > %s", segment_duration, Config.ASR_SEGMENT_MAX_SECONDS)
+            return None, 0, make_json_error(f"分割单位时长不能超过 {Config.ASR_SEGMENT_MAX_SECONDS} 秒", 400)
+        segment_mode = (request.args.get("segment_mode") or Config.SEGMENT_MODE).strip().lower()
+        if segment_mode not in SEGMENT_MODES:
+            return None, 0, make_json_error(f"参数 segment_mode 仅支持: {list(SEGMENT_MODES)}", 400)
+
+        # 选择任务对应的音频
+        job, err = resolve_job()
         if err:
-            app.logger.warning(f"[TRANSCRIBE] Invalid segment_duration parameter: {request.args.get('segment_duration')}")
-            return make_json_error(err, 400)
-
-        app.logger.info(f"[TRANSCRIBE] Parsed parameters - start_time: {start_time}, end_time: {end_time}, segment_duration: {segment_duration}")
-
-        if segment_duration is None or segment_duration <= 0:
-            app.logger.warning(f"[TRANSCRIBE] Invalid segment_duration: {segment_duration}")
-            return make_json_error("分割单位时长必须大于0", 400)
-        if segment_duration > Config.ASR_SEGMENT_MAX_SECONDS:
-            app.logger.warning(f"[TRANSCRIBE] Segment duration too large: {segment_duration} > {Config.ASR_SEGMENT_MAX_SECONDS}")
-            return make_json_error(f"分割单位时长不能超过 {Config.ASR_SEGMENT_MAX_SECONDS} 秒", 400)
-
-        # 选择当前音频
-        filename = get_current_audio_filename()
-        audio_path = safe_join_uploads(filename)
-        app.logger.info(f"[TRANSCRIBE] Using audio file: {filename}, path: {audio_path}")
+            app.logger.warning("[TRANSCRIBE] %s", err)
+            return None, 0, make_json_error(err, 404)
+        filename = job.filename
+        audio_path = safe_join_uploads(job.storage_name)
+        app.logger.info("[TRANSCRIBE] Job %s using audio file: %s, path: %s", job.job_id, filename, audio_path)
         
         if not audio_path.exists():
-            app.logger.error(f"[TRANSCRIBE] Audio file not found: {filename}")
-            return make_json_error(f"音频文件 {filename} 不存在", 400)
+            app.logger.error("[TRANSCRIBE] Audio file not found: %s", filename)
+            return None, 0, make_json_error(f"音频文件 {filename} 不存在", 400)
 
         try:
             duration = get_audio_duration_seconds(audio_path)
-            app.logger.info(f"[TRANSCRIBE] Audio duration: {duration} seconds")
+            app.logger.info("[TRANSCRIBE] Audio duration: %s seconds", duration)
         except Exception as e:
-            app.logger.exception(f"[TRANSCRIBE] Failed to get audio duration for file: {audio_path}")
-            return make_json_error("读取音频失败", 500, {"detail": str(e)})
+            app.logger.exception("[TRANSCRIBE] Failed to get audio duration for file: %s", audio_path)
+            return None, 0, make_json_error("读取音频失败", 500, {"detail": str(e)})
 
         end_time = clamp_end_time_by_duration(start_time, end_time, duration)
         if end_time <= start_time:
-            app.logger.warning(f"[TRANSCRIBE] Invalid time range: start={start_time}, end={end_time}")
-            return make_json_error("结束时间必须大于开始时间", 400)
-        if segment_duration > (end_time - start_time):
-            app.logger.warning(f"[TRANSCRIBE] Segment duration larger than time range: {segment_duration} > {end_time - start_time}")
-            return make_json_error("分割单位时长不能超过(结束时间-开始时间)", 400)
+            app.logger.warning("[TRANSCRIBE] Invalid time range: start=%s, end=%s", start_time, end_time)
+            return None, 0, make_json_error("结束时间必须大于开始时间", 400)
+        if not auto_segment and segment_duration > (end_time - start_time):
+            app.logger.warning("[TRANSCRIBE] Segment duration larger than time range: %s > %s", segment_duration, end_time - start_time)
+            return None, 0, make_json_error("分割单位时长不能超过(结束时间-开始时间)", 400)
 
         # 段落边界
-        segment_length_s = int(segment_duration)
+        segment_length_s = SEGMENT_AUTO if auto_segment else int(segment_duration)
         start_s = int(start_time)
         end_s = int(end_time)
 
-        cache_dir = compute_cache_dir(start_s, end_s, segment_length_s)
-        estimated_segments = estimate_segments(start_s, end_s, segment_length_s)
-        
-        app.logger.info(f"[TRANSCRIBE] Cache directory: {cache_dir}, estimated segments: {estimated_segments}")
+        try:
+            content_hash = job.content_hash or get_content_hash(audio_path)
+        except Exception as e:
+            app.logger.exception("[TRANSCRIBE] Failed to hash audio file: %s", audio_path)
+            return None, 0, make_json_error("读取音频失败", 500, {"detail": str(e)})
 
-        # 依赖注入 ASR 客户端
-        asr_client = ASRClient(api_key=get_env_or_none("DASHSCOPE_API_KEY"))
-        asr_err = asr_client.ensure_ready()
+        if not auto_segment:
+            estimated_segments = len(plan_segments(start_s, end_s, segment_length_s))
+            app.logger.info("[TRANSCRIBE] Cache directory: %s, estimated segments: %s, segment_mode: %s", compute_cache_dir(content_hash), estimated_segments, segment_mode)
+
+        # 提前检查 ASR 配置，避免提交注定失败的转录
+        asr_backend = get_asr_client()
+        asr_err = asr_backend.ensure_ready()
         if asr_err:
-            app.logger.error(f"[TRANSCRIBE] ASR client not ready: {asr_err}")
-            return make_json_error(asr_err, 500)
-            
-        app.logger.info("[TRANSCRIBE] ASR client ready, starting stream generation")
-    except Exception as e:
-        app.logger.exception(f"[TRANSCRIBE] Unexpected error during parameter validation: {e}")
-        return make_json_error(f"参数验证失败: {e}", 500, {"detail": str(e)})
+            app.logger.error("[TRANSCRIBE] ASR client not ready: %s", asr_err)
+            return None, 0, make_json_error(asr_err, 500)
 
-    # 延迟导入分割工具（保持兼容现有模块）
-    try:
-        from audio_splitter import split_audio
-        app.logger.info("[TRANSCRIBE] Audio splitter module imported successfully")
+        # 断线重连时浏览器通过 Last-Event-ID 头回传最后收到的事件序号，也可用查询参数显式指定
+        raw_last_id = request.headers.get("Last-Event-ID") or request.args.get("last_event_id") or "0"
+        try:
+            last_event_id = max(0, int(raw_last_id))
+        except ValueError:
+            return None, 0, make_json_error("Last-Event-ID 必须为整数", 400)
     except Exception as e:
-        app.logger.exception(f"[TRANSCRIBE] Failed to import audio_splitter module: {e}")
-        return make_json_error("服务端缺少音频分割依赖", 500, {"detail": str(e)})
+        app.logger.exception("[TRANSCRIBE] Unexpected error during parameter validation: %s", e)
+        return None, 0, make_json_error(f"参数验证失败: {e}", 500, {"detail": str(e)})
+
+    # 同一音频内容 + 相同参数与 ASR 配置附着到已有转录（排队中、运行中或已完成，可来自其他任务），否则新建并入队
+    run = transcription_queue.submit(job.job_id, {
+        "filename": filename,
+        "audio_file": job.storage_name,
+        "content_hash": content_hash,
+        "start_time": start_s,
+        "end_time": end_s,
+        "segment_duration": segment_length_s,
+        "segment_mode": segment_mode,
+        # 切换 ASR 后端、模型、语言或定制化文本后不附着到旧结果
+        "asr_model": asr_backend.capabilities.model,
+        "asr_language": asr_language,
+        "asr_system_content": asr_system_content,
+    })
+    run_id = run["run_id"]
+    if run["subscribed"]:
+        sync_job_with_run(job, run)
+    app.logger.info("[TRANSCRIBE] Attached to run %s (status: %s, last_event_id: %s)", run_id, run['status'], last_event_id)
+    if run["status"] in RUN_FINISHED and not transcription_queue.read(run_id, last_event_id, limit=1):
+        # 已结束且客户端已收到全部事件：204 让 EventSource 停止自动重连
+        return None, 0, Response(status=204)
+    return run_id, last_event_id, None
 
-    @stream_with_context
-    def generate() -> Generator[str, None, None]:
-        app.logger.info(f"[TRANSCRIBE] Starting SSE stream generation - cache_dir: {cache_dir}, estimated_segments: {estimated_segments}")
-        try:
-            # 准备分片
-            if cache_dir.exists():
-                split_files = sorted(Path(cache_dir).glob("*.mp3"))
-                app.logger.info(f"[TRANSCRIBE] Found cached split files: {len(split_files)} files")
-            else:
-                split_files = []
-                app.logger.info("[TRANSCRIBE] No cached files found")
 
-            # 预先告知分片数量
-            if split_files:
-                yield sse_event({"type": "segments", "segments_count": len(split_files), "cached": True})
-                app.logger.info(f"[TRANSCRIBE] Using cached segments: {len(split_files)} files")
-            else:
-                yield sse_event({"type": "segments", "segments_count": estimated_segments, "cached": False})
-                yield sse_event({"type": "status", "message": "splitting"})
-                cache_dir.mkdir(parents=True, exist_ok=True)
-                app.logger.info(f"[TRANSCRIBE] Starting audio splitting - audio_path: {audio_path}, cache_dir: {cache_dir}, segment_length: {segment_length_s}, start: {start_s}, end: {end_s}")
-                try:
-                    # split_audio 接口保持不变
-                    results: List[str] = split_audio(
-                        str(audio_path),
-                        str(cache_dir),
-                        segment_length_s,
-                        start_s=start_s,
-                        end_s=end_s,
-                    )
-                    split_files = [Path(p) for p in results]
-                    app.logger.info(f"[TRANSCRIBE] Audio splitting completed: {len(split_files)} segments")
-                except Exception as e:
-                    app.logger.exception(f"[TRANSCRIBE] Audio splitting failed: {e}")
-                    yield sse_event({"type": "error", "message": f"音频分割失败: {e}"})
-                    yield sse_event({"type": "done"})
-                    return
-
-            total = max(1, len(split_files))
-            app.logger.info(f"[TRANSCRIBE] Starting transcription for {total} segments")
-            
-            # 转录
-            for idx, seg in enumerate(split_files):
-                app.logger.info(f"[TRANSCRIBE] Processing segment {idx + 1}/{total}: {seg}")
-                try:
-                    current_text = ""
-                    chunk_count = 0
-                    for text_chunk in asr_client.stream_transcribe_file(seg):
-                        current_text = text_chunk
-                        chunk_count += 1
-                        yield sse_event({
-                            "type": "partial",
-                            "timestamp": idx * segment_length_s + start_s,
-                            "text": current_text
-                        })
-                    app.logger.info(f"[TRANSCRIBE] Segment {idx + 1} transcription completed - chunks: {chunk_count}, final text length: {len(current_text)}")
-                    
-                    if current_text:
-                        yield sse_event({
-                            "type": "segment_done",
-                            "timestamp": idx * segment_length_s + start_s,
-                            "text": current_text
-                        })
-                except Exception as e:
-                    app.logger.exception(f"[TRANSCRIBE] Transcription failed for segment {idx + 1}: {seg}")
-                    yield sse_event({"type": "error", "message": f"分段 {idx+1} 转录出错: {e}"})
-                finally:
-                    percent = int((idx + 1) / total * 100)
-                    yield sse_event({"type": "progress", "percent": percent})
-                    app.logger.debug(f"[TRANSCRIBE] Progress: {percent}%")
-
-            yield sse_event({"type": "done"})
-            app.logger.info("[TRANSCRIBE] All transcription completed successfully")
-        except Exception as e:
-            app.logger.exception(f"[TRANSCRIBE] Global error in stream generation: {e}")
-            yield sse_event({"type": "error", "message": str(e)})
-            yield sse_event({"type": "done"})
+@app.route("/transcribe/stream")
+def transcribe_audio_stream():
+    run_id, last_event_id, error = prepare_transcription_stream()
+    if error is not None:
+        return error
 
-    headers = {
-        "Content-Type": Config.SSE_CONTENT_TYPE,
-        "Cache-Control": "no-cache",
-        "Connection": "keep-alive",
-        "X-Accel-Buffering": "no",
-    }
-    return Response(generate(), headers=headers)
+    @stream_with_context
+    def generate() -> Generator[str, None, None]:
+        # 只读取事件日志：客户端断开不会中断后台转录
+        seq = last_event_id
+        with ACTIVE_STREAMS.track():
+            while True:
+                rows = transcription_queue.read(run_id, seq)
+                for seq, payload in rows:
+                    yield sse_frame(payload, seq)
+                if rows:
+                    continue
+                run_state = transcription_queue.get(run_id)
+                if run_state is None or run_state["status"] in RUN_FINISHED:
+                    # 状态在最后一个事件写入之后才更新，再读一次确认没有遗漏
+                    if not transcription_queue.read(run_id, seq, limit=1):
+                        app.logger.info("[TRANSCRIBE] Stream for run %s finished at event %s", run_id, seq)
+                        return
+                    continue
+                if not transcription_queue.wait(run_id, seq, Config.SSE_KEEPALIVE_SECONDS):
+                    yield ": keepalive\n\n"
+
+    return Response(generate(), headers={**SSE_HEADERS, "Connection": "keep-alive"})
 
 
 if __name__ == "__main__":
-    global asr_language
-    asr_language = os.getenv("ASR_LANGUAGE", "")
-    global asr_system_content
-    asr_system_content = os.getenv("ASR_SYSTEM_CONTENT", "")
-    app.logger.info(f"ASR_LANGUAGE: {asr_language}")
-    app.logger.info(f"ASR_SYSTEM_CONTENT: {asr_system_content}")
+    app.logger.info("ASR_LANGUAGE: %s", asr_language)
+    app.logger.info("ASR_SYSTEM_CONTENT: %s", asr_system_content)
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        transcription_queue.start()
     app.run(debug=True)
\ No newline at end of file
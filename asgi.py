@@ -0,0 +1,182 @@
+"""ASGI 服务入口：SSE 转录流在事件循环中异步推送，不再为每条长连接占用一个线程。
+
+转录本身（ffmpeg 切分、ASR 调用）一直在 TranscriptionQueue 的固定工作线程中执行，
+SSE 连接只是事件日志的读者；这里把读者改为协程，新事件由队列回调唤醒，
+因此单个进程可以同时保持数百条打开的流。其余路由原样交给 Flask（经 WsgiToAsgi 转换）。
+
+运行：uvicorn asgi:application --host 0.0.0.0 --port 5000
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Dict, Optional, Set
+from urllib.parse import unquote
+
+try:
+    from asgiref.wsgi import WsgiToAsgi
+except ImportError as e:  # pragma: no cover - 依赖缺失时给出明确提示
+    raise ImportError("ASGI 模式需要 asgiref，请先执行: pip install -r requirements.txt") from e
+
+from app import (
+    Config,
+    RUN_FINISHED,
+    SSE_HEADERS,
+    app,
+    prepare_transcription_stream,
+    sse_frame,
+    transcription_queue,
+)
+from metrics import ACTIVE_STREAMS
+
+logger = logging.getLogger(__name__)
+
+STREAM_PATH = "/transcribe/stream"
+
+
+class RunNotifier:
+    # 把队列工作线程中的“事件/状态变化”转成事件循环中的 asyncio.Event 通知
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self._waiters: Dict[str, Set[asyncio.Event]] = {}
+
+    def subscribe(self, run_id: str) -> asyncio.Event:
+        event = asyncio.Event()
+        self._waiters.setdefault(run_id, set()).add(event)
+        return event
+
+    def unsubscribe(self, run_id: str, event: asyncio.Event) -> None:
+        waiters = self._waiters.get(run_id)
+        if waiters is not None:
+            waiters.discard(event)
+            if not waiters:
+                self._waiters.pop(run_id, None)
+
+    def notify(self, run_id: str) -> None:
+        # 在工作线程中调用；只有存在订阅者时才投递到事件循环
+        if run_id in self._waiters and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self._wake, run_id)
+
+    def _wake(self, run_id: str) -> None:
+        for event in self._waiters.get(run_id, ()):
+            event.set()
+
+
+_notifier: Optional[RunNotifier] = None
+
+
+def get_notifier() -> RunNotifier:
+    global _notifier
+    if _notifier is None:
+        _notifier = RunNotifier(asyncio.get_running_loop())
+        transcription_queue.add_listener(_notifier.notify)
+    return _notifier
+
+
+def _prepare(scope) -> tuple:
+    # 在线程中复用 Flask 的参数校验与提交逻辑（需要请求上下文）
+    headers = [(k.decode("latin-1"), v.decode("latin-1")) for k, v in scope.get("headers", [])]
+    with app.test_request_context(
+        unquote(scope.get("path", STREAM_PATH)),
+        query_string=scope.get("query_string", b""),
+        headers=headers,
+    ):
+        run_id, last_event_id, error = prepare_transcription_stream()
+        if error is not None:
+            resp = app.make_response(error)
+            return None, 0, (resp.status_code, list(resp.headers.items()), resp.get_data())
+        return run_id, last_event_id, None
+
+
+async def _send_response(send, status: int, headers, body: bytes) -> None:
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(k.lower().encode("latin-1"), str(v).encode("latin-1")) for k, v in headers],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def transcribe_stream(scope, receive, send) -> None:
+    notifier = get_notifier()
+    run_id, last_event_id, error = await asyncio.to_thread(_prepare, scope)
+    if error is not None:
+        await _send_response(send, *error)
+        return
+
+    waiter = notifier.subscribe(run_id)
+    disconnected = False
+
+    async def watch_disconnect() -> None:
+        nonlocal disconnected
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                disconnected = True
+                waiter.set()
+                return
+
+    watcher = asyncio.create_task(watch_disconnect())
+    ACTIVE_STREAMS.inc()
+    try:
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in SSE_HEADERS.items()],
+        })
+        # 只读取事件日志：客户端断开不会中断后台转录
+        seq = last_event_id
+        while not disconnected:
+            # 先清除通知再读取，读取期间写入的新事件会再次触发通知，不会漏掉
+            waiter.clear()
+            rows = await asyncio.to_thread(transcription_queue.read, run_id, seq)
+            if rows:
+                body = "".join(sse_frame(payload, event_seq) for event_seq, payload in rows)
+                seq = rows[-1][0]
+                await send({"type": "http.response.body", "body": body.encode("utf-8"), "more_body": True})
+                continue
+            run_state = await asyncio.to_thread(transcription_queue.get, run_id)
+            if run_state is None or run_state["status"] in RUN_FINISHED:
+                # 状态在最后一个事件写入之后才更新，再读一次确认没有遗漏
+                if not await asyncio.to_thread(transcription_queue.read, run_id, seq, 1):
+                    logger.info("[TRANSCRIBE] Async stream for run %s finished at event %s", run_id, seq)
+                    break
+                continue
+            try:
+                await asyncio.wait_for(waiter.wait(), Config.SSE_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                await send({"type": "http.response.body", "body": b": keepalive\n\n", "more_body": True})
+        if not disconnected:
+            await send({"type": "http.response.body", "body": b""})
+    finally:
+        ACTIVE_STREAMS.dec()
+        watcher.cancel()
+        notifier.unsubscribe(run_id, waiter)
+
+
+_flask_app = WsgiToAsgi(app)
+
+
+async def application(scope, receive, send) -> None:
+    if scope["type"] == "lifespan":
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                get_notifier()
+                await asyncio.to_thread(transcription_queue.start)
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+    if scope["type"] == "http" and scope["method"] == "GET" and scope["path"] == STREAM_PATH:
+        await transcribe_stream(scope, receive, send)
+        return
+    await _flask_app(scope, receive, send)
+
+
+if __name__ == "__main__":
+    try:
+        import uvicorn
+    except ImportError as e:
+        raise SystemExit("ASGI 模式需要 uvicorn，请先执行: pip install uvicorn asgiref") from e
+    uvicorn.run("asgi:application", host="0.0.0.0", port=5000)
@@ -0,0 +1,250 @@
+"""可插拔的 ASR 后端。
+
+所有后端提供相同的接口：stream_transcribe_file / stream_transcribe_bytes 逐步产出片段的累计文本，
+capabilities 描述其能力（单段最长时长、批大小、是否流式、是否为远程服务）。
+DashScope 后端即 app.ASRClient；本模块提供本地离线后端：片段在本机解码后交给推理引擎，
+短时间窗口内到达的多个片段合并为一次批量推理调用。
+"""
+from __future__ import annotations
+
+import bisect
+import hashlib
+import logging
+import queue
+import shutil
+import subprocess
+import threading
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from pathlib import Path
+from typing import Iterable, List, NamedTuple, Optional, Tuple, Union
+
+import numpy as np
+
+from asr_resilience import ASRTimeoutError
+
+logger = logging.getLogger(__name__)
+
+BACKEND_DASHSCOPE = "dashscope"
+BACKEND_FASTER_WHISPER = "faster-whisper"
+BACKEND_STUB = "stub"
+ASR_BACKENDS = (BACKEND_DASHSCOPE, BACKEND_FASTER_WHISPER, BACKEND_STUB)
+
+LOCAL_SAMPLE_RATE = 16000
+WHISPER_WINDOW_S = 30.0     # Whisper 单次解码的音频窗口
+
+
+class BackendCapabilities(NamedTuple):
+    name: str                   # 后端名称（ASR_BACKENDS 之一）
+    model: str                  # 写入转录缓存键，不同模型的结果互不复用
+    max_segment_s: float        # 单个片段允许的最长时长
+    batch_size: int = 1         # 一次推理调用最多处理的片段数
+    streaming: bool = True      # 转录过程中是否产出中间结果
+    remote: bool = True         # 远程服务：需要按 API Key 限速
+
+
+class ASRBackend(ABC):
+    capabilities: BackendCapabilities
+    api_key: Optional[str] = None
+
+    def ensure_ready(self) -> Optional[str]:
+        # 返回错误信息，可用时返回 None
+        return None
+
+    @abstractmethod
+    def stream_transcribe_file(self, segment_file: Path) -> Iterable[str]:
+        ...
+
+    @abstractmethod
+    def stream_transcribe_bytes(self, data: bytes, fmt: str = "mp3") -> Iterable[str]:
+        ...
+
+
+def decode_pcm(source: Union[Path, bytes], sample_rate: int = LOCAL_SAMPLE_RATE) -> np.ndarray:
+    # 把片段（文件路径或内存中的编码字节）解码为单声道 float32 PCM
+    if not shutil.which("ffmpeg"):
+        raise EnvironmentError("未找到 ffmpeg，请确认其已安装并在 PATH 中")
+    from_bytes = isinstance(source, (bytes, bytearray))
+    cmd = [
+        "ffmpeg", "-hide_banner", "-loglevel", "error",
+        "-i", "pipe:0" if from_bytes else str(source),
+        "-vn", "-ac", "1", "-ar", str(sample_rate),
+        "-f", "f32le", "pipe:1",
+    ]
+    res = subprocess.run(cmd, input=bytes(source) if from_bytes else None, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if res.returncode != 0:
+        raise RuntimeError(f"ffmpeg 解码失败: {res.stderr.decode('utf-8', 'replace').strip()}")
+    return np.frombuffer(res.stdout, dtype="<f4")
+
+
+# ========== 推理引擎 ==========
+class StubEngine:
+    """确定性的假引擎：文本只由音频时长与内容摘要决定，用于测试与无模型环境下的联调。"""
+
+    model = "stub"
+
+    def __init__(self, delay_s: float = 0.0):
+        self.delay_s = delay_s
+        self.batches: List[int] = []    # 每次调用的批大小
+
+    def transcribe_batch(self, audios: List[np.ndarray], language: Optional[str] = None) -> List[str]:
+        self.batches.append(len(audios))
+        if self.delay_s:
+            time.sleep(self.delay_s)
+        return [
+            f"[stub {len(a) / LOCAL_SAMPLE_RATE:.2f}s {hashlib.sha1(a.tobytes()).hexdigest()[:8]}]"
+            for a in audios
+        ]
+
+
+class FasterWhisperEngine:
+    """faster-whisper（CTranslate2）本地引擎。
+
+    一批片段按 30 秒窗口拼接为一条音频，以 clip_timestamps 标出各窗口，
+    由 BatchedInferencePipeline 一次批量解码，再按时间把结果归还给各片段。
+    """
+
+    def __init__(self, model_size: str = "small", device: str = "cpu", compute_type: str = "int8", batch_size: int = 8):
+        try:
+            from faster_whisper import BatchedInferencePipeline, WhisperModel
+        except ImportError as e:
+            raise ImportError("本地 ASR 后端需要 faster-whisper，请先执行: pip install faster-whisper") from e
+        self.model = f"faster-whisper:{model_size}"
+        self.batch_size = max(1, int(batch_size))
+        self._pipeline = BatchedInferencePipeline(model=WhisperModel(model_size, device=device, compute_type=compute_type))
+
+    def transcribe_batch(self, audios: List[np.ndarray], language: Optional[str] = None) -> List[str]:
+        clips = []
+        starts: List[float] = []
+        offset = 0.0
+        for audio in audios:
+            duration = len(audio) / LOCAL_SAMPLE_RATE
+            starts.append(offset)
+            t = 0.0
+            while t < duration:
+                end = min(duration, t + WHISPER_WINDOW_S)
+                clips.append({"start": offset + t, "end": offset + end})
+                t = end
+            offset += duration
+        if not clips:
+            return ["" for _ in audios]
+
+        segments, _ = self._pipeline.transcribe(
+            np.concatenate(audios),
+            language=language or None,
+            batch_size=self.batch_size,
+            clip_timestamps=clips,
+            without_timestamps=True,
+        )
+        texts: List[List[str]] = [[] for _ in audios]
+        for seg in segments:
+            owner = bisect.bisect_right(starts, (seg.start + seg.end) / 2) - 1
+            texts[max(0, owner)].append(seg.text)
+        return ["".join(parts).strip() for parts in texts]
+
+
+# ========== 本地批量后端 ==========
+class LocalBatchBackend(ASRBackend):
+    """本地离线后端：各 ASR 工作线程并行解码片段，推理请求在 window_s 内攒批后一次提交给引擎。
+
+    推理不产出中间结果，每个片段只产出一次最终文本。单个片段（含排队等待）超过
+    timeout_base_s + timeout_per_audio_s * 片段时长仍无结果时抛出 ASRTimeoutError。本地后端不经过重试层：
+    超时说明引擎已过载，立即重试只会继续排队；片段记为错误，重新提交任务时只重转未命中缓存的片段。
+    """
+
+    def __init__(self, engine, name: str, max_segment_s: float, batch_size: int = 8,
+                 window_s: float = 0.05, language: Optional[str] = None,
+                 timeout_base_s: float = 60.0, timeout_per_audio_s: float = 4.0):
+        self.engine = engine
+        self.language = language
+        self.window_s = window_s
+        self.timeout_base_s = timeout_base_s
+        self.timeout_per_audio_s = timeout_per_audio_s
+        self.capabilities = BackendCapabilities(
+            name, engine.model, max_segment_s, max(1, int(batch_size)), streaming=False, remote=False,
+        )
+        self._requests: "queue.Queue[Tuple[np.ndarray, Future]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def stream_transcribe_file(self, segment_file: Path) -> Iterable[str]:
+        return self._stream(lambda: decode_pcm(Path(segment_file)))
+
+    def stream_transcribe_bytes(self, data: bytes, fmt: str = "mp3") -> Iterable[str]:
+        return self._stream(lambda: decode_pcm(data))
+
+    def _stream(self, decode) -> Iterable[str]:
+        text = self.transcribe(decode())
+        if text:
+            yield text
+
+    def transcribe(self, audio: np.ndarray) -> str:
+        self._ensure_thread()
+        future: Future = Future()
+        self._requests.put((audio, future))
+        timeout = self.timeout_base_s + self.timeout_per_audio_s * len(audio) / LOCAL_SAMPLE_RATE
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            # 尚未进入推理的请求直接取消；已在推理中的批次结果丢弃
+            future.cancel()
+            raise ASRTimeoutError(f"本地推理超时（{timeout:.1f} 秒）")
+
+    def _ensure_thread(self) -> None:
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._batch_loop, name="local-asr-batcher", daemon=True)
+                self._thread.start()
+
+    def _batch_loop(self) -> None:
+        batch_size = self.capabilities.batch_size
+        while True:
+            batch = [self._requests.get()]
+            deadline = time.monotonic() + self.window_s
+            while len(batch) < batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._requests.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            # 跳过已超时取消的请求
+            batch = [(audio, future) for audio, future in batch if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            t0 = time.perf_counter()
+            try:
+                texts = self.engine.transcribe_batch([audio for audio, _ in batch], self.language)
+            except Exception as e:
+                logger.exception("[ASR] Local batch of %s segments failed", len(batch))
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            logger.info("[ASR] Local batch of %s segments transcribed in %.2fs", len(batch), time.perf_counter() - t0)
+            for (_, future), text in zip(batch, texts):
+                future.set_result(text)
+
+
+class BoundedBackend(ASRBackend):
+    """给任意后端加上全局并发上限：多个转录共用一个后端时，同时进行的 ASR 调用不超过 limit。"""
+
+    def __init__(self, backend: ASRBackend, limit: int):
+        self.backend = backend
+        self.api_key = backend.api_key
+        self.capabilities = backend.capabilities
+        self._slots = threading.BoundedSemaphore(max(1, int(limit)))
+
+    def ensure_ready(self) -> Optional[str]:
+        return self.backend.ensure_ready()
+
+    def stream_transcribe_file(self, segment_file: Path) -> Iterable[str]:
+        return self._bounded(lambda: self.backend.stream_transcribe_file(segment_file))
+
+    def stream_transcribe_bytes(self, data: bytes, fmt: str = "mp3") -> Iterable[str]:
+        return self._bounded(lambda: self.backend.stream_transcribe_bytes(data, fmt))
+
+    def _bounded(self, call) -> Iterable[str]:
+        with self._slots:
+            yield from call()
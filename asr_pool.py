@@ -0,0 +1,125 @@
+"""并发 ASR 工作池：有界并发 + 按 key 限速 + 乱序结果重排。"""
+from __future__ import annotations
+
+import contextvars
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional
+
+from log_setup import log_context
+
+
+class SegmentEvent(NamedTuple):
+    index: int                      # 片段序号（从 0 开始）
+    kind: str                       # "partial" | "done" | "error" | "skipped"
+    text: str = ""                  # partial/done 时为该片段当前累计文本
+    error: Optional[BaseException] = None
+
+
+class KeyedRateLimiter:
+    """按 key（如 API Key）划分的令牌桶，多个请求共用同一 key 时共享配额。"""
+
+    def __init__(self, rate_per_s: float, burst: Optional[int] = None):
+        self.rate_per_s = float(rate_per_s)
+        self.burst = float(burst if burst is not None else max(1, int(rate_per_s)))
+        self._buckets: Dict[str, List[float]] = {}  # key -> [tokens, last_refill]
+        self._lock = threading.Lock()
+
+    def acquire(self, key: str, stop: Optional[threading.Event] = None) -> bool:
+        # 阻塞直到拿到令牌；rate_per_s <= 0 表示不限速。stop 被置位时放弃并返回 False
+        if self.rate_per_s <= 0:
+            return True
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                bucket = self._buckets.setdefault(key, [self.burst, now])
+                bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate_per_s)
+                bucket[1] = now
+                if bucket[0] >= 1.0:
+                    bucket[0] -= 1.0
+                    return True
+                wait = (1.0 - bucket[0]) / self.rate_per_s
+            if stop is not None:
+                if stop.wait(wait):
+                    return False
+            else:
+                time.sleep(wait)
+
+
+class ReorderBuffer:
+    """把各片段乱序到达的事件整理成按片段序号输出。
+
+    当前片段（head）的事件直接放行；后续片段的事件先缓存，待前面的片段结束后再补发，
+    补发时同一片段连续的 partial 只保留最后一条（partial 为累计文本）。
+    """
+
+    def __init__(self, first_index: int = 0):
+        self.next_index = first_index
+        self._pending: Dict[int, List[SegmentEvent]] = {}
+
+    def push(self, event: SegmentEvent) -> List[SegmentEvent]:
+        if event.index != self.next_index:
+            self._pending.setdefault(event.index, []).append(event)
+            return []
+        released = [event]
+        if event.kind != "partial":
+            self._advance(released)
+        return released
+
+    def _advance(self, released: List[SegmentEvent]) -> None:
+        self.next_index += 1
+        while self.next_index in self._pending:
+            events = self._pending.pop(self.next_index)
+            finished = False
+            for i, ev in enumerate(events):
+                if ev.kind == "partial" and i + 1 < len(events) and events[i + 1].kind == "partial":
+                    continue
+                released.append(ev)
+                finished = finished or ev.kind != "partial"
+            if not finished:
+                return
+            self.next_index += 1
+
+
+class ASRWorkerPool:
+    """最多 max_workers 个片段同时转录，事件统一写入 sink 队列（SegmentEvent）。"""
+
+    def __init__(
+        self,
+        transcribe: Callable[..., Iterable[str]],
+        sink: "queue.Queue",
+        max_workers: int = 4,
+        rate_limiter: Optional[KeyedRateLimiter] = None,
+        rate_key: str = "default",
+    ):
+        self._transcribe = transcribe
+        self._sink = sink
+        self._rate_limiter = rate_limiter
+        self._rate_key = rate_key
+        self._stop = threading.Event()
+        self._executor = ThreadPoolExecutor(max_workers=max(1, int(max_workers)), thread_name_prefix="asr-worker")
+
+    def submit(self, index: int, *args) -> None:
+        # 工作线程继承提交方的日志上下文（job_id / run_id），并附加片段序号
+        self._executor.submit(contextvars.copy_context().run, self._run, index, args)
+
+    def shutdown(self, wait: bool = False) -> None:
+        # 客户端断开等情况下取消排队中的片段，并让进行中的片段尽快停止
+        self._stop.set()
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+    def _run(self, index: int, args: tuple) -> None:
+        with log_context(segment=index + 1):
+            if self._rate_limiter is not None and not self._rate_limiter.acquire(self._rate_key, self._stop):
+                return
+            text = ""
+            try:
+                for text in self._transcribe(*args):
+                    if self._stop.is_set():
+                        return
+                    self._sink.put(SegmentEvent(index, "partial", text))
+                self._sink.put(SegmentEvent(index, "done", text))
+            except Exception as e:
+                self._sink.put(SegmentEvent(index, "error", text, e))
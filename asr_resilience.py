@@ -0,0 +1,172 @@
+"""ASR 调用的容错层：可重试错误的指数退避重试（带抖动）、单片段截止时间、熔断器。
+
+ASR 是流式调用：重试会从头重新产出累计文本，下游按公共前缀计算增量，文本回退也能正确处理。
+"""
+from __future__ import annotations
+
+import logging
+import random
+import threading
+import time
+from http import HTTPStatus
+from typing import Callable, Iterable, Iterator, NamedTuple, Optional
+
+from metrics import ASR_RETRIES_TOTAL
+
+logger = logging.getLogger(__name__)
+
+# 可重试的 HTTP 状态码与 DashScope 错误码
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+RETRYABLE_CODES = {"InternalError", "ServiceUnavailable", "RequestTimeOut", "SystemError"}
+
+BREAKER_CLOSED = "closed"
+BREAKER_OPEN = "open"
+BREAKER_HALF_OPEN = "half_open"
+
+
+class ASRCallError(RuntimeError):
+    # ASR 服务返回的错误（非 200 的响应或流中的错误 chunk）
+    def __init__(self, message: str, status_code: Optional[int] = None, code: Optional[str] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.code = code
+
+    @property
+    def retryable(self) -> bool:
+        if self.status_code in RETRYABLE_STATUS:
+            return True
+        code = self.code or ""
+        return code.startswith("Throttling") or code in RETRYABLE_CODES
+
+
+class ASRTimeoutError(ASRCallError):
+    # 超过单个片段的截止时间
+    def __init__(self, message: str):
+        super().__init__(message, HTTPStatus.GATEWAY_TIMEOUT, "SegmentDeadlineExceeded")
+
+    @property
+    def retryable(self) -> bool:
+        return False
+
+
+class CircuitOpenError(ASRCallError):
+    # 熔断器打开期间快速失败，不再调用 ASR
+    def __init__(self, message: str):
+        super().__init__(message, HTTPStatus.SERVICE_UNAVAILABLE, "CircuitOpen")
+
+    @property
+    def retryable(self) -> bool:
+        return False
+
+
+def is_retryable(exc: BaseException) -> bool:
+    if isinstance(exc, ASRCallError):
+        return exc.retryable
+    # 连接/读超时等网络错误（requests 的异常同样继承自 OSError），本地文件错误除外
+    return isinstance(exc, OSError) and not isinstance(exc, (FileNotFoundError, PermissionError, IsADirectoryError))
+
+
+class RetryPolicy(NamedTuple):
+    max_retries: int = 3        # 首次调用之外最多重试的次数
+    base_s: float = 0.5         # 第 n 次重试的退避上限为 base_s * 2^n
+    max_s: float = 8.0          # 单次退避的上限
+
+    def backoff(self, attempt: int, rng: random.Random) -> float:
+        # 全抖动（full jitter）：在 [0, min(max_s, base_s * 2^attempt)] 内均匀取值，避免多个片段同时重试
+        return rng.uniform(0.0, min(self.max_s, self.base_s * (2 ** attempt)))
+
+
+class CircuitBreaker:
+    """连续失败达到阈值后打开，冷却期内的调用直接失败；冷却结束后放行一次试探调用（半开），
+    成功则关闭，失败则重新打开。被放弃的试探调用不会让熔断器卡在半开状态：每次放行都重新计时。"""
+
+    def __init__(self, threshold: int = 5, cooldown_s: float = 30.0, clock: Callable[[], float] = time.monotonic):
+        self.threshold = max(1, int(threshold))
+        self.cooldown_s = float(cooldown_s)
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return BREAKER_CLOSED
+            if self._clock() - self._opened_at >= self.cooldown_s:
+                return BREAKER_HALF_OPEN
+            return BREAKER_OPEN
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            now = self._clock()
+            if now - self._opened_at < self.cooldown_s:
+                return False
+            # 半开：放行本次调用，其余调用等到下一个冷却期结束
+            self._opened_at = now
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._opened_at is not None or self._failures >= self.threshold:
+                if self._opened_at is None:
+                    logger.warning("[ASR] Circuit breaker opened after %s consecutive failures", self._failures)
+                self._opened_at = self._clock()
+
+
+def resilient_stream(
+    attempt: Callable[[float], Iterable[str]],
+    label: str,
+    policy: RetryPolicy = RetryPolicy(),
+    breaker: Optional[CircuitBreaker] = None,
+    timeout_s: Optional[float] = None,
+    sleep: Callable[[float], None] = time.sleep,
+    rng: Optional[random.Random] = None,
+) -> Iterator[str]:
+    # attempt(remaining_s) 发起一次流式调用；remaining_s 为距截止时间的剩余秒数（无截止时间时为 None），
+    # 可用作底层请求的超时。可重试的错误按策略退避后重试，超过截止时间抛出 ASRTimeoutError。
+    rng = rng or random.Random()
+    deadline = time.monotonic() + timeout_s if timeout_s else None
+    retries = 0
+    while True:
+        if breaker is not None and not breaker.allow():
+            raise CircuitOpenError(f"ASR 服务暂不可用（熔断中），片段 {label} 未提交")
+        remaining = None
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise ASRTimeoutError(f"片段 {label} 转录超时（{timeout_s:g} 秒）")
+        try:
+            for text in attempt(remaining):
+                if deadline is not None and time.monotonic() > deadline:
+                    raise ASRTimeoutError(f"片段 {label} 转录超时（{timeout_s:g} 秒）")
+                yield text
+        except Exception as e:
+            retryable = is_retryable(e)
+            if breaker is not None:
+                # 服务已正常应答的错误（如参数错误）不计入熔断
+                if retryable or isinstance(e, ASRTimeoutError):
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+            if not retryable or retries >= policy.max_retries:
+                raise
+            delay = policy.backoff(retries, rng)
+            if deadline is not None and time.monotonic() + delay >= deadline:
+                raise
+            retries += 1
+            ASR_RETRIES_TOTAL.inc()
+            logger.warning("[ASR] Retryable error for %s (%s), retry %s/%s in %.2fs", label, e, retries, policy.max_retries, delay)
+            sleep(delay)
+            continue
+        if breaker is not None:
+            breaker.record_success()
+        return
@@ -0,0 +1,128 @@
+"""音频元数据探测：基于 ffprobe（WAV 可直接解析文件头），按文件路径 + 大小 + 修改时间缓存结果。
+
+只读取容器/流头信息，不解码音频数据，供 app 与 audio_splitter 共用。
+"""
+from __future__ import annotations
+
+import json
+import os
+import shutil
+import subprocess
+import threading
+import wave
+from collections import OrderedDict
+from typing import NamedTuple, Optional, Tuple
+
+from metrics import STAGE_SECONDS
+
+PROBE_CACHE_SIZE = 256
+
+
+class AudioMetadata(NamedTuple):
+    duration_ms: int
+    sample_rate: Optional[int]
+    channels: Optional[int]
+    codec: Optional[str]
+    format_name: Optional[str]
+    bit_rate: Optional[int]
+
+    @property
+    def duration_s(self) -> float:
+        return self.duration_ms / 1000.0
+
+    def to_dict(self) -> dict:
+        return {
+            "duration_ms": self.duration_ms,
+            "sample_rate": self.sample_rate,
+            "channels": self.channels,
+            "codec": self.codec,
+            "format": self.format_name,
+            "bit_rate": self.bit_rate,
+        }
+
+
+_probe_cache: "OrderedDict[Tuple[str, int, int], AudioMetadata]" = OrderedDict()
+_probe_lock = threading.Lock()
+
+
+def _int_or_none(value) -> Optional[int]:
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def _probe_ffprobe(path: str) -> AudioMetadata:
+    cmd = [
+        "ffprobe", "-v", "error",
+        "-select_streams", "a:0",
+        "-show_entries", "format=duration,format_name,bit_rate:stream=codec_name,sample_rate,channels,duration",
+        "-of", "json",
+        path,
+    ]
+    res = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    if res.returncode != 0:
+        raise RuntimeError(f"无法获取音频时长: {res.stderr.strip()}")
+    try:
+        info = json.loads(res.stdout or "{}")
+    except ValueError:
+        raise RuntimeError(f"ffprobe 返回的结果非法: {res.stdout!r}")
+
+    fmt = info.get("format") or {}
+    streams = info.get("streams") or []
+    stream = streams[0] if streams else {}
+    # 部分容器（如裸 AAC）format 中没有时长，退回到流时长
+    duration = fmt.get("duration") or stream.get("duration")
+    try:
+        duration_ms = round(float(duration) * 1000)
+    except (TypeError, ValueError):
+        raise RuntimeError(f"ffprobe 返回的时长非法: {duration!r}")
+    return AudioMetadata(
+        duration_ms=duration_ms,
+        sample_rate=_int_or_none(stream.get("sample_rate")),
+        channels=_int_or_none(stream.get("channels")),
+        codec=stream.get("codec_name"),
+        format_name=fmt.get("format_name"),
+        bit_rate=_int_or_none(fmt.get("bit_rate")),
+    )
+
+
+def _probe_wav_header(path: str) -> AudioMetadata:
+    with wave.open(path, "rb") as w:
+        rate = w.getframerate()
+        channels = w.getnchannels()
+        sampwidth = w.getsampwidth()
+        frames = w.getnframes()
+    return AudioMetadata(
+        duration_ms=round(frames * 1000 / rate) if rate else 0,
+        sample_rate=rate,
+        channels=channels,
+        codec=f"pcm_s{sampwidth * 8}le",
+        format_name="wav",
+        bit_rate=rate * channels * sampwidth * 8,
+    )
+
+
+def probe_audio(path) -> AudioMetadata:
+    path = os.path.normpath(str(path))
+    st = os.stat(path)
+    key = (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+    with _probe_lock:
+        cached = _probe_cache.get(key)
+        if cached is not None:
+            _probe_cache.move_to_end(key)
+            return cached
+
+    if shutil.which("ffprobe"):
+        with STAGE_SECONDS.time(stage="probe"):
+            meta = _probe_ffprobe(path)
+    elif path.lower().endswith(".wav"):
+        meta = _probe_wav_header(path)
+    else:
+        raise EnvironmentError("未找到 ffprobe，请确认其已安装并在 PATH 中")
+
+    with _probe_lock:
+        _probe_cache[key] = meta
+        while len(_probe_cache) > PROBE_CACHE_SIZE:
+            _probe_cache.popitem(last=False)
+    return meta
@@ -1,27 +1,142 @@
 import os
+import csv
 import math
 import subprocess
 import shutil  # 添加缺失的 shutil 导入
+import time
+from typing import Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+from audio_meta import probe_audio
+from metrics import STAGE_SECONDS
+
+# 内存编码路径：解码为 16kHz 单声道 PCM 后逐段编码
+ENCODE_SAMPLE_RATE = 16000
+PCM_READ_BYTES = 1024 * 1024
+
+
+class EncodingProfile(NamedTuple):
+    name: str                           # 写入分片文件名，不同编码的片段互不复用
+    codec: str                          # ffmpeg 编码器
+    fmt: str                            # 容器格式，同时作为文件扩展名与提交 ASR 时的音频格式
+    bitrate_k: int
+    sample_rate: Optional[int] = None   # 为 None 时保持源采样率
+    channels: Optional[int] = None      # 为 None 时保持源声道数
+
+    @property
+    def bytes_per_second(self) -> float:
+        return self.bitrate_k * 1000 / 8
+
+    def ffmpeg_args(self) -> List[str]:
+        args = ["-c:a", self.codec, "-b:a", f"{self.bitrate_k}k"]
+        if self.sample_rate:
+            args += ["-ar", str(self.sample_rate)]
+        if self.channels:
+            args += ["-ac", str(self.channels)]
+        return args
+
+    def to_dict(self) -> Dict:
+        return {
+            "profile": self.name,
+            "codec": self.codec,
+            "format": self.fmt,
+            "bitrate_kbps": self.bitrate_k,
+            "sample_rate": self.sample_rate,
+            "channels": self.channels,
+        }
+
+
+# 默认沿用历史的 32kbps MP3（保持源采样率与声道）；其余为 ASR 原生的 16kHz 单声道
+PROFILE_MP3_32K = EncodingProfile("mp3_32k", "libmp3lame", "mp3", 32)
+PROFILE_MP3_MONO = EncodingProfile("mp3_24k_mono16k", "libmp3lame", "mp3", 24, ENCODE_SAMPLE_RATE, 1)
+PROFILE_OPUS_MONO = EncodingProfile("opus_16k_mono16k", "libopus", "ogg", 16, ENCODE_SAMPLE_RATE, 1)
+ENCODING_PROFILES = {p.name: p for p in (PROFILE_MP3_32K, PROFILE_MP3_MONO, PROFILE_OPUS_MONO)}
+SEGMENT_EXTENSIONS = tuple(sorted({p.fmt for p in ENCODING_PROFILES.values()}))
 
 
 def _ffprobe_duration(input_file: str) -> float:
-    # 用 ffprobe 获取时长（秒，float）
-    cmd = [
-        "ffprobe", "-v", "error",
-        "-show_entries", "format=duration",
-        "-of", "default=nw=1:nk=1",
-        input_file
+    # 用 ffprobe 获取时长（秒，float），结果按文件缓存，与 app 共用
+    return probe_audio(input_file).duration_s
+
+
+def _segment_cmd(input_file: str, output_pattern: str, start: float, duration: float, segment_len: float,
+                 cut_times: Sequence[float] = (), profile: EncodingProfile = PROFILE_MP3_32K) -> list:
+    # 单次 ffmpeg 调用：-ss/-t 放在 -i 之前做输入定位，只解码所选区间一次，
+    # 由 segment 复用器按 segment_len（或给定的切点 cut_times，相对区间起点）切分并按 profile 编码输出。
+    # 每写完一个片段，segment 复用器会向 stdout 输出一行 "文件名,开始,结束"。
+    if cut_times:
+        split_args = ["-segment_times", ",".join(f"{t:.6f}" for t in cut_times)]
+    else:
+        split_args = ["-segment_time", f"{segment_len:.6f}"]
+    return [
+        "ffmpeg", "-y",
+        "-hide_banner", "-loglevel", "error",
+        "-ss", f"{start:.6f}",
+        "-t", f"{duration:.6f}",
+        "-i", input_file,
+        "-vn",
+        *profile.ffmpeg_args(),
+        "-f", "segment",
+        "-segment_format", profile.fmt,
+        *split_args,
+        "-segment_start_number", "1",
+        "-reset_timestamps", "1",
+        "-segment_list", "pipe:1",
+        "-segment_list_type", "csv",
+        output_pattern,
     ]
-    res = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-    if res.returncode != 0:
-        raise RuntimeError(f"无法获取音频时长: {res.stderr.strip()}")
+
+
+class SplitSegment(NamedTuple):
+    index: int          # 从 0 开始的片段序号
+    path: str           # 片段文件路径
+    start_s: float      # 片段在原音频中的起始时间（秒）
+    duration_s: float   # 片段时长（秒）
+    data: Optional[bytes] = None  # 内存编码时为编码后的字节，此时 path 为空
+
+
+def _check_binaries() -> None:
+    # 确认 ffmpeg/ffprobe 可用
+    for bin_name in ("ffmpeg", "ffprobe"):
+        if not shutil.which(bin_name):
+            raise EnvironmentError(f"未找到 {bin_name}，请确认其已安装并在 PATH 中")
+
+
+def _iter_segment_files(cmd: list, output_dir: str, expected: int) -> Iterator[str]:
+    # 运行 segment 复用器，每写完一个文件就产出其路径
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    written = 0
     try:
-        return float(res.stdout.strip())
-    except ValueError:
-        raise RuntimeError(f"ffprobe 返回的时长非法: {res.stdout!r}")
+        # segment 复用器在片段写完（文件已关闭）后才输出对应的行
+        t0 = time.perf_counter()
+        for row in csv.reader(iter(proc.stdout.readline, "")):
+            name = row[0].strip() if row else ""
+            if not name:
+                continue
+            written += 1
+            # 只统计等待 ffmpeg 的时间，不含调用方处理片段的时间
+            STAGE_SECONDS.observe(time.perf_counter() - t0, stage="split")
+            yield os.path.join(output_dir, os.path.basename(name))
+            t0 = time.perf_counter()
 
+        _, stderr = proc.communicate()
+        if proc.returncode != 0:
+            raise RuntimeError(f"ffmpeg 转换失败（已完成 {written}/{expected} 个片段）: {stderr.strip()}")
+    finally:
+        # 调用方提前停止迭代（如客户端断开）时终止 ffmpeg
+        if proc.poll() is None:
+            proc.kill()
+            proc.communicate()
 
-def split_audio(input_file, output_dir, segment_s=60, start_s=0, end_s=None):
+
+def _output_pattern(input_file: str, output_dir: str, ext: str = "mp3") -> str:
+    base_name = os.path.splitext(os.path.basename(input_file))[0]
+    # 输出文件名沿用 {base_name}_{序号:03d}.{ext}；文件名中的 % 需转义以免被当作模板
+    return os.path.join(output_dir, base_name.replace("%", "%%") + f"_%03d.{ext}")
+
+
+def iter_split_audio(input_file, output_dir, segment_s=60, start_s=0, end_s=None,
+                     profile: EncodingProfile = PROFILE_MP3_32K) -> Iterator[SplitSegment]:
+    # 与 split_audio 参数一致，但每写完一个片段立即产出，便于边切边转录
     # 规范化路径
     input_file = os.path.normpath(input_file)
     output_dir = os.path.normpath(output_dir)
@@ -29,10 +144,7 @@ def split_audio(input_file, output_dir, segment_s=60, start_s=0, end_s=None):
     if not os.path.exists(output_dir):
         os.makedirs(output_dir, exist_ok=True)
 
-    # 确认 ffmpeg/ffprobe 可用
-    for bin_name in ("ffmpeg", "ffprobe"):
-        if not shutil.which(bin_name):
-            raise EnvironmentError(f"未找到 {bin_name}，请确认其已安装并在 PATH 中")
+    _check_binaries()
 
     # 获取整体时长
     total_duration = _ffprobe_duration(input_file)
@@ -49,40 +161,121 @@ def split_audio(input_file, output_dir, segment_s=60, start_s=0, end_s=None):
     trimmed_duration = end - start
     num_segments = max(1, math.ceil(trimmed_duration / segment_len))
 
-    base_name = os.path.splitext(os.path.basename(input_file))[0]
-    exported_files = []
+    print(f"检测到 ffmpeg，将使用 {profile.name} 格式输出")
 
-    print("检测到 ffmpeg，将使用 32kbps MP3 格式输出")
+    cmd = _segment_cmd(
+        input_file, _output_pattern(input_file, output_dir, profile.fmt), start, trimmed_duration, segment_len,
+        profile=profile,
+    )
+    files = _iter_segment_files(cmd, output_dir, num_segments)
+    try:
+        for index, out_mp3 in enumerate(files):
+            seg_start = start + index * segment_len
+            seg_duration = min(segment_len, end - seg_start)
+            print(f"已导出片段 {index + 1}/{num_segments}: {out_mp3}")
+            yield SplitSegment(index, out_mp3, seg_start, seg_duration)
+    finally:
+        files.close()
 
-    for i in range(num_segments):
-        seg_start = start + i * segment_len
-        seg_duration = min(segment_len, end - seg_start)
-        if seg_duration <= 0:
-            break
 
-        out_mp3 = os.path.join(output_dir, f"{base_name}_{i+1:03d}.mp3")
+def iter_split_audio_at(input_file, output_dir, bounds: List[Tuple[float, float]],
+                        profile: EncodingProfile = PROFILE_MP3_32K) -> Iterator[SplitSegment]:
+    # 按给定的 (起点, 时长) 列表切分（如静音感知的分段规划），片段之间可以有间隔（被去掉的静音）。
+    # 仍只调用一次 ffmpeg：所有片段边界作为切点，落在间隔上的文件直接删除；产出的 index 为 bounds 中的序号。
+    input_file = os.path.normpath(input_file)
+    output_dir = os.path.normpath(output_dir)
+    os.makedirs(output_dir, exist_ok=True)
+    _check_binaries()
+    if not bounds:
+        return
 
-        # 使用 ffmpeg 精确裁剪（-ss/-t 放在 -i 之后更精确），并转为 32kbps MP3
-        cmd = [
-            "ffmpeg", "-y",
-            "-hide_banner", "-loglevel", "error",
-            "-i", input_file,
-            "-ss", f"{seg_start:.6f}",
-            "-t", f"{seg_duration:.6f}",
-            "-vn",
-            "-c:a", "libmp3lame",
-            "-b:a", "32k",
-            out_mp3
-        ]
+    start = bounds[0][0]
+    end = bounds[-1][0] + bounds[-1][1]
+    # 切点（毫秒精度去重），以及每个输出文件对应的 bounds 序号（间隔为 None）
+    points = sorted({round(t, 3) for st, du in bounds for t in (st, st + du)})
+    starts = {round(st, 3): i for i, (st, _) in enumerate(bounds)}
+    owners = [starts.get(p) for p in points[:-1]]
+    cut_times = [p - start for p in points[1:-1]]
 
-        res = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-        if res.returncode != 0:
-            raise RuntimeError(f"ffmpeg 转换失败（片段 {i+1}/{num_segments}）: {res.stderr.strip()}")
+    cmd = _segment_cmd(
+        input_file, _output_pattern(input_file, output_dir, profile.fmt), start, end - start, 0, cut_times, profile,
+    )
+    files = _iter_segment_files(cmd, output_dir, len(bounds))
+    try:
+        for piece, out_mp3 in enumerate(files):
+            index = owners[piece] if piece < len(owners) else None
+            if index is None:
+                os.remove(out_mp3)
+                continue
+            yield SplitSegment(index, out_mp3, *bounds[index])
+    finally:
+        files.close()
 
-        exported_files.append(out_mp3)
-        print(f"已导出片段 {i+1}/{num_segments}: {out_mp3}")
 
-    return exported_files
+def _encode_segment(pcm: bytes, sample_rate: int, profile: EncodingProfile = PROFILE_MP3_32K) -> bytes:
+    # PCM 经管道送入 ffmpeg，编码结果从管道读回，全程不落盘
+    cmd = [
+        "ffmpeg", "-hide_banner", "-loglevel", "error",
+        "-f", "s16le", "-ar", str(sample_rate), "-ac", "1", "-i", "pipe:0",
+        *profile.ffmpeg_args(), "-f", profile.fmt, "pipe:1",
+    ]
+    with STAGE_SECONDS.time(stage="encode"):
+        res = subprocess.run(cmd, input=pcm, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if res.returncode != 0:
+        raise RuntimeError(f"ffmpeg 编码失败: {res.stderr.decode('utf-8', 'replace').strip()}")
+    return res.stdout
+
+
+def iter_encode_audio_at(input_file, bounds: List[Tuple[float, float]], sample_rate: int = ENCODE_SAMPLE_RATE,
+                         profile: EncodingProfile = PROFILE_MP3_32K) -> Iterator[SplitSegment]:
+    # 与 iter_split_audio_at 相同的切分方式，但不写文件：整个区间只解码一次为 PCM，
+    # 按 bounds 截取后逐段在内存中按 profile 编码（SplitSegment.data），内存中最多保留一个片段的 PCM。
+    input_file = os.path.normpath(input_file)
+    _check_binaries()
+    if not bounds:
+        return
+
+    start = bounds[0][0]
+    end = bounds[-1][0] + bounds[-1][1]
+    cmd = [
+        "ffmpeg", "-hide_banner", "-loglevel", "error",
+        "-ss", f"{start:.6f}", "-t", f"{end - start:.6f}",
+        "-i", input_file,
+        "-vn", "-ac", "1", "-ar", str(sample_rate),
+        "-f", "s16le", "pipe:1",
+    ]
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    buf = bytearray()
+    pos = 0  # buf[0] 对应的样本序号（相对区间起点）
+    try:
+        for index, (seg_start, seg_duration) in enumerate(bounds):
+            a = round((seg_start - start) * sample_rate)
+            b = round((seg_start + seg_duration - start) * sample_rate)
+            while pos + len(buf) // 2 < b:
+                chunk = proc.stdout.read(PCM_READ_BYTES)
+                if not chunk:
+                    break
+                buf += chunk
+            pcm = bytes(buf[(a - pos) * 2:(b - pos) * 2])
+            # 片段之间的间隔（被去掉的静音）连同已编码部分一起丢弃
+            consumed = min(len(buf) // 2, b - pos)
+            del buf[:consumed * 2]
+            pos += consumed
+            if not pcm:
+                break
+            yield SplitSegment(index, "", seg_start, seg_duration, _encode_segment(pcm, sample_rate, profile))
+
+        _, stderr = proc.communicate()
+        if proc.returncode != 0:
+            raise RuntimeError(f"ffmpeg 解码失败: {stderr.decode('utf-8', 'replace').strip()}")
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+            proc.communicate()
+
+
+def split_audio(input_file, output_dir, segment_s=60, start_s=0, end_s=None):
+    return [seg.path for seg in iter_split_audio(input_file, output_dir, segment_s, start_s, end_s)]
 
 
 if __name__ == "__main__":
@@ -93,4 +286,4 @@ if __name__ == "__main__":
     segments = split_audio(input_audio, output_directory, segment_s=30, start_s=0, end_s=120)
     print("生成的片段:")
     for p in segments:
-        print(p)
\ No newline at end of file
+        print(p)
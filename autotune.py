@@ -0,0 +1,191 @@
+"""自动选择分段时长与片段编码。
+
+- 分段时长：ASR 单次调用延迟按 overhead_s + per_audio_s * 片段时长建模，参数由最近的成功调用在线拟合；
+  在候选时长中模拟“N 个片段分配给并发工作线程（受限速约束）”的总耗时，取最短者。
+  候选时长取固定的几档，不同区间、不同时刻的自动选择大多落在同一绝对网格上，仍可复用已有片段。
+- 片段编码：在本机 ffmpeg 可用的编码中实测编码速度，按“编码耗时 + 上传耗时”（每秒音频）最小选择。
+"""
+from __future__ import annotations
+
+import heapq
+import logging
+import shutil
+import subprocess
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+from audio_splitter import PROFILE_MP3_32K, EncodingProfile
+from segment_cache import plan_segments
+
+logger = logging.getLogger(__name__)
+
+# segment_duration 取此值时自动选择分段时长
+SEGMENT_AUTO = "auto"
+SEGMENT_CANDIDATES = (15, 30, 45, 60, 90, 120, 150, 180)
+CALIBRATION_SECONDS = 20.0       # 编码速度实测所用的合成音频时长
+
+
+# ========== 分段时长 ==========
+class LatencyModel:
+    """ASR 单次调用延迟 ≈ overhead_s + per_audio_s * 片段时长，用最近 window 次成功调用拟合。
+
+    样本不足时使用先验；样本时长几乎相同（固定分段）时无法区分两项，按先验比例缩放到实测均值。
+    """
+
+    def __init__(self, overhead_s: float = 1.0, per_audio_s: float = 0.05, window: int = 200, min_samples: int = 5):
+        self.prior = (max(0.0, overhead_s), max(0.0, per_audio_s))
+        self.min_samples = max(1, int(min_samples))
+        self._samples: Deque[Tuple[float, float]] = deque(maxlen=max(1, int(window)))
+        self._lock = threading.Lock()
+
+    def observe(self, duration_s: float, latency_s: float) -> None:
+        if duration_s > 0 and latency_s >= 0:
+            with self._lock:
+                self._samples.append((float(duration_s), float(latency_s)))
+
+    def estimate(self) -> Tuple[float, float, int]:
+        # 返回 (overhead_s, per_audio_s, 样本数)
+        with self._lock:
+            samples = list(self._samples)
+        a0, b0 = self.prior
+        n = len(samples)
+        if n < self.min_samples:
+            return a0, b0, n
+        mean_d = sum(d for d, _ in samples) / n
+        mean_l = sum(lat for _, lat in samples) / n
+        var_d = sum((d - mean_d) ** 2 for d, _ in samples) / n
+        if var_d >= 1.0:
+            b = sum((d - mean_d) * (lat - mean_l) for d, lat in samples) / n / var_d
+            a = mean_l - b * mean_d
+            if a >= 0 and b >= 0:
+                return a, b, n
+        scale = mean_l / max(1e-9, a0 + b0 * mean_d)
+        return a0 * scale, b0 * scale, n
+
+
+class SegmentDecision(NamedTuple):
+    segment_s: int
+    segments: int
+    estimated_wall_s: float
+    overhead_s: float
+    per_audio_s: float
+    samples: int              # 拟合所用的 ASR 调用数（0 表示使用先验）
+    concurrency: int
+
+    def to_dict(self) -> Dict:
+        return {
+            "segment_duration": self.segment_s,
+            "segments": self.segments,
+            "estimated_wall_s": round(self.estimated_wall_s, 2),
+            "latency_overhead_s": round(self.overhead_s, 3),
+            "latency_per_audio_s": round(self.per_audio_s, 4),
+            "latency_samples": self.samples,
+            "concurrency": self.concurrency,
+        }
+
+
+def estimate_wall_s(plan: Sequence[Tuple[float, float]], concurrency: int, overhead_s: float, per_audio_s: float,
+                    rate_per_s: float = 0.0) -> float:
+    # 片段按顺序交给最早空闲的工作线程；限速时第 i 个调用最早在 i / rate_per_s 秒发起
+    free_at = [0.0] * max(1, int(concurrency))
+    end = 0.0
+    for i, (_, duration) in enumerate(plan):
+        start = heapq.heappop(free_at)
+        if rate_per_s > 0:
+            start = max(start, i / rate_per_s)
+        finish = start + overhead_s + per_audio_s * duration
+        heapq.heappush(free_at, finish)
+        end = max(end, finish)
+    return end
+
+
+def choose_segment_length(
+    start_s: float,
+    end_s: float,
+    concurrency: int,
+    model: LatencyModel,
+    rate_per_s: float = 0.0,
+    max_segment_s: float = 180,
+    candidates: Iterable[int] = SEGMENT_CANDIDATES,
+) -> SegmentDecision:
+    # 总耗时相同时取较短的时长（首个结果更早出现）
+    overhead_s, per_audio_s, samples = model.estimate()
+    span = end_s - start_s
+    options = [c for c in candidates if c <= max_segment_s and c <= span] or [max(1, int(min(span, max_segment_s)))]
+    best: Optional[SegmentDecision] = None
+    for length in sorted(options):
+        plan = plan_segments(start_s, end_s, length)
+        wall_s = estimate_wall_s(plan, concurrency, overhead_s, per_audio_s, rate_per_s)
+        if best is None or wall_s < best.estimated_wall_s - 1e-6:
+            best = SegmentDecision(length, len(plan), wall_s, overhead_s, per_audio_s, samples, concurrency)
+    return best
+
+
+# ========== 片段编码 ==========
+class EncodingDecision(NamedTuple):
+    profile: EncodingProfile
+    encode_rtf: float           # 编码耗时 / 音频时长（实测）
+    cost_per_audio_s: float     # 每秒音频的编码 + 上传耗时（秒）
+
+    def to_dict(self) -> Dict:
+        return {
+            "profile": self.profile.name,
+            "encode_rtf": round(self.encode_rtf, 4),
+            "cost_per_audio_s": round(self.cost_per_audio_s, 4),
+        }
+
+
+_encoders: Optional[set] = None
+_encoders_lock = threading.Lock()
+
+
+def available_encoders() -> set:
+    # 本机 ffmpeg 编译进的音频编码器名称
+    global _encoders
+    with _encoders_lock:
+        if _encoders is None:
+            _encoders = set()
+            if shutil.which("ffmpeg"):
+                res = subprocess.run(["ffmpeg", "-hide_banner", "-encoders"], stdout=subprocess.PIPE,
+                                     stderr=subprocess.DEVNULL, text=True)
+                for line in res.stdout.splitlines():
+                    parts = line.split()
+                    if len(parts) >= 2 and parts[0].startswith("A"):
+                        _encoders.add(parts[1])
+        return _encoders
+
+
+def measure_encode_rtf(profile: EncodingProfile, seconds: float = CALIBRATION_SECONDS) -> float:
+    # 把一段立体声 44.1kHz 的合成音频按 profile 编码到管道，返回编码耗时与音频时长之比
+    cmd = [
+        "ffmpeg", "-hide_banner", "-loglevel", "error",
+        "-f", "lavfi", "-i", f"sine=frequency=440:sample_rate=44100:duration={seconds:g}",
+        "-ac", "2", *profile.ffmpeg_args(), "-f", profile.fmt, "pipe:1",
+    ]
+    t0 = time.perf_counter()
+    res = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if res.returncode != 0:
+        raise RuntimeError(res.stderr.decode("utf-8", "replace").strip())
+    return (time.perf_counter() - t0) / seconds
+
+
+def choose_encoding_profile(profiles: Iterable[EncodingProfile], upload_bytes_per_s: float) -> EncodingDecision:
+    # 每秒音频的代价 = 编码耗时 + 编码后字节数 / 上传带宽；本机不支持的编码跳过
+    encoders = available_encoders()
+    decisions: List[EncodingDecision] = []
+    for profile in profiles:
+        if profile.codec not in encoders:
+            continue
+        try:
+            rtf = measure_encode_rtf(profile)
+        except RuntimeError as e:
+            logger.warning("[TUNE] Encoder %s unusable: %s", profile.name, e)
+            continue
+        cost = rtf + profile.bytes_per_second / max(1.0, upload_bytes_per_s)
+        decisions.append(EncodingDecision(profile, rtf, cost))
+        logger.info("[TUNE] Encoding %s: rtf %.4f, cost %.4f s per audio second", profile.name, rtf, cost)
+    if not decisions:
+        return EncodingDecision(PROFILE_MP3_32K, 0.0, 0.0)
+    return min(decisions, key=lambda d: d.cost_per_audio_s)
@@ -0,0 +1,264 @@
+"""批量转录命令行：一次处理整个目录（或通配符匹配）的录音，输出 txt/SRT/JSON 转录稿。
+
+用法（在项目根目录执行）:
+    python batch_transcribe.py recordings/ "archive/*.m4a" -o transcripts --format txt srt json
+
+- 切分阶段在进程池中运行：计算内容哈希、读取时长、规划片段、用 ffmpeg 切分到分片缓存；
+- 转录阶段复用 Web 端的转录流水线与 ASR 后端，所有文件共享同一个有界的 ASR 并发上限；
+- 已有输出文件的录音直接跳过（--force 重新生成）；转录缓存命中的片段不调用 ASR，已切分的片段不调用 ffmpeg，
+  因此中断后重跑只处理剩余部分。
+结束时输出吞吐量汇总：每个挂钟小时处理的音频小时数。
+"""
+from __future__ import annotations
+
+import argparse
+import glob
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Tuple
+
+from audio_meta import probe_audio
+from audio_splitter import PROFILE_MP3_32K, EncodingProfile
+from exporters import EXPORT_FORMATS, export
+from log_setup import log_context
+from pipeline import SEGMENT_MODES, SEGMENT_VAD, STORAGE_DISK, TranscriptionRequest, plan_request, run_transcription
+from segment_cache import content_cache_dir, count_cached_segments, get_content_hash, iter_cached_segments
+from transcript_store import TranscriptStore, segment_id, transcript_key
+
+logger = logging.getLogger("batch")
+
+
+class PreparedFile(NamedTuple):
+    path: str
+    content_hash: str
+    duration_s: float
+    end_s: int
+    segments: int
+    transcript_hits: int        # 转录缓存命中的片段数
+    split_segments: int         # 本次新切分的片段数
+
+
+class FileResult(NamedTuple):
+    path: str
+    status: str                 # "done" | "skipped" | "failed"
+    audio_s: float = 0.0
+    segments: int = 0
+    transcript_hits: int = 0
+    split_segments: int = 0
+    error: str = ""
+
+
+def collect_inputs(inputs: List[str], extensions, recursive: bool = False) -> List[Path]:
+    # 目录展开为其中的音频文件，其余参数按通配符匹配；结果去重并按路径排序
+    found = set()
+    for item in inputs:
+        p = Path(item)
+        if p.is_dir():
+            pattern = "**/*" if recursive else "*"
+            found.update(f for f in p.glob(pattern) if f.is_file() and f.suffix.lower().lstrip(".") in extensions)
+        elif p.is_file():
+            found.add(p)
+        else:
+            found.update(Path(f) for f in glob.glob(item, recursive=recursive) if Path(f).is_file())
+    return sorted(f.resolve() for f in found)
+
+
+def input_root(files: List[Path]) -> Path:
+    # 所有输入文件所在目录的公共上级目录，输出按相对它的路径命名
+    return Path(os.path.commonpath([str(f.parent) for f in files]))
+
+
+def output_paths(audio_path: Path, root: Path, output_dir: Path, formats: List[str]) -> Dict[str, Path]:
+    # 保留相对输入根目录的子目录与扩展名（a/meeting.m4a -> a/meeting.m4a.srt），不同目录或不同扩展名的同名录音不会互相覆盖
+    rel = audio_path.relative_to(root)
+    return {fmt: output_dir / rel.parent / f"{rel.name}.{fmt}" for fmt in formats}
+
+
+# 每个切分进程复用一个转录缓存连接（按数据库路径），而不是每个文件打开一个
+_worker_stores: Dict[str, TranscriptStore] = {}
+
+
+def worker_store(transcript_db: str) -> TranscriptStore:
+    store = _worker_stores.get(transcript_db)
+    if store is None:
+        store = _worker_stores[transcript_db] = TranscriptStore(Path(transcript_db))
+    return store
+
+
+def prepare_file(path: str, cache_base_dir: str, segment_s: int, segment_mode: str, max_segment_s: float,
+                 transcript_db: str, asr_key: Tuple[str, str, str],
+                 profile: EncodingProfile = PROFILE_MP3_32K) -> PreparedFile:
+    # 在进程池中运行：只为转录缓存未命中、且分片缓存中还没有的片段调用 ffmpeg
+    audio_path = Path(path)
+    content_hash = get_content_hash(audio_path)
+    duration_s = probe_audio(audio_path).duration_s
+    # 与 Web 端相同：结束时间取整到秒（int），两边对同一录音规划出相同的片段，可共享转录缓存
+    end_s = int(duration_s)
+    if end_s <= 0:
+        raise ValueError(f"音频时长不足 1 秒: {duration_s:.3f}")
+    req = TranscriptionRequest(audio_path, content_hash, 0, end_s, segment_s, segment_mode)
+    cache_dir = content_cache_dir(Path(cache_base_dir), content_hash)
+    plan = plan_request(req, max_segment_s, cache_dir)
+
+    model, language, context = asr_key
+    keys = [
+        transcript_key(segment_id(content_hash, round(st * 1000), round(du * 1000)), model, language, context)
+        for st, du in plan
+    ]
+    stored = worker_store(transcript_db).get_many(keys)
+    misses = [i for i, k in enumerate(keys) if k not in stored]
+    split = len(misses) - count_cached_segments(cache_dir, plan, only=misses, profile=profile)
+    if split:
+        for _ in iter_cached_segments(
+            audio_path, cache_dir, segment_s, 0, end_s,
+            only=misses, plan=plan if segment_mode == SEGMENT_VAD else None, profile=profile,
+        ):
+            pass
+    return PreparedFile(path, content_hash, duration_s, end_s, len(plan), len(plan) - len(misses), split)
+
+
+def transcribe_file(prep: PreparedFile, ctx, segment_s: int, segment_mode: str,
+                    targets: Dict[str, Path]) -> FileResult:
+    # 片段均已在缓存中：流水线只调用 ASR（或回放转录缓存），随后写出各格式的转录稿
+    audio_path = Path(prep.path)
+    req = TranscriptionRequest(audio_path, prep.content_hash, 0, prep.end_s, segment_s, segment_mode)
+    segments: List[Dict] = []
+    errors: List[str] = []
+
+    def collect(event: Dict) -> None:
+        kind = event.get("type")
+        if kind == "segment_done":
+            segments.append({k: event[k] for k in ("index", "timestamp", "duration", "text")})
+        elif kind == "error":
+            errors.append(event.get("message", ""))
+
+    with log_context(file=audio_path.name):
+        run_transcription(req, ctx, collect)
+    result = FileResult(prep.path, "done", prep.duration_s, prep.segments, prep.transcript_hits, prep.split_segments)
+    if errors:
+        # 不写出不完整的转录稿；已成功的片段在转录缓存中，重跑时只重试失败部分
+        return result._replace(status="failed", error="; ".join(errors))
+
+    segments.sort(key=lambda s: s["index"])
+    meta = {"source": audio_path.name, "content_hash": prep.content_hash, "duration": prep.duration_s}
+    for fmt, target in targets.items():
+        target.parent.mkdir(parents=True, exist_ok=True)
+        tmp = target.with_name(target.name + ".tmp")
+        tmp.write_text(export(segments, fmt, meta), encoding="utf-8")
+        os.replace(tmp, target)
+    return result
+
+
+def format_summary(results: List[FileResult], wall_s: float) -> str:
+    done = [r for r in results if r.status == "done"]
+    failed = [r for r in results if r.status == "failed"]
+    skipped = [r for r in results if r.status == "skipped"]
+    audio_h = sum(r.audio_s for r in done) / 3600
+    wall_h = max(wall_s, 1e-9) / 3600
+    lines = [
+        f"文件: {len(results)}（完成 {len(done)}，跳过 {len(skipped)}，失败 {len(failed)}）",
+        f"片段: {sum(r.segments for r in done)}（转录缓存命中 {sum(r.transcript_hits for r in done)}，"
+        f"新切分 {sum(r.split_segments for r in results)}）",
+        f"音频时长: {audio_h:.2f} 小时，耗时: {wall_s:.1f} 秒",
+        f"吞吐量: {audio_h / wall_h:.1f} 音频小时/小时",
+    ]
+    lines += [f"失败: {r.path}: {r.error}" for r in failed]
+    return "\n".join(lines)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("inputs", nargs="+", help="目录、文件或通配符")
+    parser.add_argument("-o", "--output-dir", default="transcripts")
+    parser.add_argument("--format", nargs="+", choices=EXPORT_FORMATS, default=["txt", "srt"], dest="formats")
+    parser.add_argument("--segment", type=int, default=60, help="分割单位时长（秒）")
+    parser.add_argument("--segment-mode", choices=SEGMENT_MODES, default=None, help="默认取 SEGMENT_MODE 配置")
+    parser.add_argument("--split-workers", type=int, default=max(1, (os.cpu_count() or 2) // 2), help="切分进程数")
+    parser.add_argument("--asr-workers", type=int, default=None, help="所有文件合计的 ASR 并发上限")
+    parser.add_argument("--recursive", action="store_true", help="递归查找子目录")
+    parser.add_argument("--force", action="store_true", help="已有输出文件时也重新生成")
+    args = parser.parse_args(argv)
+
+    # 与 Web 端共用配置、缓存与 ASR 后端；不启动 Web 端的转录队列（其中未完成的转录留给 Web 服务恢复）
+    os.environ.setdefault("TRANSCRIBE_QUEUE_AUTOSTART", "false")
+    from app import Config, build_pipeline_context, calibrate_encoding, get_asr_client
+    from asr_backends import BoundedBackend
+
+    backend = get_asr_client()
+    err = backend.ensure_ready()
+    if err:
+        print(err, file=sys.stderr)
+        return 2
+    caps = backend.capabilities
+    if not 0 < args.segment <= min(Config.ASR_SEGMENT_MAX_SECONDS, caps.max_segment_s):
+        print(f"分割单位时长需在 1-{Config.ASR_SEGMENT_MAX_SECONDS} 秒之间", file=sys.stderr)
+        return 2
+    segment_mode = args.segment_mode or Config.SEGMENT_MODE
+    asr_workers = args.asr_workers or max(Config.ASR_MAX_CONCURRENCY, caps.batch_size)
+    calibrate_encoding()
+    ctx = build_pipeline_context(BoundedBackend(backend, asr_workers))._replace(segment_storage=STORAGE_DISK)
+    asr_key = (ctx.asr_model, ctx.asr_language, ctx.asr_system_content)
+
+    output_dir = Path(args.output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    files = collect_inputs(args.inputs, Config.ALLOWED_EXTENSIONS, args.recursive)
+    if not files:
+        print("没有找到音频文件", file=sys.stderr)
+        return 1
+    root = input_root(files)
+
+    results: List[FileResult] = []
+    t0 = time.perf_counter()
+    # 用 spawn 启动切分进程：此时已导入 app，fork 会把其后台线程持有的锁与打开的 SQLite 连接一并复制到子进程
+    with ProcessPoolExecutor(max_workers=max(1, args.split_workers),
+                             mp_context=multiprocessing.get_context("spawn")) as splitters, \
+            ThreadPoolExecutor(max_workers=max(1, asr_workers), thread_name_prefix="batch-asr") as transcribers:
+        preparing = {}
+        for path in files:
+            if not args.force and all(p.exists() for p in output_paths(path, root, output_dir, args.formats).values()):
+                results.append(FileResult(str(path), "skipped"))
+                continue
+            fut = splitters.submit(
+                prepare_file, str(path), str(Config.CACHE_BASE_DIR), args.segment, segment_mode,
+                ctx.max_segment_s, str(Config.TRANSCRIPT_DB_PATH), asr_key, ctx.encoding,
+            )
+            preparing[fut] = path
+
+        # 文件切分完成后立即进入转录，切分与转录在不同文件间重叠进行
+        transcribing = {}
+        for fut in as_completed(preparing):
+            path = preparing[fut]
+            try:
+                prep = fut.result()
+            except Exception as e:
+                logger.error("[BATCH] Failed to prepare %s: %s", path, e)
+                results.append(FileResult(str(path), "failed", error=str(e)))
+                continue
+            logger.info("[BATCH] Prepared %s: %s segments, %s transcript hits, %s newly split",
+                        path.name, prep.segments, prep.transcript_hits, prep.split_segments)
+            transcribing[transcribers.submit(
+                transcribe_file, prep, ctx, args.segment, segment_mode,
+                output_paths(path, root, output_dir, args.formats),
+            )] = path
+
+        for fut in as_completed(transcribing):
+            path = transcribing[fut]
+            try:
+                result = fut.result()
+            except Exception as e:
+                logger.error("[BATCH] Failed to transcribe %s: %s", path, e)
+                result = FileResult(str(path), "failed", error=str(e))
+            logger.info("[BATCH] %s: %s", result.status, path.name)
+            results.append(result)
+
+    print(format_summary(results, time.perf_counter() - t0))
+    return 1 if any(r.status == "failed" for r in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,102 @@
+"""ASR 容错基准：对注入失败的本地假 DashScope 服务发起并发转录，对比不同重试次数下的成功率与延迟。
+
+用法（在项目根目录执行，需已安装 requirements.txt 中的依赖）:
+    python benchmarks/bench_asr_retry.py --segments 100 --workers 8 --throttle 0.2 --error 0.1 --drop 0.05 --retries 0 3
+
+片段以内存 MP3（data URI）提交，不会触发 SDK 的文件上传。
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_dashscope import FakeDashScope  # noqa: E402
+
+
+def run_once(args, retries: int):
+    import dashscope
+
+    import app
+    from asr_resilience import CircuitBreaker, RetryPolicy
+
+    fake = FakeDashScope(
+        latency_s=args.latency, throttle=args.throttle, error=args.error, drop=args.drop,
+        stall=args.stall, stall_s=args.stall_seconds, seed=args.seed,
+    ).start()
+    dashscope.base_http_api_url = fake.base_url
+    app.Config.ASR_INLINE_AUDIO = True
+    app.Config.ASR_SEGMENT_TIMEOUT_SECONDS = args.timeout
+    client = app.ASRClient(api_key="fake-key")
+    client.retry_policy = RetryPolicy(retries, args.base, args.max_backoff)
+    client.breaker = CircuitBreaker(args.breaker_threshold, args.breaker_cooldown)
+
+    def one(i: int):
+        t0 = time.perf_counter()
+        try:
+            text = ""
+            for text in client.stream_transcribe_bytes(b"\xff\xfb" + bytes([i % 256]) * 512, "mp3"):
+                pass
+            return True, time.perf_counter() - t0, ""
+        except Exception as e:
+            return False, time.perf_counter() - t0, type(e).__name__
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        results = list(executor.map(one, range(args.segments)))
+    wall_s = time.perf_counter() - t0
+    fake.stop()
+
+    ok = [r for r in results if r[0]]
+    latencies = sorted(r[1] for r in ok) or [0.0]
+    errors = {}
+    for r in results:
+        if not r[0]:
+            errors[r[2]] = errors.get(r[2], 0) + 1
+    p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+    return len(ok), wall_s, statistics.median(latencies), p95, fake.counts["requests"], errors
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--segments", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--retries", type=int, nargs="+", default=[0, 3])
+    parser.add_argument("--latency", type=float, default=0.1, help="假服务首包延迟（秒）")
+    parser.add_argument("--throttle", type=float, default=0.2)
+    parser.add_argument("--error", type=float, default=0.1)
+    parser.add_argument("--drop", type=float, default=0.05)
+    parser.add_argument("--stall", type=float, default=0.0)
+    parser.add_argument("--stall-seconds", type=float, default=5.0)
+    parser.add_argument("--timeout", type=float, default=30.0, help="单片段截止时间（秒）")
+    parser.add_argument("--base", type=float, default=0.1, help="退避基数（秒）")
+    parser.add_argument("--max-backoff", type=float, default=2.0)
+    parser.add_argument("--breaker-threshold", type=int, default=20)
+    parser.add_argument("--breaker-cooldown", type=float, default=5.0)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    os.environ.setdefault("LOG_FILE", "")
+    # 隔离：应用导入时创建的上传、缓存目录与数据库放在临时目录，且不启动转录队列
+    with tempfile.TemporaryDirectory(prefix="bench_asr_retry_") as tmp:
+        os.environ["UPLOAD_FOLDER"] = os.path.join(tmp, "uploads")
+        os.environ["CACHE_BASE_DIR"] = os.path.join(tmp, "cache")
+        os.environ["TRANSCRIBE_QUEUE_AUTOSTART"] = "false"
+        return run_all(args)
+
+
+def run_all(args) -> int:
+    print(f"{'retries':>8} {'ok':>6} {'wall_s':>8} {'p50_s':>7} {'p95_s':>7} {'requests':>9}  errors")
+    for retries in args.retries:
+        ok, wall_s, p50, p95, requests, errors = run_once(args, retries)
+        print(f"{retries:>8d} {ok:>3d}/{args.segments:<3d}{wall_s:>8.2f} {p50:>7.2f} {p95:>7.2f} {requests:>9d}  {errors or '-'}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
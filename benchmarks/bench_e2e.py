@@ -0,0 +1,349 @@
+"""端到端负载测试：合成音频 -> 上传 -> N 个并发 SSE 客户端 -> 汇总延迟、吞吐、内存与写盘量。
+
+用法（在项目根目录执行，需已安装 requirements.txt 中的依赖与 ffmpeg）:
+    python benchmarks/bench_e2e.py --clients 8 --minutes 5 --codec wav mp3 m4a --segment 60
+    python benchmarks/bench_e2e.py --clients 32 --asr server --latency 0.5 --json report.json
+
+流程:
+  1. 用 ffmpeg 的 lavfi 生成合成音频（带周期性静音的正弦波，每个文件频率不同，内容哈希互不相同）；
+  2. 在本进程内启动应用（WSGI 或 --server asgi），ASR 换成本地桩。应用的上传目录、缓存与数据库都指向临时目录
+     （运行结束后删除），不会把桩的转录结果写入真实的转录缓存，也不会恢复真实数据中未完成的转录：
+     - call:   替换 dashscope.MultiModalConversation.call，首包延迟与 chunk 数可调，支持写盘片段；
+     - server: 本地假 DashScope HTTP 服务（fake_dashscope.py），经 SDK 的真实 HTTP/SSE 路径，
+               片段以内存 MP3 内联提交（SEGMENT_STORAGE=memory）；
+  3. 每个客户端通过 HTTP 上传自己的文件并打开 /transcribe/stream，记录首个部分结果（delta/segment_done）
+     与 done 事件的时间。
+输出各客户端的首个部分结果时间与总延迟分位数、音频吞吐、片段吞吐、峰值 RSS 与上传/缓存目录的写盘增量；
+--json 把同样的数据写入文件，便于在 CI 中与上一次的结果比较。
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+CODEC_ARGS = {
+    "wav": ["-c:a", "pcm_s16le"],
+    "mp3": ["-c:a", "libmp3lame", "-b:a", "64k"],
+    "m4a": ["-c:a", "aac", "-b:a", "64k"],
+}
+
+
+def make_speechlike_audio(path: str, seconds: float, frequency: float, sample_rate: int = 16000) -> None:
+    # 每 4 秒含 0.6 秒静音，静音感知分段也有切点可选
+    expr = f"0.3*sin(2*PI*{frequency:.3f}*t)*gt(mod(t\\,4)\\,0.6)"
+    cmd = [
+        "ffmpeg", "-y", "-hide_banner", "-loglevel", "error",
+        "-f", "lavfi", "-i", f"aevalsrc=exprs={expr}:sample_rate={sample_rate}:duration={seconds:.3f}",
+        "-ac", "1", *CODEC_ARGS[Path(path).suffix.lstrip(".")], path,
+    ]
+    subprocess.run(cmd, check=True)
+
+
+def dir_bytes(path: Path) -> int:
+    return sum(p.stat().st_size for p in path.rglob("*") if p.is_file()) if path.exists() else 0
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+class StubConversation:
+    """替换 dashscope.MultiModalConversation：等待首包延迟后分 chunks 次产出累计文本（dict 结构的 chunk）。"""
+
+    def __init__(self, latency_s: float, chunks: int, chunk_interval_s: float, seed: Optional[int] = None):
+        self.latency_s = latency_s
+        self.chunks = max(1, chunks)
+        self.chunk_interval_s = chunk_interval_s
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+
+    def call(self, messages=None, **kwargs):
+        with self._lock:
+            self.calls += 1
+            # 对数正态延迟，均值约为 latency_s
+            latency = self._rng.lognormvariate(0, 0.5) * self.latency_s / 1.133
+        return self._stream(latency)
+
+    def _stream(self, latency: float):
+        time.sleep(latency)
+        text = ""
+        for i in range(self.chunks):
+            text += f"[chunk{i}]"
+            yield {"status_code": 200, "output": {"choices": [{"message": {"content": [{"text": text}]}}]}}
+            time.sleep(self.chunk_interval_s)
+
+
+def upload(host: str, port: int, path: Path) -> Dict:
+    boundary = uuid.uuid4().hex
+    head = (
+        f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"{path.name}\"\r\n"
+        f"Content-Type: application/octet-stream\r\n\r\n"
+    ).encode("utf-8")
+    body = head + path.read_bytes() + f"\r\n--{boundary}--\r\n".encode("utf-8")
+    conn = http.client.HTTPConnection(host, port, timeout=600)
+    try:
+        conn.request("POST", "/upload", body, {"Content-Type": f"multipart/form-data; boundary={boundary}"})
+        resp = conn.getresponse()
+        data = json.loads(resp.read().decode("utf-8"))
+        if resp.status != 200:
+            raise RuntimeError(f"上传失败 ({resp.status}): {data}")
+        return data
+    finally:
+        conn.close()
+
+
+def stream_client(host: str, port: int, query: str, timeout_s: float) -> Dict:
+    # 读取 SSE 直到 done：记录首个部分结果与结束时间（相对打开连接的时刻）
+    result = {"first_partial_s": None, "total_s": None, "events": 0, "segments": 0, "errors": 0, "audio_s": 0.0}
+    conn = http.client.HTTPConnection(host, port, timeout=timeout_s)
+    t0 = time.perf_counter()
+    try:
+        conn.request("GET", f"/transcribe/stream?{query}", headers={"Accept": "text/event-stream"})
+        resp = conn.getresponse()
+        if resp.status != 200:
+            raise RuntimeError(f"SSE 请求失败 ({resp.status}): {resp.read()[:200]!r}")
+        while True:
+            line = resp.readline()
+            if not line:
+                break
+            if not line.startswith(b"data: "):
+                continue
+            event = json.loads(line[6:].decode("utf-8"))
+            result["events"] += 1
+            kind = event.get("type")
+            if kind in ("delta", "segment_done") and result["first_partial_s"] is None:
+                result["first_partial_s"] = time.perf_counter() - t0
+            if kind == "segments":
+                result["audio_s"] = event.get("audio_seconds", 0.0)
+            elif kind == "segment_done":
+                result["segments"] += 1
+            elif kind == "error":
+                result["errors"] += 1
+            elif kind == "done":
+                result["total_s"] = time.perf_counter() - t0
+                break
+    finally:
+        conn.close()
+    return result
+
+
+def start_server(app_module, server: str):
+    # 在本进程的后台线程中启动服务，返回 (host, port, stop)
+    if server == "asgi":
+        import socket
+
+        import uvicorn
+
+        import asgi
+
+        sock = socket.socket()
+        sock.bind(("127.0.0.1", 0))
+        config = uvicorn.Config(asgi.application, log_level="warning", lifespan="on")
+        srv = uvicorn.Server(config)
+        thread = threading.Thread(target=srv.run, kwargs={"sockets": [sock]}, daemon=True)
+        thread.start()
+        while not srv.started:
+            time.sleep(0.05)
+
+        def stop():
+            srv.should_exit = True
+            thread.join(timeout=10)
+
+        return "127.0.0.1", sock.getsockname()[1], stop
+
+    from werkzeug.serving import make_server
+
+    srv = make_server("127.0.0.1", 0, app_module.app, threaded=True)
+    thread = threading.Thread(target=srv.serve_forever, daemon=True)
+    thread.start()
+
+    def stop():
+        srv.shutdown()
+        srv.server_close()
+
+    return "127.0.0.1", srv.server_port, stop
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=8, help="并发 SSE 客户端数")
+    parser.add_argument("--files", type=int, default=None, help="不同音频文件数（默认与客户端数相同，多余的客户端附着到已有转录）")
+    parser.add_argument("--minutes", type=float, default=5.0, help="每个合成音频的时长（分钟）")
+    parser.add_argument("--codec", nargs="+", choices=sorted(CODEC_ARGS), default=["wav"], help="按文件轮流使用的编码")
+    parser.add_argument("--segment", type=int, default=60, help="分割单位时长（秒）")
+    parser.add_argument("--segment-mode", choices=("fixed", "vad"), default="fixed")
+    parser.add_argument("--storage", choices=("disk", "memory"), default=None, help="片段存储，默认取 SEGMENT_STORAGE")
+    parser.add_argument("--server", choices=("wsgi", "asgi"), default="wsgi")
+    parser.add_argument("--asr", choices=("call", "server"), default="call", help="ASR 桩：替换 SDK 调用或本地假 HTTP 服务")
+    parser.add_argument("--latency", type=float, default=0.5, help="ASR 首包延迟（秒）")
+    parser.add_argument("--chunks", type=int, default=5, help="每个片段的流式结果数")
+    parser.add_argument("--chunk-interval", type=float, default=0.05, help="流式结果间隔（秒）")
+    parser.add_argument("--workers", type=int, default=None, help="后台转录并发数，默认取 TRANSCRIBE_WORKERS")
+    parser.add_argument("--concurrency", type=int, default=None, help="单个转录内的 ASR 并发，默认取 ASR_MAX_CONCURRENCY")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="每个 API Key 每秒的 ASR 调用上限（默认不限速）")
+    parser.add_argument("--timeout", type=float, default=1800.0, help="单个客户端的超时（秒）")
+    parser.add_argument("--json", dest="json_path", default=None, help="把结果写入 JSON 文件")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    if not shutil.which("ffmpeg"):
+        print("未找到 ffmpeg，无法运行基准", file=sys.stderr)
+        return 1
+
+    # 应用在导入时读取配置，须先设置环境变量
+    os.environ["ASR_BACKEND"] = "dashscope"
+    os.environ.setdefault("DASHSCOPE_API_KEY", "bench-key")
+    os.environ["ASR_RATE_LIMIT_PER_SECOND"] = str(args.rate_limit)
+    os.environ["SEGMENT_MODE"] = args.segment_mode
+    storage = "memory" if args.asr == "server" else args.storage
+    if storage:
+        os.environ["SEGMENT_STORAGE"] = storage
+    if args.asr == "server":
+        os.environ["ASR_INLINE_AUDIO"] = "true"
+    if args.workers:
+        os.environ["TRANSCRIBE_WORKERS"] = str(args.workers)
+    if args.concurrency:
+        os.environ["ASR_MAX_CONCURRENCY"] = str(args.concurrency)
+    os.environ.setdefault("LOG_FILE", "")
+    # 隔离：上传、缓存与数据库放在临时目录；导入时不启动转录队列（第一次提交时才启动，此时桩已就位）
+    with tempfile.TemporaryDirectory(prefix="bench_e2e_") as tmp:
+        workdir = Path(tmp)
+        os.environ["UPLOAD_FOLDER"] = str(workdir / "uploads")
+        os.environ["CACHE_BASE_DIR"] = str(workdir / "cache")
+        os.environ["TRANSCRIBE_QUEUE_AUTOSTART"] = "false"
+        return run_bench(args, workdir)
+
+
+def run_bench(args, workdir: Path) -> int:
+    # ASR 桩在导入应用之前安装
+    import dashscope
+
+    fake = stub = None
+    if args.asr == "server":
+        from fake_dashscope import FakeDashScope
+
+        fake = FakeDashScope(latency_s=args.latency, chunks=args.chunks, chunk_interval_s=args.chunk_interval,
+                             seed=args.seed).start()
+        dashscope.base_http_api_url = fake.base_url
+    else:
+        stub = StubConversation(args.latency, args.chunks, args.chunk_interval, args.seed)
+        dashscope.MultiModalConversation = stub
+
+    import app
+
+    rng = random.Random(args.seed)
+    n_files = max(1, min(args.files or args.clients, args.clients))
+    audio_dir = workdir / "audio"
+    audio_dir.mkdir()
+    tag = uuid.uuid4().hex[:8]
+    files = []
+    t0 = time.perf_counter()
+    for i in range(n_files):
+        path = audio_dir / f"bench_{tag}_{i:03d}.{args.codec[i % len(args.codec)]}"
+        make_speechlike_audio(str(path), args.minutes * 60, rng.uniform(200, 2000))
+        files.append(path)
+    print(f"生成 {n_files} 个合成音频（{args.minutes:g} 分钟，{'/'.join(args.codec)}）: {time.perf_counter() - t0:.1f}s")
+
+    probe_s = []
+    for path in files:
+        t = time.perf_counter()
+        app.get_audio_duration_seconds(path)
+        probe_s.append(time.perf_counter() - t)
+
+    watched = [app.Config.UPLOAD_FOLDER, app.Config.CACHE_BASE_DIR]
+    disk_before = sum(dir_bytes(p) for p in watched)
+    host, port, stop = start_server(app, args.server)
+    try:
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=n_files) as pool:
+            jobs = list(pool.map(lambda p: upload(host, port, p), files))
+        upload_s = time.perf_counter() - t0
+
+        end_s = int(args.minutes * 60)
+        queries = [
+            f"job_id={jobs[i % n_files]['job_id']}&start_time=0&end_time={end_s}&segment_duration={args.segment}"
+            for i in range(args.clients)
+        ]
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.clients) as pool:
+            futures = [pool.submit(stream_client, host, port, q, args.timeout) for q in queries]
+            # 与 queries 一一对应，失败的客户端为 None
+            results: List[Optional[Dict]] = []
+            failures = []
+            for fut in futures:
+                try:
+                    results.append(fut.result())
+                except Exception as e:
+                    results.append(None)
+                    failures.append(str(e))
+        wall_s = time.perf_counter() - t0
+    finally:
+        stop()
+        if fake is not None:
+            fake.stop()
+    disk_written = sum(dir_bytes(p) for p in watched) - disk_before
+
+    done = [r for r in results if r is not None and r["total_s"] is not None]
+    first = [r["first_partial_s"] for r in done if r["first_partial_s"] is not None]
+    totals = [r["total_s"] for r in done]
+    # 附着到同一转录（同一文件）的客户端不重复计算音频时长与片段数
+    per_file = [[r for r in results[i::n_files] if r is not None] for i in range(n_files)]
+    audio_s = sum(max((r["audio_s"] for r in rs), default=0.0) for rs in per_file)
+    segments = sum(max((r["segments"] for r in rs), default=0) for rs in per_file)
+    report = {
+        "clients": args.clients,
+        "files": n_files,
+        "completed": len(done),
+        "failed": len(results) - len(done),
+        "segment_errors": sum(r["errors"] for r in results if r is not None),
+        "upload_s": round(upload_s, 3),
+        "probe_ms_p50": round(statistics.median(probe_s) * 1000, 2),
+        "first_partial_s": {"p50": percentile(first, 0.5), "p95": percentile(first, 0.95), "max": max(first, default=0.0)},
+        "total_s": {"p50": percentile(totals, 0.5), "p95": percentile(totals, 0.95), "max": max(totals, default=0.0)},
+        "wall_s": round(wall_s, 3),
+        "audio_x_realtime": round(audio_s / max(wall_s, 1e-9), 1),
+        "segments_per_s": round(segments / max(wall_s, 1e-9), 2),
+        "asr_calls": fake.counts["requests"] if fake is not None else stub.calls,
+        # Linux 上 ru_maxrss 以 KB 计；子进程（ffmpeg）取其中的最大值
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "peak_child_rss_mb": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1),
+        "disk_bytes_written": disk_written,
+    }
+
+    print(f"客户端: {report['completed']}/{args.clients} 完成，失败 {report['failed']}，片段错误 {report['segment_errors']}")
+    print(f"上传: {upload_s:.2f}s，读取时长 p50: {report['probe_ms_p50']}ms")
+    for name, label in (("first_partial_s", "首个部分结果"), ("total_s", "总延迟")):
+        stats = report[name]
+        print(f"{label}: p50 {stats['p50']:.2f}s  p95 {stats['p95']:.2f}s  max {stats['max']:.2f}s")
+    print(f"吞吐: {report['audio_x_realtime']}x 实时，{report['segments_per_s']} 片段/秒，ASR 调用 {report['asr_calls']} 次")
+    print(f"峰值 RSS: {report['peak_rss_mb']} MB（ffmpeg 子进程 {report['peak_child_rss_mb']} MB），"
+          f"写盘: {disk_written / 1024 / 1024:.1f} MB")
+    for err in failures:
+        print(f"失败: {err}")
+    if args.json_path:
+        Path(args.json_path).write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    return 0 if len(done) == len(results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
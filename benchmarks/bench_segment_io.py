@@ -0,0 +1,93 @@
+"""片段存储基准：写盘切分（disk）vs 内存编码（memory）的写盘字节数与逐片段延迟。
+
+用法（在项目根目录执行）:
+    python benchmarks/bench_segment_io.py --minutes 10 60 --segment 60
+
+会用 ffmpeg 的 lavfi 生成指定时长的合成音频，分别用两种方式产出全部片段：
+- disk:   切分为 MP3 写入分片缓存，随后读回文件内容（等同 ASR SDK 上传前的读取）
+- memory: 解码一次为 PCM，逐段在内存中编码为 MP3；--tempfile 时模拟 SDK 需要文件的情形，每段写一次临时文件
+每个片段的延迟为从上一个片段就绪到本片段字节可用的时间。
+"""
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from audio_splitter import _ffprobe_duration  # noqa: E402
+from bench_split import make_synthetic_audio  # noqa: E402
+from segment_cache import iter_cached_segments  # noqa: E402
+
+
+def dir_bytes(path: Path) -> int:
+    return sum(p.stat().st_size for p in path.rglob("*") if p.is_file())
+
+
+def run_mode(src: str, workdir: Path, segment_s: int, mode: str, use_tempfile: bool):
+    cache_dir = workdir / f"cache_{mode}"
+    duration = _ffprobe_duration(src)
+    latencies = []
+    temp_bytes = 0
+    asr_bytes = 0
+
+    t0 = last = time.perf_counter()
+    for seg in iter_cached_segments(Path(src), cache_dir, segment_s, 0, duration, in_memory=(mode == "memory")):
+        if seg.data is None:
+            data = Path(seg.path).read_bytes()
+        else:
+            data = seg.data
+            if use_tempfile:
+                fd, tmp_name = tempfile.mkstemp(suffix=".mp3", dir=str(workdir))
+                with os.fdopen(fd, "wb") as f:
+                    f.write(data)
+                temp_bytes += len(data)
+                os.remove(tmp_name)
+        asr_bytes += len(data)
+        now = time.perf_counter()
+        latencies.append(now - last)
+        last = now
+    total_s = time.perf_counter() - t0
+
+    written = dir_bytes(cache_dir) + temp_bytes
+    shutil.rmtree(cache_dir, ignore_errors=True)
+    return total_s, latencies, written, asr_bytes
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--minutes", type=float, nargs="+", default=[10, 60])
+    parser.add_argument("--segment", type=int, default=60, help="分割单位时长（秒）")
+    parser.add_argument("--tempfile", action="store_true", help="memory 模式下每段写一次临时文件")
+    args = parser.parse_args()
+
+    for bin_name in ("ffmpeg", "ffprobe"):
+        if not shutil.which(bin_name):
+            print(f"未找到 {bin_name}，无法运行基准", file=sys.stderr)
+            return 1
+
+    workdir = Path(tempfile.mkdtemp(prefix="bench_segment_io_"))
+    try:
+        print(f"{'minutes':>8} {'mode':>7} {'segments':>9} {'total_s':>8} {'first_s':>8} "
+              f"{'p50_s':>7} {'p95_s':>7} {'written_MB':>11} {'asr_MB':>7}")
+        for minutes in args.minutes:
+            src = str(workdir / f"synthetic_{minutes:g}min.wav")
+            make_synthetic_audio(src, minutes)
+            for mode in ("disk", "memory"):
+                total_s, lat, written, asr_bytes = run_mode(src, workdir, args.segment, mode, args.tempfile)
+                p95 = sorted(lat)[max(0, int(len(lat) * 0.95) - 1)]
+                print(f"{minutes:>8g} {mode:>7} {len(lat):>9d} {total_s:>8.2f} {lat[0]:>8.2f} "
+                      f"{statistics.median(lat):>7.3f} {p95:>7.3f} {written / 1e6:>11.2f} {asr_bytes / 1e6:>7.2f}")
+            os.remove(src)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
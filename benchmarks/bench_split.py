@@ -0,0 +1,102 @@
+"""split_audio 基准：单次 ffmpeg 分段 vs 旧的逐片段 ffmpeg 循环。
+
+用法（在项目根目录执行）:
+    python benchmarks/bench_split.py --minutes 10 60 120 --segment 60
+
+会用 ffmpeg 的 lavfi 生成指定时长的合成音频（单声道 44.1kHz WAV），
+分别用两种实现把全程按 --segment 秒切分，输出耗时对比。
+"""
+import argparse
+import math
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from audio_splitter import _ffprobe_duration, split_audio  # noqa: E402
+
+
+def make_synthetic_audio(path: str, minutes: float) -> None:
+    cmd = [
+        "ffmpeg", "-y", "-hide_banner", "-loglevel", "error",
+        "-f", "lavfi", "-i", f"sine=frequency=440:sample_rate=44100:duration={minutes * 60:.0f}",
+        "-ac", "1", path,
+    ]
+    subprocess.run(cmd, check=True)
+
+
+def legacy_split_audio(input_file, output_dir, segment_s=60, start_s=0, end_s=None):
+    # 旧实现：每个片段一次 ffmpeg，-ss 放在 -i 之后（每次都从头解码）
+    os.makedirs(output_dir, exist_ok=True)
+    total_duration = _ffprobe_duration(input_file)
+    start = max(0.0, float(start_s))
+    end = min(float(end_s) if end_s is not None else total_duration, total_duration)
+    segment_len = float(segment_s)
+    num_segments = max(1, math.ceil((end - start) / segment_len))
+    base_name = os.path.splitext(os.path.basename(input_file))[0]
+    exported = []
+    for i in range(num_segments):
+        seg_start = start + i * segment_len
+        seg_duration = min(segment_len, end - seg_start)
+        if seg_duration <= 0:
+            break
+        out_mp3 = os.path.join(output_dir, f"{base_name}_{i+1:03d}.mp3")
+        cmd = [
+            "ffmpeg", "-y", "-hide_banner", "-loglevel", "error",
+            "-i", input_file,
+            "-ss", f"{seg_start:.6f}", "-t", f"{seg_duration:.6f}",
+            "-vn", "-c:a", "libmp3lame", "-b:a", "32k", out_mp3,
+        ]
+        subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        exported.append(out_mp3)
+    return exported
+
+
+def timed(fn, *args, **kwargs):
+    t0 = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return time.perf_counter() - t0, result
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--minutes", type=float, nargs="+", default=[10, 60, 120])
+    parser.add_argument("--segment", type=int, default=60, help="分割单位时长（秒）")
+    parser.add_argument("--skip-legacy", action="store_true", help="只跑新实现（旧实现在长音频上很慢）")
+    args = parser.parse_args()
+
+    for bin_name in ("ffmpeg", "ffprobe"):
+        if not shutil.which(bin_name):
+            print(f"未找到 {bin_name}，无法运行基准", file=sys.stderr)
+            return 1
+
+    workdir = tempfile.mkdtemp(prefix="bench_split_")
+    try:
+        print(f"{'minutes':>8} {'segments':>9} {'legacy_s':>10} {'single_s':>10} {'speedup':>8}")
+        for minutes in args.minutes:
+            src = os.path.join(workdir, f"synthetic_{minutes:g}min.wav")
+            make_synthetic_audio(src, minutes)
+
+            new_s, files = timed(split_audio, src, os.path.join(workdir, "new"), args.segment)
+            if args.skip_legacy:
+                legacy_s = float("nan")
+            else:
+                legacy_s, _ = timed(legacy_split_audio, src, os.path.join(workdir, "legacy"), args.segment)
+
+            speedup = legacy_s / new_s if new_s > 0 else float("nan")
+            print(f"{minutes:>8g} {len(files):>9d} {legacy_s:>10.2f} {new_s:>10.2f} {speedup:>7.1f}x")
+
+            for sub in ("new", "legacy"):
+                shutil.rmtree(os.path.join(workdir, sub), ignore_errors=True)
+            os.remove(src)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,77 @@
+"""本地假 ASR 后端：接口与 app.ASRClient 的 stream_transcribe_file / stream_transcribe_bytes 一致，延迟分布可配置。"""
+import math
+import random
+import threading
+import time
+from pathlib import Path
+from typing import Iterable, Optional
+
+
+class FakeASRClient:
+    """每次调用先等待一个“首包延迟”，再分 chunks 次产出累计文本。
+
+    latency_dist:
+      - fixed:     恒为 mean_s
+      - uniform:   [0.5, 1.5] * mean_s 均匀分布
+      - lognormal: 均值约为 mean_s 的对数正态分布（长尾，接近真实网络调用）
+    """
+
+    def __init__(
+        self,
+        mean_s: float = 1.0,
+        latency_dist: str = "lognormal",
+        sigma: float = 0.5,
+        chunks: int = 5,
+        chunk_interval_s: float = 0.05,
+        seed: Optional[int] = None,
+    ):
+        if latency_dist not in ("fixed", "uniform", "lognormal"):
+            raise ValueError(f"未知的延迟分布: {latency_dist}")
+        self.api_key = "fake"
+        self.mean_s = mean_s
+        self.latency_dist = latency_dist
+        self.sigma = sigma
+        self.chunks = max(1, chunks)
+        self.chunk_interval_s = chunk_interval_s
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.max_in_flight = 0
+        self._in_flight = 0
+
+    def ensure_ready(self) -> Optional[str]:
+        return None
+
+    def _sample_latency(self) -> float:
+        with self._lock:
+            if self.latency_dist == "fixed":
+                return self.mean_s
+            if self.latency_dist == "uniform":
+                return self._rng.uniform(0.5, 1.5) * self.mean_s
+            # lognormal: E[X] = exp(mu + sigma^2 / 2)
+            mu = math.log(max(self.mean_s, 1e-9)) - self.sigma ** 2 / 2
+            return self._rng.lognormvariate(mu, self.sigma)
+
+    def stream_transcribe_file(self, segment_file: Path) -> Iterable[str]:
+        return self._stream(Path(segment_file).stem)
+
+    def stream_transcribe_bytes(self, data: bytes, fmt: str = "mp3") -> Iterable[str]:
+        return self._stream(f"mem{len(data)}")
+
+    def _stream(self, label: str) -> Iterable[str]:
+        latency = self._sample_latency()
+        with self._lock:
+            self.calls += 1
+            self._in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self._in_flight)
+        try:
+            time.sleep(latency)
+            text = ""
+            for i in range(self.chunks):
+                text += f"[{label}#{i}]"
+                yield text
+                time.sleep(self.chunk_interval_s)
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
@@ -0,0 +1,169 @@
+"""本地假 DashScope 服务：实现多模态生成接口的流式（SSE）响应，可注入失败与延迟。
+
+单独运行:
+    python benchmarks/fake_dashscope.py --port 8089 --throttle 0.2 --error 0.1 --drop 0.05
+然后设置 DASHSCOPE_HTTP_BASE_URL=http://127.0.0.1:8089/api/v1 启动应用，即可在不调用真实服务的情况下
+观察重试、截止时间与熔断的行为。
+
+注入的失败（按请求独立抽样）:
+  - throttle: 返回 429 Throttling.RateQuota
+  - error:    返回 500 InternalError
+  - drop:     正常输出若干 chunk 后直接断开连接
+  - stall:    首包前额外等待 stall_s 秒（用于触发截止时间）
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+GENERATION_PATH = "/api/v1/services/aigc/multimodal-generation/generation"
+
+
+class FakeDashScope:
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency_s: float = 0.2,
+        chunks: int = 5,
+        chunk_interval_s: float = 0.02,
+        throttle: float = 0.0,
+        error: float = 0.0,
+        drop: float = 0.0,
+        stall: float = 0.0,
+        stall_s: float = 5.0,
+        seed: Optional[int] = None,
+    ):
+        self.latency_s = latency_s
+        self.chunks = max(1, chunks)
+        self.chunk_interval_s = chunk_interval_s
+        self.rates = {"throttle": throttle, "error": error, "drop": drop, "stall": stall}
+        self.stall_s = stall_s
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.counts = {"requests": 0, "ok": 0, "throttle": 0, "error": 0, "drop": 0, "stall": 0}
+        self.server = ThreadingHTTPServer((host, port), self._handler_class())
+        self.server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/api/v1"
+
+    def start(self) -> "FakeDashScope":
+        self._thread = threading.Thread(target=self.server.serve_forever, name="fake-dashscope", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _pick_failure(self) -> Optional[str]:
+        with self._lock:
+            self.counts["requests"] += 1
+            roll = self._rng.random()
+            for kind, rate in self.rates.items():
+                if roll < rate:
+                    self.counts[kind] += 1
+                    return kind
+                roll -= rate
+            self.counts["ok"] += 1
+            return None
+
+    def _handler_class(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args) -> None:
+                pass
+
+            def _json(self, status: int, body: dict) -> None:
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self) -> None:
+                length = int(self.headers.get("Content-Length") or 0)
+                self.rfile.read(length)
+                request_id = str(uuid.uuid4())
+                if self.path.rstrip("/") != GENERATION_PATH:
+                    self._json(404, {"code": "NotFound", "message": self.path, "request_id": request_id})
+                    return
+
+                failure = fake._pick_failure()
+                time.sleep(fake.latency_s + (fake.stall_s if failure == "stall" else 0))
+                if failure == "throttle":
+                    self._json(429, {"code": "Throttling.RateQuota", "message": "Requests rate limit exceeded", "request_id": request_id})
+                    return
+                if failure == "error":
+                    self._json(500, {"code": "InternalError", "message": "Injected failure", "request_id": request_id})
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream;charset=UTF-8")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                text = ""
+                for i in range(fake.chunks):
+                    if failure == "drop" and i == fake.chunks // 2:
+                        # 不发送结束标记直接断开，模拟中途掉线
+                        self.close_connection = True
+                        return
+                    text += f"[{request_id[:8]}#{i}]"
+                    payload = {
+                        "output": {"choices": [{
+                            "finish_reason": "stop" if i == fake.chunks - 1 else "null",
+                            "message": {"role": "assistant", "content": [{"text": text}]},
+                        }]},
+                        "usage": {},
+                        "request_id": request_id,
+                    }
+                    frame = f"id:{i + 1}\nevent:result\n:HTTP_STATUS/200\ndata:{json.dumps(payload, ensure_ascii=False)}\n\n"
+                    self.wfile.write(frame.encode("utf-8"))
+                    self.wfile.flush()
+                    time.sleep(fake.chunk_interval_s)
+                self.close_connection = True
+
+        return Handler
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=0.2, help="首包延迟（秒）")
+    parser.add_argument("--throttle", type=float, default=0.0)
+    parser.add_argument("--error", type=float, default=0.0)
+    parser.add_argument("--drop", type=float, default=0.0)
+    parser.add_argument("--stall", type=float, default=0.0)
+    parser.add_argument("--stall-seconds", type=float, default=5.0)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    fake = FakeDashScope(
+        args.host, args.port, latency_s=args.latency, throttle=args.throttle, error=args.error,
+        drop=args.drop, stall=args.stall, stall_s=args.stall_seconds, seed=args.seed,
+    )
+    print(f"Fake DashScope listening on {fake.base_url}")
+    try:
+        fake.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(json.dumps(fake.counts))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,229 @@
+"""分片缓存的持久化索引与容量/时间淘汰。
+
+索引记录每个缓存文件的大小与最近访问时间，并按缓存目录汇总大小，
+因此查询缓存占用无需遍历磁盘；超出容量预算时按最近最少使用（LRU）淘汰，超过最长保留时间的条目也会被清理。
+转录进行中的缓存目录被固定（pin），其中已切分、尚未送往 ASR 的片段不会被淘汰。
+"""
+from __future__ import annotations
+
+import shutil
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from audio_splitter import SEGMENT_EXTENSIONS
+
+CACHE_DIR_PREFIX = "cache_"
+EVICT_BATCH = 64
+
+
+class CacheManager:
+    def __init__(self, base_dir: Path, max_bytes: int = 0, max_age_s: float = 0, index_path: Optional[Path] = None):
+        # max_bytes / max_age_s 为 0 表示不限制
+        self.base_dir = Path(base_dir)
+        self.max_bytes = int(max_bytes)
+        self.max_age_s = float(max_age_s)
+        self.base_dir.mkdir(parents=True, exist_ok=True)
+        self.index_path = Path(index_path) if index_path else self.base_dir / "cache_index.sqlite3"
+        self._lock = threading.Lock()
+        # 缓存目录名 -> 正在使用它的转录数
+        self._pinned: Dict[str, int] = {}
+        self._conn = sqlite3.connect(str(self.index_path), check_same_thread=False)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS entries (
+                    path TEXT PRIMARY KEY,
+                    dir TEXT NOT NULL,
+                    size_bytes INTEGER NOT NULL,
+                    last_access REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_entries_access ON entries (last_access);
+                CREATE TABLE IF NOT EXISTS dirs (
+                    dir TEXT PRIMARY KEY,
+                    size_bytes INTEGER NOT NULL,
+                    entries INTEGER NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS meta (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL
+                );
+                """
+            )
+            self._conn.commit()
+            scanned = self._conn.execute("SELECT value FROM meta WHERE key = 'scanned'").fetchone()
+        if not scanned:
+            # 首次启用索引时扫描一次已有缓存，之后只增量维护
+            self.rebuild()
+        self.evict()
+
+    # ---------- 内部工具 ----------
+    def _relpath(self, path: Path) -> Tuple[str, str]:
+        rel = Path(path).resolve().relative_to(self.base_dir.resolve())
+        return rel.as_posix(), rel.parts[0]
+
+    def _add_locked(self, rel: str, dir_name: str, size: int, now: float) -> None:
+        old = self._conn.execute("SELECT size_bytes FROM entries WHERE path = ?", (rel,)).fetchone()
+        self._conn.execute(
+            "INSERT OR REPLACE INTO entries (path, dir, size_bytes, last_access) VALUES (?, ?, ?, ?)",
+            (rel, dir_name, size, now),
+        )
+        delta_size = size - (old[0] if old else 0)
+        delta_entries = 0 if old else 1
+        self._conn.execute(
+            "INSERT INTO dirs (dir, size_bytes, entries) VALUES (?, ?, ?) "
+            "ON CONFLICT(dir) DO UPDATE SET size_bytes = size_bytes + ?, entries = entries + ?",
+            (dir_name, delta_size, delta_entries, delta_size, delta_entries),
+        )
+
+    def _unpinned_locked(self) -> Tuple[str, List[str]]:
+        # 排除固定目录的 SQL 条件与参数
+        if not self._pinned:
+            return "1", []
+        return f"dir NOT IN ({','.join('?' * len(self._pinned))})", list(self._pinned)
+
+    def _remove_locked(self, rows: List[Tuple[str, str, int]]) -> None:
+        for rel, dir_name, size in rows:
+            try:
+                (self.base_dir / rel).unlink()
+            except FileNotFoundError:
+                pass
+            except OSError:
+                # 文件可能正被占用（如 Windows），保留索引待下次再试
+                continue
+            self._conn.execute("DELETE FROM entries WHERE path = ?", (rel,))
+            self._conn.execute(
+                "UPDATE dirs SET size_bytes = size_bytes - ?, entries = entries - 1 WHERE dir = ?",
+                (size, dir_name),
+            )
+        for (dir_name,) in self._conn.execute("SELECT dir FROM dirs WHERE entries <= 0").fetchall():
+            self._conn.execute("DELETE FROM dirs WHERE dir = ?", (dir_name,))
+            try:
+                (self.base_dir / dir_name).rmdir()
+            except OSError:
+                pass
+
+    # ---------- 对外接口 ----------
+    def add(self, path: Path) -> None:
+        # 新写入的缓存文件登记入索引，随后检查容量预算
+        try:
+            size = Path(path).stat().st_size
+        except OSError:
+            return
+        rel, dir_name = self._relpath(path)
+        with self._lock:
+            self._add_locked(rel, dir_name, size, time.time())
+            self._conn.commit()
+        self.evict()
+
+    def touch(self, path: Path) -> None:
+        # 命中缓存时刷新最近访问时间；索引中没有的文件（如索引建立后手动放入）补登记
+        rel, _ = self._relpath(path)
+        with self._lock:
+            cur = self._conn.execute("UPDATE entries SET last_access = ? WHERE path = ?", (time.time(), rel))
+            self._conn.commit()
+        if cur.rowcount == 0:
+            self.add(path)
+
+    def pin(self, cache_dir: Path) -> None:
+        # 转录开始时固定其缓存目录，可重入（多个转录共用同一目录时按次数计）
+        _, dir_name = self._relpath(cache_dir)
+        with self._lock:
+            self._pinned[dir_name] = self._pinned.get(dir_name, 0) + 1
+
+    def unpin(self, cache_dir: Path) -> None:
+        _, dir_name = self._relpath(cache_dir)
+        with self._lock:
+            count = self._pinned.get(dir_name, 0) - 1
+            if count > 0:
+                self._pinned[dir_name] = count
+            else:
+                self._pinned.pop(dir_name, None)
+
+    def total_bytes(self) -> int:
+        with self._lock:
+            row = self._conn.execute("SELECT COALESCE(SUM(size_bytes), 0) FROM dirs").fetchone()
+        return int(row[0])
+
+    def info(self) -> Dict:
+        with self._lock:
+            rows = self._conn.execute("SELECT dir, size_bytes, entries FROM dirs ORDER BY dir").fetchall()
+        caches = [{"dir": d, "size_bytes": size, "entries": n} for d, size, n in rows]
+        return {
+            "size_bytes": sum(c["size_bytes"] for c in caches),
+            "max_bytes": self.max_bytes,
+            "caches": caches,
+        }
+
+    def evict(self) -> int:
+        # 先淘汰超过最长保留时间的条目，再按 LRU 淘汰直到不超过容量预算；固定的目录不参与淘汰
+        evicted = 0
+        with self._lock:
+            unpinned, pinned = self._unpinned_locked()
+            if self.max_age_s > 0:
+                rows = self._conn.execute(
+                    f"SELECT path, dir, size_bytes FROM entries WHERE last_access < ? AND {unpinned}",
+                    (time.time() - self.max_age_s, *pinned),
+                ).fetchall()
+                self._remove_locked(rows)
+                evicted += len(rows)
+            if self.max_bytes > 0:
+                while True:
+                    total = self._conn.execute("SELECT COALESCE(SUM(size_bytes), 0) FROM dirs").fetchone()[0]
+                    if total <= self.max_bytes:
+                        break
+                    rows = self._conn.execute(
+                        f"SELECT path, dir, size_bytes FROM entries WHERE {unpinned} ORDER BY last_access LIMIT ?",
+                        (*pinned, EVICT_BATCH),
+                    ).fetchall()
+                    if not rows:
+                        break
+                    # 只删到刚好满足预算为止
+                    needed, batch = total - self.max_bytes, []
+                    for row in rows:
+                        batch.append(row)
+                        needed -= row[2]
+                        if needed <= 0:
+                            break
+                    before = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+                    self._remove_locked(batch)
+                    removed = before - self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+                    evicted += removed
+                    if removed == 0:
+                        break
+            self._conn.commit()
+        return evicted
+
+    def clear(self) -> int:
+        cleared = 0
+        with self._lock:
+            for d in self.base_dir.iterdir():
+                if d.is_dir() and d.name.startswith(CACHE_DIR_PREFIX):
+                    shutil.rmtree(d, ignore_errors=True)
+                    cleared += 1
+            self._conn.execute("DELETE FROM entries")
+            self._conn.execute("DELETE FROM dirs")
+            self._conn.commit()
+        return cleared
+
+    def rebuild(self) -> None:
+        # 全量扫描缓存目录重建索引（仅在索引首次创建时执行）
+        now = time.time()
+        with self._lock:
+            self._conn.execute("DELETE FROM entries")
+            self._conn.execute("DELETE FROM dirs")
+            for d in self.base_dir.iterdir():
+                if not (d.is_dir() and d.name.startswith(CACHE_DIR_PREFIX)):
+                    continue
+                for p in [f for ext in SEGMENT_EXTENSIONS for f in d.glob(f"*.{ext}")]:
+                    try:
+                        st = p.stat()
+                    except OSError:
+                        continue
+                    rel, dir_name = self._relpath(p)
+                    self._add_locked(rel, dir_name, st.st_size, min(now, st.st_mtime))
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('scanned', ?)", (str(now),))
+            self._conn.commit()
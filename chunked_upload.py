@@ -0,0 +1,175 @@
+"""分块、可续传的上传会话。
+
+流程：init 创建会话 -> 按顺序 PUT 各分块（offset 必须等于已接收字节数）-> complete 校验大小并落盘。
+分块直接追加写入 .part 文件，内存占用只与单次读取的缓冲区大小有关；sha256 在接收过程中增量计算，
+服务重启后续传时会先读一遍已接收部分恢复哈希状态。
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import BinaryIO, Dict, Optional, Tuple
+
+READ_BUFFER_SIZE = 1024 * 1024
+SESSION_TTL_S = 24 * 3600
+
+
+def remove_empty_dir(path: Path) -> None:
+    try:
+        path.rmdir()
+    except OSError:
+        pass
+
+
+class UploadError(Exception):
+    """上传会话相关错误，status 为建议返回的 HTTP 状态码。"""
+
+    def __init__(self, message: str, status: int = 400, extra: Optional[Dict] = None):
+        super().__init__(message)
+        self.status = status
+        self.extra = extra or {}
+
+
+class UploadManager:
+    def __init__(self, upload_dir: Path, session_ttl_s: float = SESSION_TTL_S):
+        self.upload_dir = Path(upload_dir)
+        self.partial_dir = self.upload_dir / ".partial"
+        self.partial_dir.mkdir(parents=True, exist_ok=True)
+        self.session_ttl_s = session_ttl_s
+        self._lock = threading.Lock()
+        self._session_locks: Dict[str, threading.Lock] = {}
+        # upload_id -> (hasher, 已计入哈希的字节数)
+        self._hashers: Dict[str, Tuple["hashlib._Hash", int]] = {}
+
+    # ---------- 内部工具 ----------
+    def _meta_path(self, upload_id: str) -> Path:
+        return self.partial_dir / f"{upload_id}.json"
+
+    def _part_path(self, upload_id: str) -> Path:
+        return self.partial_dir / f"{upload_id}.part"
+
+    def _session_lock(self, upload_id: str) -> threading.Lock:
+        with self._lock:
+            return self._session_locks.setdefault(upload_id, threading.Lock())
+
+    def _load(self, upload_id: str) -> Dict:
+        # upload_id 由服务端生成，只允许十六进制字符，防止路径穿越
+        if not upload_id or not all(c in "0123456789abcdef" for c in upload_id):
+            raise UploadError("无效的上传 ID", 404)
+        try:
+            return json.loads(self._meta_path(upload_id).read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            raise UploadError("上传会话不存在或已过期", 404)
+
+    def _received(self, upload_id: str) -> int:
+        try:
+            return self._part_path(upload_id).stat().st_size
+        except FileNotFoundError:
+            return 0
+
+    def _hasher_for(self, upload_id: str, received: int):
+        hasher, hashed = self._hashers.get(upload_id, (None, -1))
+        if hasher is None or hashed != received:
+            # 服务重启或状态不一致：从已接收的数据重建哈希状态
+            hasher = hashlib.sha256()
+            with open(self._part_path(upload_id), "rb") as f:
+                for chunk in iter(lambda: f.read(READ_BUFFER_SIZE), b""):
+                    hasher.update(chunk)
+        return hasher
+
+    def _drop(self, upload_id: str) -> None:
+        self._hashers.pop(upload_id, None)
+        for p in (self._meta_path(upload_id), self._part_path(upload_id)):
+            try:
+                p.unlink()
+            except FileNotFoundError:
+                pass
+        with self._lock:
+            self._session_locks.pop(upload_id, None)
+
+    def cleanup_expired(self) -> int:
+        removed = 0
+        deadline = time.time() - self.session_ttl_s
+        for meta in self.partial_dir.glob("*.json"):
+            try:
+                if meta.stat().st_mtime < deadline:
+                    self._drop(meta.stem)
+                    removed += 1
+            except OSError:
+                pass
+        return removed
+
+    # ---------- 对外接口 ----------
+    def init(self, filename: str, size: int) -> Dict:
+        if size <= 0:
+            raise UploadError("文件大小必须大于0")
+        self.cleanup_expired()
+        upload_id = uuid.uuid4().hex
+        self._part_path(upload_id).touch()
+        self._meta_path(upload_id).write_text(
+            json.dumps({"filename": filename, "size": size, "created_at": time.time()}), encoding="utf-8"
+        )
+        self._hashers[upload_id] = (hashlib.sha256(), 0)
+        return {"upload_id": upload_id, "filename": filename, "size": size, "received": 0}
+
+    def status(self, upload_id: str) -> Dict:
+        meta = self._load(upload_id)
+        return {"upload_id": upload_id, "filename": meta["filename"], "size": meta["size"],
+                "received": self._received(upload_id)}
+
+    def put_chunk(self, upload_id: str, offset: int, stream: BinaryIO, max_bytes: int) -> Dict:
+        with self._session_lock(upload_id):
+            meta = self._load(upload_id)
+            received = self._received(upload_id)
+            if offset != received:
+                # 客户端据此从 received 处续传
+                raise UploadError("分块偏移与已接收字节数不一致", 409, {"received": received})
+
+            hasher = self._hasher_for(upload_id, received)
+            written = 0
+            try:
+                with open(self._part_path(upload_id), "ab") as out:
+                    while True:
+                        buf = stream.read(READ_BUFFER_SIZE)
+                        if not buf:
+                            break
+                        written += len(buf)
+                        if written > max_bytes or received + written > meta["size"]:
+                            raise UploadError("分块超出允许的大小", 413)
+                        out.write(buf)
+                        hasher.update(buf)
+            except BaseException:
+                # 分块未完整接收（连接中断或超限）：回退到分块起点，保证文件与哈希状态一致
+                with open(self._part_path(upload_id), "ab") as out:
+                    out.truncate(received)
+                self._hashers.pop(upload_id, None)
+                raise
+
+            self._hashers[upload_id] = (hasher, received + written)
+            # 刷新修改时间，活跃会话不会被当作过期清理
+            os.utime(self._meta_path(upload_id))
+            return {"upload_id": upload_id, "received": received + written, "size": meta["size"]}
+
+    def complete(self, upload_id: str, target: Path) -> Tuple[Path, str]:
+        with self._session_lock(upload_id):
+            meta = self._load(upload_id)
+            received = self._received(upload_id)
+            if received != meta["size"]:
+                raise UploadError("文件尚未接收完整", 409, {"received": received, "size": meta["size"]})
+            content_hash = self._hasher_for(upload_id, received).hexdigest()
+            # 目标目录在校验通过后才创建，失败的 complete 不会留下空目录
+            created = not target.parent.exists()
+            target.parent.mkdir(parents=True, exist_ok=True)
+            try:
+                os.replace(self._part_path(upload_id), target)
+            except OSError:
+                if created:
+                    remove_empty_dir(target.parent)
+                raise
+            self._drop(upload_id)
+        return target, content_hash
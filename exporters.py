@@ -0,0 +1,105 @@
+"""转录结果导出：纯文本、SRT / WebVTT 字幕与 JSON。
+
+输入为按时间排序的片段列表，每项为 {"timestamp": 起点秒, "duration": 时长秒, "text": 文本}，
+与 segment_done 事件的字段一致。iter_export 逐段产出文本块，可直接作为 HTTP 流式响应体。
+"""
+from __future__ import annotations
+
+import json
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+EXPORT_FORMATS = ("txt", "srt", "vtt", "json")
+
+CONTENT_TYPES = {
+    "txt": "text/plain; charset=utf-8",
+    "srt": "application/x-subrip; charset=utf-8",
+    "vtt": "text/vtt; charset=utf-8",
+    "json": "application/json; charset=utf-8",
+}
+
+
+def _srt_time(seconds: float, sep: str = ",") -> str:
+    # SRT 的毫秒分隔符为逗号，WebVTT 为句点
+    ms = max(0, int(round(seconds * 1000)))
+    h, ms = divmod(ms, 3600_000)
+    m, ms = divmod(ms, 60_000)
+    s, ms = divmod(ms, 1000)
+    return f"{h:02d}:{m:02d}:{s:02d}{sep}{ms:03d}"
+
+
+def _cues(segments: Iterable[Dict]) -> Iterator[Tuple[float, float, str]]:
+    # 跳过空文本的片段，返回 (起点, 终点, 文本)
+    for seg in segments:
+        text = seg.get("text", "").strip()
+        if text:
+            start = float(seg["timestamp"])
+            yield start, start + float(seg.get("duration") or 0), text
+
+
+def iter_txt(segments: Iterable[Dict]) -> Iterator[str]:
+    for _, _, text in _cues(segments):
+        yield f"{text}\n"
+
+
+def iter_srt(segments: Iterable[Dict]) -> Iterator[str]:
+    for n, (start, end, text) in enumerate(_cues(segments), 1):
+        sep = "\n" if n > 1 else ""
+        yield f"{sep}{n}\n{_srt_time(start)} --> {_srt_time(end)}\n{text}\n"
+
+
+def iter_vtt(segments: Iterable[Dict]) -> Iterator[str]:
+    yield "WEBVTT\n"
+    for start, end, text in _cues(segments):
+        # 空行表示 cue 结束，文本中的空行会截断 cue
+        text = "\n".join(line for line in text.splitlines() if line.strip())
+        yield f"\n{_srt_time(start, '.')} --> {_srt_time(end, '.')}\n{text}\n"
+
+
+def iter_json(segments: Iterable[Dict], meta: Optional[Dict] = None) -> Iterator[str]:
+    # 与 to_json 结构相同（meta 字段 + segments 列表），每个片段一行
+    head = json.dumps(meta or {}, ensure_ascii=False)[:-1]
+    yield head + (", " if meta else "") + '"segments": ['
+    for i, seg in enumerate(segments):
+        yield ("\n" if i == 0 else ",\n") + json.dumps(seg, ensure_ascii=False)
+    yield "\n]}\n"
+
+
+def to_txt(segments: Iterable[Dict]) -> str:
+    return "".join(iter_txt(segments))
+
+
+def to_srt(segments: Iterable[Dict]) -> str:
+    return "".join(iter_srt(segments))
+
+
+def to_vtt(segments: Iterable[Dict]) -> str:
+    return "".join(iter_vtt(segments))
+
+
+def to_json(segments: Iterable[Dict], meta: Optional[Dict] = None) -> str:
+    return json.dumps({**(meta or {}), "segments": list(segments)}, ensure_ascii=False, indent=2)
+
+
+EXPORTERS: Dict[str, Callable[[List[Dict]], str]] = {
+    "txt": to_txt,
+    "srt": to_srt,
+    "vtt": to_vtt,
+    "json": to_json,
+}
+
+
+def export(segments: List[Dict], fmt: str, meta: Optional[Dict] = None) -> str:
+    if fmt not in EXPORTERS:
+        raise ValueError(f"不支持的导出格式: {fmt}，可选: {list(EXPORT_FORMATS)}")
+    if fmt == "json":
+        return to_json(segments, meta)
+    return EXPORTERS[fmt](segments)
+
+
+def iter_export(segments: Iterable[Dict], fmt: str, meta: Optional[Dict] = None) -> Iterator[str]:
+    # 流式导出：不把全部片段读入内存
+    if fmt not in EXPORTERS:
+        raise ValueError(f"不支持的导出格式: {fmt}，可选: {list(EXPORT_FORMATS)}")
+    if fmt == "json":
+        return iter_json(segments, meta)
+    return {"txt": iter_txt, "srt": iter_srt, "vtt": iter_vtt}[fmt](segments)
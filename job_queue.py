@@ -0,0 +1,426 @@
+"""后台转录队列：转录在工作线程中运行，与 SSE 连接解耦。
+
+每次转录（run）及其产生的全部事件都持久化在 SQLite 中，事件按 run 内自增序号（seq）保存，
+SSE 连接只是事件日志的读者：断线后可凭 Last-Event-ID 续读，服务重启后未完成的 run 会重新入队。
+高频的 delta / progress 事件先写入内存，按间隔或随下一个其他事件批量提交；结束超过保留期的 run 连同事件一起清理。
+
+run 按音频内容与转录参数寻址：不同任务（上传）对同一内容、同一区间与 ASR 配置的请求共享同一个 run，
+只切分、转录一次，发起请求的任务都登记为该 run 的订阅者。
+每个 run 最近的事件同时保存在内存环形缓冲中，实时跟读的 SSE 连接不必每次查询 SQLite。
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+from pathlib import Path
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+from log_setup import log_context
+from metrics import EVENT_READS_TOTAL, RUN_SUBMISSIONS_TOTAL
+
+logger = logging.getLogger(__name__)
+
+# run 状态
+RUN_QUEUED = "queued"
+RUN_RUNNING = "running"
+RUN_DONE = "done"
+RUN_ERROR = "error"
+RUN_FINISHED = (RUN_DONE, RUN_ERROR)
+
+READ_BATCH = 500
+
+# 可以缓冲后批量提交的高频事件，以及缓冲的最长时间（秒）与最大条数
+BUFFERED_EVENTS = ("delta", "progress")
+FLUSH_INTERVAL_S = 0.5
+FLUSH_BATCH = 200
+# 两次清理过期 run 之间的最短间隔（秒）
+PRUNE_INTERVAL_S = 3600
+
+# 不参与 run 寻址的参数：同一内容的不同上传文件名与存放路径不同，但转录结果相同
+UNKEYED_PARAMS = ("filename", "audio_file")
+
+
+def run_id_for(params: Dict) -> str:
+    # 同一音频内容 + 同一参数对应同一个 run，重复请求、其他任务的相同请求与断线重连都会附着到已有 run 上
+    keyed = {k: v for k, v in params.items() if k not in UNKEYED_PARAMS}
+    raw = json.dumps(keyed, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+
+
+class EventRing:
+    """各 run 最近 size 个事件的内存副本；最多保留 max_runs 个 run，最久未访问的先淘汰。
+
+    只缓存日志的尾部：读取起点早于缓冲区时返回 None，由调用方回退到 SQLite。
+    """
+
+    def __init__(self, size: int = 1024, max_runs: int = 64):
+        self.size = max(1, int(size))
+        self.max_runs = max(1, int(max_runs))
+        self._runs: "OrderedDict[str, Deque[Tuple[int, str]]]" = OrderedDict()
+
+    def append(self, run_id: str, seq: int, data: str) -> None:
+        events = self._runs.get(run_id)
+        if events is None or (events and events[-1][0] != seq - 1):
+            # 新 run，或缓冲区与日志不再连续（如进程内其他途径写入）：从当前事件重新开始
+            events = self._runs[run_id] = deque(maxlen=self.size)
+        events.append((seq, data))
+        self._runs.move_to_end(run_id)
+        while len(self._runs) > self.max_runs:
+            self._runs.popitem(last=False)
+
+    def read(self, run_id: str, after_seq: int, limit: int) -> Optional[List[Tuple[int, str]]]:
+        events = self._runs.get(run_id)
+        if not events or events[0][0] > after_seq + 1:
+            return None
+        self._runs.move_to_end(run_id)
+        start = max(0, after_seq + 1 - events[0][0])
+        return [events[i] for i in range(start, min(len(events), start + limit))]
+
+    def discard(self, run_id: str) -> None:
+        self._runs.pop(run_id, None)
+
+
+class TranscriptionQueue:
+    def __init__(
+        self,
+        db_path: Path,
+        runner: Callable[[Dict, Callable[[Dict], None]], None],
+        workers: int = 2,
+        buffer_events: int = 1024,
+        buffer_runs: int = 64,
+        retention_s: float = 7 * 86400,
+    ):
+        # runner(run, emit)：执行一次转录，通过 emit 输出事件，正常结束前应输出 done 事件；
+        # retention_s：已结束的 run 及其事件保留的时长（秒），<=0 表示不清理
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.runner = runner
+        self.workers = max(1, int(workers))
+        self.retention_s = float(retention_s)
+        self._lock = threading.Lock()
+        # 有新事件或 run 状态变化时通知等待中的 SSE 读者
+        self._changed = threading.Condition(self._lock)
+        self._last_seq: Dict[str, int] = {}
+        self._ring = EventRing(buffer_events, buffer_runs)
+        # 尚未写入 SQLite 的事件 (run_id, seq, data, created_at)，内存缓冲中已可读到
+        self._unflushed: List[Tuple[str, int, str, float]] = []
+        self._flushed_at = time.monotonic()
+        self._pruned_at = 0.0
+        # run_id -> 订阅该 run 的任务（发起者在前）
+        self._subscribers: Dict[str, List[str]] = {}
+        self._pending: "queue.Queue[str]" = queue.Queue()
+        self._threads: List[threading.Thread] = []
+        # 事件或状态变化时的回调（在工作线程中调用，参数为 run_id），供异步读者唤醒自己的事件循环
+        self._listeners: List[Callable[[str], None]] = []
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS runs (
+                    run_id TEXT PRIMARY KEY,
+                    job_id TEXT NOT NULL,
+                    params TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_runs_status ON runs (status);
+                CREATE TABLE IF NOT EXISTS run_events (
+                    run_id TEXT NOT NULL,
+                    seq INTEGER NOT NULL,
+                    data TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (run_id, seq)
+                );
+                CREATE TABLE IF NOT EXISTS run_subscribers (
+                    run_id TEXT NOT NULL,
+                    job_id TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (run_id, job_id)
+                );
+                """
+            )
+            self._conn.commit()
+
+    # ---------- 内部工具 ----------
+    @staticmethod
+    def _row_to_run(row) -> Dict:
+        run_id, job_id, params, status, error, created_at, updated_at = row
+        return {
+            "run_id": run_id,
+            "job_id": job_id,
+            "params": json.loads(params),
+            "status": status,
+            "error": error,
+            "created_at": created_at,
+            "updated_at": updated_at,
+        }
+
+    def _get_locked(self, run_id: str) -> Optional[Dict]:
+        row = self._conn.execute(
+            "SELECT run_id, job_id, params, status, error, created_at, updated_at FROM runs WHERE run_id = ?",
+            (run_id,),
+        ).fetchone()
+        return self._row_to_run(row) if row else None
+
+    def _last_seq_locked(self, run_id: str) -> int:
+        seq = self._last_seq.get(run_id)
+        if seq is None:
+            row = self._conn.execute("SELECT MAX(seq) FROM run_events WHERE run_id = ?", (run_id,)).fetchone()
+            seq = self._last_seq[run_id] = row[0] or 0
+        return seq
+
+    def _subscribers_locked(self, run_id: str) -> List[str]:
+        jobs = self._subscribers.get(run_id)
+        if jobs is None:
+            rows = self._conn.execute(
+                "SELECT job_id FROM run_subscribers WHERE run_id = ? ORDER BY created_at", (run_id,),
+            ).fetchall()
+            jobs = self._subscribers[run_id] = [job_id for (job_id,) in rows]
+        return jobs
+
+    def _subscribe_locked(self, run_id: str, job_id: str) -> bool:
+        # 返回该任务是否为新订阅者
+        jobs = self._subscribers_locked(run_id)
+        if job_id in jobs:
+            return False
+        self._conn.execute(
+            "INSERT OR IGNORE INTO run_subscribers (run_id, job_id, created_at) VALUES (?, ?, ?)",
+            (run_id, job_id, time.time()),
+        )
+        jobs.append(job_id)
+        return True
+
+    def _flush_locked(self) -> None:
+        # 把缓冲的事件一次写入并提交
+        if self._unflushed:
+            self._conn.executemany(
+                "INSERT INTO run_events (run_id, seq, data, created_at) VALUES (?, ?, ?, ?)", self._unflushed,
+            )
+            self._conn.commit()
+            self._unflushed = []
+        self._flushed_at = time.monotonic()
+
+    def _set_status(self, run_id: str, status: str, error: Optional[str] = None) -> None:
+        with self._lock:
+            self._flush_locked()
+            self._conn.execute(
+                "UPDATE runs SET status = ?, error = ?, updated_at = ? WHERE run_id = ?",
+                (status, error, time.time(), run_id),
+            )
+            self._conn.commit()
+            self._changed.notify_all()
+        self._notify(run_id)
+
+    def _notify(self, run_id: str) -> None:
+        for listener in list(self._listeners):
+            try:
+                listener(run_id)
+            except Exception:
+                logger.exception("[QUEUE] Listener failed")
+
+    def _worker(self) -> None:
+        while True:
+            run_id = self._pending.get()
+            run = self.get(run_id)
+            if run is None or run["status"] != RUN_QUEUED:
+                continue
+            # 本次转录产生的日志（含 ASR 工作线程）都带上 job_id / run_id
+            with log_context(job_id=run["job_id"], run_id=run_id):
+                self._execute(run)
+
+    def _execute(self, run: Dict) -> None:
+        run_id = run["run_id"]
+        self._set_status(run_id, RUN_RUNNING)
+        logger.info("[QUEUE] Run %s started (job %s)", run_id, run["job_id"])
+        errors = 0
+
+        def emit(event: Dict) -> None:
+            nonlocal errors
+            if event.get("type") == "error":
+                errors += 1
+            self.append(run_id, event)
+
+        try:
+            self.runner(run, emit)
+        except Exception as e:
+            logger.exception("[QUEUE] Run %s failed", run_id)
+            self.append(run_id, {"type": "error", "message": str(e)})
+            self.append(run_id, {"type": "done"})
+            self._set_status(run_id, RUN_ERROR, str(e))
+        else:
+            if errors:
+                # 有片段失败（含限流、熔断等临时错误）：记为失败，下次提交时重跑，转录缓存命中的片段不再调用 ASR
+                logger.warning("[QUEUE] Run %s finished with %s errors", run_id, errors)
+                self._set_status(run_id, RUN_ERROR, f"{errors} 个错误")
+            else:
+                self._set_status(run_id, RUN_DONE)
+                logger.info("[QUEUE] Run %s finished", run_id)
+        self.prune()
+
+    # ---------- 对外接口 ----------
+    def prune(self, force: bool = False) -> int:
+        # 删除结束超过保留期的 run 及其事件与订阅记录，返回删除的 run 数；未到清理间隔时直接返回
+        if self.retention_s <= 0:
+            return 0
+        now = time.time()
+        with self._lock:
+            if not force and now - self._pruned_at < PRUNE_INTERVAL_S:
+                return 0
+            self._pruned_at = now
+            self._flush_locked()
+            placeholders = ",".join("?" * len(RUN_FINISHED))
+            run_ids = [run_id for (run_id,) in self._conn.execute(
+                f"SELECT run_id FROM runs WHERE status IN ({placeholders}) AND updated_at < ?",
+                (*RUN_FINISHED, now - self.retention_s),
+            ).fetchall()]
+            for run_id in run_ids:
+                self._conn.execute("DELETE FROM run_events WHERE run_id = ?", (run_id,))
+                self._conn.execute("DELETE FROM run_subscribers WHERE run_id = ?", (run_id,))
+                self._conn.execute("DELETE FROM runs WHERE run_id = ?", (run_id,))
+                self._last_seq.pop(run_id, None)
+                self._subscribers.pop(run_id, None)
+                self._ring.discard(run_id)
+            self._conn.commit()
+        if run_ids:
+            logger.info("[QUEUE] Pruned %s finished runs older than %.0f days", len(run_ids), self.retention_s / 86400)
+        return len(run_ids)
+
+    def start(self) -> None:
+        # 启动工作线程，并把上次进程退出时尚未完成的 run 重新入队；重复调用无副作用
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                t = threading.Thread(target=self._worker, name=f"transcribe-worker-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+            rows = self._conn.execute(
+                "SELECT run_id FROM runs WHERE status IN (?, ?) ORDER BY created_at",
+                (RUN_QUEUED, RUN_RUNNING),
+            ).fetchall()
+            self._conn.execute(
+                "UPDATE runs SET status = ?, updated_at = ? WHERE status = ?",
+                (RUN_QUEUED, time.time(), RUN_RUNNING),
+            )
+            self._conn.commit()
+        self.prune(force=True)
+        for (run_id,) in rows:
+            logger.info("[QUEUE] Resuming unfinished run %s", run_id)
+            # 事件序号在原有日志之后继续，已连接的客户端可以无缝续读
+            self.append(run_id, {"type": "status", "message": "resumed"})
+            self._pending.put(run_id)
+
+    def submit(self, job_id: str, params: Dict) -> Dict:
+        # 返回已有的 run（排队中、运行中或全部片段成功完成），否则新建并入队；失败或有片段出错的 run 清空事件后重跑，
+        # 事件序号接着原有日志，带 Last-Event-ID 重连的客户端直接读到重跑的事件。
+        # 返回值的 subscribed 表示 job_id 是否为该 run 的新订阅者（新建的 run 同样为 True）
+        self.start()
+        run_id = run_id_for(params)
+        now = time.time()
+        with self._lock:
+            run = self._get_locked(run_id)
+            if run is not None and run["status"] != RUN_ERROR:
+                subscribed = self._subscribe_locked(run_id, job_id)
+                self._conn.commit()
+                RUN_SUBMISSIONS_TOTAL.inc(result="attached")
+                return {**run, "subscribed": subscribed}
+            retry_seq = 0
+            if run is not None:
+                retry_seq = self._last_seq_locked(run_id) + 1
+                self._unflushed = [e for e in self._unflushed if e[0] != run_id]
+                self._conn.execute("DELETE FROM run_events WHERE run_id = ?", (run_id,))
+                self._ring.discard(run_id)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO runs (run_id, job_id, params, status, error, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, NULL, ?, ?)",
+                (run_id, job_id, json.dumps(params, ensure_ascii=False), RUN_QUEUED, now, now),
+            )
+            self._subscribe_locked(run_id, job_id)
+            if retry_seq:
+                # 重跑的第一个事件，同时把序号持久化
+                data = json.dumps({"type": "status", "message": "retrying"}, ensure_ascii=False)
+                self._conn.execute(
+                    "INSERT INTO run_events (run_id, seq, data, created_at) VALUES (?, ?, ?, ?)",
+                    (run_id, retry_seq, data, now),
+                )
+                self._last_seq[run_id] = retry_seq
+                self._ring.append(run_id, retry_seq, data)
+            self._conn.commit()
+            run = self._get_locked(run_id)
+        self._pending.put(run_id)
+        RUN_SUBMISSIONS_TOTAL.inc(result="new")
+        logger.info("[QUEUE] Run %s queued (job %s, pending: %s)", run_id, job_id, self._pending.qsize())
+        return {**run, "subscribed": True}
+
+    def subscribers(self, run_id: str) -> List[str]:
+        # 订阅该 run 的任务 ID；旧版本创建的 run 没有订阅记录时返回发起任务
+        with self._lock:
+            jobs = list(self._subscribers_locked(run_id))
+            if not jobs:
+                run = self._get_locked(run_id)
+                if run is not None:
+                    jobs = [run["job_id"]]
+            return jobs
+
+    def add_listener(self, listener: Callable[[str], None]) -> None:
+        self._listeners.append(listener)
+
+    def get(self, run_id: str) -> Optional[Dict]:
+        with self._lock:
+            return self._get_locked(run_id)
+
+    def append(self, run_id: str, event: Dict) -> int:
+        # delta / progress 只在缓冲满或超过间隔时提交，其余事件连同缓冲一起立即提交；
+        # 进程崩溃时最多丢失尚未提交的中间结果，重启后 run 重跑
+        data = json.dumps(event, ensure_ascii=False)
+        with self._lock:
+            seq = self._last_seq_locked(run_id) + 1
+            self._unflushed.append((run_id, seq, data, time.time()))
+            if (event.get("type") not in BUFFERED_EVENTS or len(self._unflushed) >= FLUSH_BATCH
+                    or time.monotonic() - self._flushed_at >= FLUSH_INTERVAL_S):
+                self._flush_locked()
+            self._last_seq[run_id] = seq
+            self._ring.append(run_id, seq, data)
+            self._changed.notify_all()
+        self._notify(run_id)
+        return seq
+
+    def read(self, run_id: str, after_seq: int = 0, limit: int = READ_BATCH) -> List[Tuple[int, str]]:
+        # 返回 seq > after_seq 的事件 (seq, JSON 字符串)，按序号递增；跟读日志尾部时直接取内存缓冲
+        with self._lock:
+            if after_seq >= self._last_seq_locked(run_id):
+                return []
+            rows = self._ring.read(run_id, after_seq, limit)
+            if rows is not None:
+                EVENT_READS_TOTAL.inc(source="memory")
+                return rows
+            EVENT_READS_TOTAL.inc(source="sqlite")
+            self._flush_locked()
+            return self._conn.execute(
+                "SELECT seq, data FROM run_events WHERE run_id = ? AND seq > ? ORDER BY seq LIMIT ?",
+                (run_id, after_seq, limit),
+            ).fetchall()
+
+    def wait(self, run_id: str, after_seq: int, timeout: float) -> bool:
+        # 阻塞直到出现 seq > after_seq 的事件或 run 结束，超时返回 False
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            while True:
+                if self._last_seq_locked(run_id) > after_seq:
+                    return True
+                run = self._get_locked(run_id)
+                if run is None or run["status"] in RUN_FINISHED:
+                    return True
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._changed.wait(remaining)
@@ -0,0 +1,264 @@
+"""转录任务（会话）注册表。
+
+每次上传创建一个任务，任务持有自己的音频文件、内容哈希、转录状态、进度与分段结果，
+不同用户的上传与转录互不干扰。指定 db_path 时任务持久化到 SQLite，服务重启后仍可查询：
+任务状态存于 jobs 表（不含结果），分段结果逐条追加到 job_results 表，进度写入按时间间隔节流。
+"""
+from __future__ import annotations
+
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# 任务状态
+JOB_UPLOADED = "uploaded"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_ERROR = "error"
+
+# 状态变化类型（决定持久化方式）
+CHANGE_STATE = "state"          # 写入任务状态
+CHANGE_START = "start"          # 清空已持久化的结果并写入任务状态
+CHANGE_PROGRESS = "progress"    # 进度变化，按间隔节流写入
+CHANGE_RESULT = "result"        # 只追加一条分段结果
+
+
+def new_job_id() -> str:
+    return uuid.uuid4().hex
+
+
+@dataclass
+class Job:
+    job_id: str
+    filename: str                       # 上传时的文件名（用于显示与导出命名）
+    content_hash: Optional[str] = None
+    # 音频在 uploads 下的存放路径（“任务 ID/文件名”，同名上传互不覆盖）；旧任务为空，与 filename 相同
+    stored_name: Optional[str] = None
+    status: str = JOB_UPLOADED
+    progress: int = 0
+    params: Dict = field(default_factory=dict)
+    # 片段起始时间（秒） -> 该片段转录文本
+    results: Dict[float, str] = field(default_factory=dict)
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    updated_at: float = field(default_factory=time.time)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+    # 状态变化回调（由注册表设置，用于持久化）
+    _on_change: Optional[Callable[["Job", str, Optional[Tuple[float, str]]], None]] = field(
+        default=None, repr=False, compare=False)
+
+    @property
+    def storage_name(self) -> str:
+        return self.stored_name or self.filename
+
+    def _changed(self, kind: str = CHANGE_STATE, result: Optional[Tuple[float, str]] = None) -> None:
+        if self._on_change is not None:
+            self._on_change(self, kind, result)
+
+    def start(self, params: Dict) -> None:
+        with self._lock:
+            self.status = JOB_RUNNING
+            self.progress = 0
+            self.params = dict(params)
+            self.results = {}
+            self.error = None
+            self.updated_at = time.time()
+        self._changed(CHANGE_START)
+
+    def set_progress(self, percent: int) -> None:
+        with self._lock:
+            self.progress = percent
+            self.updated_at = time.time()
+        self._changed(CHANGE_PROGRESS)
+
+    def add_result(self, timestamp: float, text: str) -> None:
+        with self._lock:
+            self.results[timestamp] = text
+            self.updated_at = time.time()
+        self._changed(CHANGE_RESULT, (timestamp, text))
+
+    def finish(self, error: Optional[str] = None) -> None:
+        with self._lock:
+            self.status = JOB_ERROR if error else JOB_DONE
+            self.error = error
+            if not error:
+                self.progress = 100
+            self.updated_at = time.time()
+        self._changed()
+
+    def to_dict(self, include_results: bool = True) -> Dict:
+        with self._lock:
+            data = {
+                "job_id": self.job_id,
+                "filename": self.filename,
+                "url": f"/uploads/{self.storage_name}",
+                "stored_name": self.stored_name,
+                "content_hash": self.content_hash,
+                "status": self.status,
+                "progress": self.progress,
+                "params": dict(self.params),
+                "error": self.error,
+                "created_at": self.created_at,
+                "updated_at": self.updated_at,
+            }
+            if include_results:
+                data["results"] = [{"timestamp": ts, "text": text} for ts, text in sorted(self.results.items())]
+        return data
+
+
+class JobRegistry:
+    """任务表：内存中按创建顺序保留最近 max_jobs 个任务（运行中的任务不会被淘汰）。
+
+    指定 db_path 时状态变化写入 SQLite（每个片段只追加一行结果，进度每 progress_interval 秒最多写一次），
+    内存中没有的任务会从数据库加载。
+    """
+
+    def __init__(self, max_jobs: int = 1000, db_path: Optional[Path] = None, progress_interval: float = 1.0):
+        self.max_jobs = max_jobs
+        self.progress_interval = progress_interval
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._lock = threading.Lock()
+        # 任务 ID -> 上次写入任务状态的时间（仅运行中的任务）
+        self._saved_at: Dict[str, float] = {}
+        self._conn: Optional[sqlite3.Connection] = None
+        if db_path is not None:
+            Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(db_path), check_same_thread=False)
+            with self._lock:
+                self._conn.execute("PRAGMA journal_mode=WAL")
+                self._conn.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS jobs (
+                        job_id TEXT PRIMARY KEY,
+                        data TEXT NOT NULL,
+                        updated_at REAL NOT NULL
+                    )
+                    """
+                )
+                self._conn.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS job_results (
+                        job_id TEXT NOT NULL,
+                        timestamp REAL NOT NULL,
+                        text TEXT NOT NULL,
+                        PRIMARY KEY (job_id, timestamp)
+                    )
+                    """
+                )
+                self._conn.commit()
+
+    def _save(self, job: Job, kind: str = CHANGE_STATE, result: Optional[Tuple[float, str]] = None) -> None:
+        if self._conn is None:
+            return
+        now = time.monotonic()
+        if kind == CHANGE_RESULT:
+            with self._lock:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO job_results (job_id, timestamp, text) VALUES (?, ?, ?)",
+                    (job.job_id, result[0], result[1]),
+                )
+                self._conn.commit()
+            return
+        data = job.to_dict(include_results=False)
+        with self._lock:
+            if kind == CHANGE_PROGRESS and now - self._saved_at.get(job.job_id, 0.0) < self.progress_interval:
+                return
+            if kind == CHANGE_START:
+                self._conn.execute("DELETE FROM job_results WHERE job_id = ?", (job.job_id,))
+            self._conn.execute(
+                "INSERT OR REPLACE INTO jobs (job_id, data, updated_at) VALUES (?, ?, ?)",
+                (job.job_id, json.dumps(data, ensure_ascii=False), data["updated_at"]),
+            )
+            self._conn.commit()
+            if data["status"] == JOB_RUNNING:
+                self._saved_at[job.job_id] = now
+            else:
+                self._saved_at.pop(job.job_id, None)
+
+    def _load_locked(self, job_id: str) -> Optional[Job]:
+        if self._conn is None:
+            return None
+        row = self._conn.execute("SELECT data FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        if not row:
+            return None
+        data = json.loads(row[0])
+        # 旧版本把结果存在任务 JSON 中
+        results = {r["timestamp"]: r["text"] for r in data.get("results") or []}
+        results.update(self._conn.execute(
+            "SELECT timestamp, text FROM job_results WHERE job_id = ?", (job_id,),
+        ).fetchall())
+        job = Job(
+            job_id=data["job_id"],
+            filename=data["filename"],
+            content_hash=data.get("content_hash"),
+            stored_name=data.get("stored_name"),
+            status=data["status"],
+            progress=data["progress"],
+            params=data.get("params") or {},
+            results=results,
+            error=data.get("error"),
+            created_at=data["created_at"],
+            updated_at=data["updated_at"],
+        )
+        return self._add_locked(job)
+
+    def _add_locked(self, job: Job) -> Job:
+        job._on_change = self._save
+        self._jobs[job.job_id] = job
+        for old_id in list(self._jobs):
+            if len(self._jobs) <= self.max_jobs:
+                break
+            if self._jobs[old_id].status != JOB_RUNNING:
+                del self._jobs[old_id]
+        return job
+
+    def create(self, filename: str, content_hash: Optional[str] = None, stored_name: Optional[str] = None,
+               job_id: Optional[str] = None) -> Job:
+        with self._lock:
+            job = self._add_locked(Job(
+                job_id=job_id or new_job_id(), filename=filename, content_hash=content_hash, stored_name=stored_name,
+            ))
+        self._save(job)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id) or self._load_locked(job_id)
+
+    def get_or_create(self, job_id: str, filename: str) -> Job:
+        # 用于固定 ID 的任务（如默认音频文件）
+        with self._lock:
+            job = self._jobs.get(job_id) or self._load_locked(job_id)
+            if job is not None:
+                return job
+            job = self._add_locked(Job(job_id=job_id, filename=filename))
+        self._save(job)
+        return job
+
+    def find_by_content(self, content_hashes: Iterable[str], limit: int = 5) -> Dict[str, List[Dict]]:
+        # 内容哈希 -> 持有该音频的任务（最近更新的在前，每个内容最多 limit 个），用于把搜索结果对应到上传的文件
+        wanted = set(content_hashes)
+        found: Dict[str, List[Dict]] = {h: [] for h in wanted}
+        if not wanted:
+            return found
+        with self._lock:
+            if self._conn is not None:
+                placeholders = ",".join("?" * len(wanted))
+                rows = self._conn.execute(
+                    "SELECT job_id, json_extract(data, '$.filename'), json_extract(data, '$.content_hash') FROM jobs "
+                    f"WHERE json_extract(data, '$.content_hash') IN ({placeholders}) ORDER BY updated_at DESC",
+                    list(wanted),
+                ).fetchall()
+            else:
+                jobs = sorted(self._jobs.values(), key=lambda j: j.updated_at, reverse=True)
+                rows = [(j.job_id, j.filename, j.content_hash) for j in jobs if j.content_hash in wanted]
+        for job_id, filename, content_hash in rows:
+            if len(found[content_hash]) < limit:
+                found[content_hash].append({"job_id": job_id, "filename": filename})
+        return found
@@ -0,0 +1,143 @@
+"""异步、结构化的日志管道。
+
+- 记录日志的线程只把 LogRecord 放入内存队列（QueueHandler），格式化与写控制台/文件由后台 QueueListener 线程完成；
+- 消息使用 %-风格参数延迟格式化：被级别或采样过滤掉的记录不会拼接字符串；
+- 通过 log_context() 绑定的 job_id / run_id / segment 等字段自动附加到同一上下文内的每条日志，
+  JSON 格式下作为独立字段输出，便于按任务、片段检索；
+- 每个 chunk、每次进度更新这类高频日志以 extra=SAMPLED 记录，只按 LOG_SAMPLE_RATE 的比例保留。
+"""
+from __future__ import annotations
+
+import atexit
+import contextvars
+import json
+import logging
+import queue
+import random
+import threading
+from contextlib import contextmanager
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Dict, Iterator, Optional
+
+LOG_FORMAT_TEXT = "text"
+LOG_FORMAT_JSON = "json"
+LOG_FORMATS = (LOG_FORMAT_TEXT, LOG_FORMAT_JSON)
+
+# 高频日志的标记：logger.debug("...", x, extra=SAMPLED)
+SAMPLED = {"sampled": True}
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s%(context)s"
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+_context: contextvars.ContextVar[Dict[str, object]] = contextvars.ContextVar("log_context", default={})
+_listener: Optional[QueueListener] = None
+_setup_lock = threading.Lock()
+
+
+@contextmanager
+def log_context(**fields) -> Iterator[None]:
+    # 在当前上下文（线程 / 协程）内为日志附加字段，可嵌套；新线程需通过 contextvars.copy_context() 继承
+    token = _context.set({**_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _context.reset(token)
+
+
+def current_log_context() -> Dict[str, object]:
+    return dict(_context.get())
+
+
+class ContextFilter(logging.Filter):
+    # 在记录日志的线程上取出上下文字段（后台线程中已无法取得）
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not hasattr(record, "ctx"):
+            record.ctx = _context.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    # 带 sampled 标记的记录按 rate 的比例保留；WARNING 及以上总是保留
+    def __init__(self, rate: float = 1.0, rng: Optional[random.Random] = None):
+        super().__init__()
+        self.rate = min(1.0, max(0.0, float(rate)))
+        self._rng = rng or random.Random()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not getattr(record, "sampled", False) or record.levelno >= logging.WARNING or self.rate >= 1.0:
+            return True
+        return self._rng.random() < self.rate
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__(TEXT_FORMAT, datefmt=DATE_FORMAT)
+
+    def format(self, record: logging.LogRecord) -> str:
+        ctx = getattr(record, "ctx", None)
+        record.context = " [" + " ".join(f"{k}={v}" for k, v in ctx.items()) + "]" if ctx else ""
+        return super().format(record)
+
+
+class JsonFormatter(logging.Formatter):
+    # 每条记录一行 JSON：ts、level、logger、msg，加上下文字段与异常堆栈
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": self.formatTime(record, DATE_FORMAT) + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "thread": record.threadName,
+            **(getattr(record, "ctx", None) or {}),
+        }
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _InProcessQueueHandler(QueueHandler):
+    # 标准 QueueHandler 会在入队前格式化消息（为跨进程传递做准备）；
+    # 监听线程在同一进程内，直接传递原始记录，格式化完全在后台线程完成
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def setup_logging(
+    level: int = logging.INFO,
+    log_file: Optional[str] = "transcription.log",
+    fmt: str = LOG_FORMAT_TEXT,
+    sample_rate: float = 1.0,
+    max_bytes: int = 10 * 1024 * 1024,
+    backup_count: int = 5,
+) -> QueueListener:
+    # 根日志只挂一个 QueueHandler，控制台与轮转文件由后台监听线程写出；重复调用返回已启动的监听器
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            return _listener
+        formatter = JsonFormatter() if fmt == LOG_FORMAT_JSON else TextFormatter()
+        handlers = [logging.StreamHandler()]
+        if log_file:
+            # 轮转日志，默认最大 10MB，保留 5 个备份
+            handlers.append(RotatingFileHandler(log_file, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8"))
+        for handler in handlers:
+            handler.setLevel(level)
+            handler.setFormatter(formatter)
+
+        records: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+        queue_handler = _InProcessQueueHandler(records)
+        queue_handler.setLevel(level)
+        queue_handler.addFilter(SamplingFilter(sample_rate))
+        queue_handler.addFilter(ContextFilter())
+
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(queue_handler)
+        root.setLevel(level)
+
+        _listener = QueueListener(records, *handlers, respect_handler_level=True)
+        _listener.start()
+        # 退出时写完队列中剩余的记录
+        atexit.register(_listener.stop)
+        return _listener
@@ -0,0 +1,226 @@
+"""进程内指标（计数器、仪表、直方图），以 Prometheus 文本格式输出，供 /metrics 抓取。
+
+不依赖 prometheus_client：每次记录只是加锁后更新几个数字，开销可以忽略，
+可以放在切分、编码、ASR 等热点路径上。指标名统一以 v2t_ 为前缀。
+"""
+from __future__ import annotations
+
+import bisect
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# 默认直方图桶（秒）：覆盖从毫秒级的缓存读取到分钟级的长片段转录
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_value(v: float) -> str:
+    if math.isinf(v):
+        return "+Inf" if v > 0 else "-Inf"
+    if float(v).is_integer():
+        return str(int(v))
+    return repr(float(v))
+
+
+def _escape(v: str) -> str:
+    return str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_str(names: Sequence[str], values: LabelValues, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, doc: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.doc = doc
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(n, "")) for n in self.label_names)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        return "\n".join([f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} {self.kind}", *self.samples()])
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, doc: str, labels: Sequence[str] = ()):
+        super().__init__(name, doc, labels)
+        # 无标签的指标从 0 开始输出，便于抓取端区分“为 0”与“不存在”
+        self._values: Dict[LabelValues, float] = {} if self.label_names else {(): 0.0}
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_label_str(self.label_names, k)} {_format_value(v)}" for k, v in items]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, doc: str, labels: Sequence[str] = (), fn: Optional[Callable[[], float]] = None):
+        super().__init__(name, doc, labels)
+        self._values: Dict[LabelValues, float] = {} if self.label_names else {(): 0.0}
+        self._fn = fn    # 给定时在输出时计算（无标签）
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = float(value)
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    @contextmanager
+    def track(self, **labels) -> Iterator[None]:
+        # 进入时 +1，退出时 -1（如活跃连接数）
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+    def samples(self) -> List[str]:
+        if self._fn is not None:
+            return [f"{self.name} {_format_value(self._fn())}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_label_str(self.label_names, k)} {_format_value(v)}" for k, v in items]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, doc: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, doc, labels)
+        self.buckets = tuple(sorted(buckets))
+        # 每组标签：[各桶计数（不累计）..., +Inf 桶计数, 总和]
+        self._values: Dict[LabelValues, List[float]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            row = self._values.get(key)
+            if row is None:
+                row = self._values[key] = [0.0] * (len(self.buckets) + 2)
+            row[i] += 1
+            row[-1] += value
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t0, **labels)
+
+    def count(self, **labels) -> int:
+        with self._lock:
+            row = self._values.get(self._key(labels))
+        return int(sum(row[:-1])) if row else 0
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._values.items())
+        out = []
+        for key, row in items:
+            cumulative = 0.0
+            for bound, n in zip((*self.buckets, math.inf), row[:-1]):
+                cumulative += n
+                le = 'le="' + _format_value(bound) + '"'
+                out.append(f"{self.name}_bucket{_label_str(self.label_names, key, le)} {_format_value(cumulative)}")
+            labels = _label_str(self.label_names, key)
+            out.append(f"{self.name}_sum{labels} {_format_value(row[-1])}")
+            out.append(f"{self.name}_count{labels} {_format_value(cumulative)}")
+        return out
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics)
+        return "\n".join(m.render() for m in metrics) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def counter(name: str, doc: str, labels: Sequence[str] = ()) -> Counter:
+    return REGISTRY.register(Counter(name, doc, labels))
+
+
+def gauge(name: str, doc: str, labels: Sequence[str] = (), fn: Optional[Callable[[], float]] = None) -> Gauge:
+    return REGISTRY.register(Gauge(name, doc, labels, fn))
+
+
+def histogram(name: str, doc: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+    return REGISTRY.register(Histogram(name, doc, labels, buckets))
+
+
+# ========== 转录流水线指标 ==========
+# stage: probe（读取音频信息）、vad（静音分析）、split（切分出一个片段的等待时间）、encode（内存编码一个片段）、
+#        asr_first_text（ASR 首个结果）、asr（单个片段 ASR 总耗时）、pipeline（一次转录的总耗时）
+STAGE_SECONDS = histogram("v2t_stage_seconds", "Latency of each transcription pipeline stage in seconds.", ["stage"])
+SEGMENTS_TOTAL = counter("v2t_segments_total", "Segments finished by the pipeline, by result.", ["result"])
+SEGMENT_BYTES_TOTAL = counter("v2t_segment_bytes_total", "Bytes of encoded audio segments produced, by storage.", ["storage"])
+ASR_ERRORS_TOTAL = counter("v2t_asr_errors_total", "Failed ASR calls, by error type.", ["error"])
+ASR_RETRIES_TOTAL = counter("v2t_asr_retries_total", "ASR call retries after retryable errors.")
+CACHE_LOOKUPS_TOTAL = counter("v2t_cache_lookups_total", "Segment cache lookups, by cache and result.", ["cache", "result"])
+RUN_SUBMISSIONS_TOTAL = counter(
+    "v2t_run_submissions_total", "Transcription requests, by whether they started a new run or attached to an existing one.", ["result"],
+)
+EVENT_READS_TOTAL = counter("v2t_event_reads_total", "Run event log reads that returned events, by source.", ["source"])
+ACTIVE_STREAMS = gauge("v2t_active_streams", "Open SSE transcription streams.")
+ACTIVE_RUNS = gauge("v2t_active_runs", "Transcriptions currently running in background workers.")
+ASR_IN_FLIGHT = gauge("v2t_asr_in_flight", "ASR calls currently in flight.")
+
+
+def _cache_hit_ratio() -> float:
+    hits = sum(CACHE_LOOKUPS_TOTAL.value(cache=c, result="hit") for c in ("transcript", "split"))
+    total = hits + sum(CACHE_LOOKUPS_TOTAL.value(cache=c, result="miss") for c in ("transcript", "split"))
+    return hits / total if total else 0.0
+
+
+CACHE_HIT_RATIO = gauge(
+    "v2t_cache_hit_ratio",
+    "Share of segment cache lookups (transcript and split) that hit since start.",
+    fn=_cache_hit_ratio,
+)
@@ -0,0 +1,355 @@
+"""转录流水线：切分 -> 并发 ASR -> 按片段顺序产出事件。
+
+与 HTTP 连接无关，由后台任务队列的工作线程调用；所有进度都通过 emit 回调以 SSE 事件字典的形式输出。
+"""
+from __future__ import annotations
+
+import contextvars
+import logging
+import os
+import queue
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from asr_pool import ASRWorkerPool, KeyedRateLimiter, ReorderBuffer, SegmentEvent
+from audio_splitter import PROFILE_MP3_32K, EncodingProfile, SplitSegment
+from autotune import LatencyModel
+from cache_manager import CacheManager
+from log_setup import SAMPLED
+from metrics import ASR_ERRORS_TOTAL, ASR_IN_FLIGHT, CACHE_LOOKUPS_TOTAL, SEGMENTS_TOTAL, STAGE_SECONDS
+from segment_cache import content_cache_dir, count_cached_segments, iter_cached_segments, plan_segments
+from transcript_store import TranscriptStore, segment_id, transcript_key
+from vad import vad_plan
+
+# 分段方式：固定时长网格 / 静音感知
+SEGMENT_FIXED = "fixed"
+SEGMENT_VAD = "vad"
+SEGMENT_MODES = (SEGMENT_FIXED, SEGMENT_VAD)
+
+# 片段存储：disk 切分后写入分片缓存；memory 在内存中编码后直接交给 ASR，不写缓存
+STORAGE_DISK = "disk"
+STORAGE_MEMORY = "memory"
+SEGMENT_STORAGES = (STORAGE_DISK, STORAGE_MEMORY)
+
+logger = logging.getLogger(__name__)
+
+
+class TranscriptionRequest(NamedTuple):
+    audio_path: Path
+    content_hash: str
+    start_s: int
+    end_s: int
+    segment_s: int
+    segment_mode: str = SEGMENT_FIXED
+
+
+class PipelineContext(NamedTuple):
+    asr_client: object              # 提供 stream_transcribe_file(Path)、stream_transcribe_bytes(bytes) 与 api_key
+    transcript_store: TranscriptStore
+    cache_manager: CacheManager
+    cache_base_dir: Path
+    asr_model: str
+    asr_language: str
+    asr_system_content: str
+    max_concurrency: int = 4
+    rate_limiter: Optional[KeyedRateLimiter] = None
+    max_segment_s: float = 180
+    segment_storage: str = STORAGE_DISK
+    partial_window_s: float = 0.25
+    encoding: EncodingProfile = PROFILE_MP3_32K     # 送往 ASR 的片段编码
+    latency_model: Optional[LatencyModel] = None    # 记录每次成功 ASR 调用的耗时，供自动分段时长使用
+
+
+class SplitProducer:
+    """在后台线程中消费片段迭代器，片段写完即放入 sink 队列，供转录边切边转。
+
+    队列中依次出现 SplitSegment、分割异常（若失败）以及最后的 END。
+    """
+
+    END = object()
+
+    def __init__(self, segments: Iterator, sink: Optional["queue.Queue"] = None):
+        self._segments = segments
+        self.sink: "queue.Queue" = sink if sink is not None else queue.Queue()
+        self._stop = threading.Event()
+        # 切分线程沿用创建方的日志上下文
+        self._thread = threading.Thread(
+            target=contextvars.copy_context().run, args=(self._run,), name="split-producer", daemon=True,
+        )
+
+    def start(self) -> "SplitProducer":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _run(self) -> None:
+        try:
+            for seg in self._segments:
+                self.sink.put(seg)
+                if self._stop.is_set():
+                    return
+        except Exception as e:
+            self.sink.put(e)
+        finally:
+            # 关闭生成器以终止仍在运行的 ffmpeg
+            close = getattr(self._segments, "close", None)
+            if close:
+                close()
+            if not self._stop.is_set():
+                self.sink.put(self.END)
+
+
+def utf16_len(text: str) -> int:
+    # 与 JavaScript 字符串的 length 一致，前端可直接用于 slice
+    return len(text.encode("utf-16-le")) // 2
+
+
+class PartialDeltas:
+    """把片段的累计文本转换为增量事件（offset + 追加文本），并按时间窗口合并。
+
+    同一片段在 window_s 内到达的多条 partial 只保留最新一条，窗口结束时再输出，
+    因此事件数量与字节数只随片段文本长度线性增长。offset 按 UTF-16 码元计。
+    """
+
+    def __init__(self, window_s: float = 0.25):
+        self.window_s = max(0.0, float(window_s))
+        self._sent: Dict[int, str] = {}
+        self._pending: Dict[int, str] = {}
+        self._last_emit: Dict[int, float] = {}
+
+    def push(self, index: int, text: str, now: float) -> Optional[Tuple[int, str]]:
+        # 返回应立即输出的 (offset, 追加文本)；处于窗口内时暂存并返回 None
+        if now - self._last_emit.get(index, float("-inf")) < self.window_s:
+            self._pending[index] = text
+            return None
+        return self._delta(index, text, now)
+
+    def due(self, now: float) -> List[Tuple[int, int, str]]:
+        # 窗口已结束的暂存 partial：[(index, offset, 追加文本)]
+        out = []
+        for index in [i for i in self._pending if now - self._last_emit[i] >= self.window_s]:
+            delta = self._delta(index, self._pending.pop(index), now)
+            if delta is not None:
+                out.append((index, *delta))
+        return out
+
+    def next_deadline(self) -> Optional[float]:
+        if not self._pending:
+            return None
+        return min(self._last_emit[i] for i in self._pending) + self.window_s
+
+    def finish(self, index: int) -> None:
+        # 片段结束时由完整快照（segment_done）取代，丢弃暂存与已发送状态
+        self._pending.pop(index, None)
+        self._sent.pop(index, None)
+        self._last_emit.pop(index, None)
+
+    def _delta(self, index: int, text: str, now: float) -> Optional[Tuple[int, str]]:
+        self._pending.pop(index, None)
+        sent = self._sent.get(index, "")
+        if text == sent:
+            return None
+        # ASR 的累计文本通常只在末尾追加，偶尔会修正前文：从公共前缀处截断后追加
+        prefix = sent if text.startswith(sent) else os.path.commonprefix([sent, text])
+        self._sent[index] = text
+        self._last_emit[index] = now
+        return utf16_len(prefix), text[len(prefix):]
+
+
+def plan_request(req: TranscriptionRequest, max_segment_s: float, cache_dir: Path) -> List[Tuple[float, float]]:
+    # 各片段在原音频中的 (起点, 时长)
+    if req.segment_mode != SEGMENT_VAD:
+        return plan_segments(req.start_s, req.end_s, req.segment_s)
+    # 在目标时长附近的静音处切分，长静音不送 ASR；按绝对时间块规划，结果随分片缓存保存
+    return vad_plan(req.audio_path, req.start_s, req.end_s, req.segment_s, max_segment_s, cache_dir=cache_dir)
+
+
+def run_transcription(req: TranscriptionRequest, ctx: PipelineContext, emit: Callable[[Dict], None]) -> None:
+    # 正常结束时最后一个事件为 done；全局异常直接抛给调用方处理
+    start_s, end_s, segment_length_s = req.start_s, req.end_s, req.segment_s
+    cache_dir = content_cache_dir(ctx.cache_base_dir, req.content_hash)
+    vad = req.segment_mode == SEGMENT_VAD
+    if vad:
+        emit({"type": "status", "message": "analyzing"})
+        with STAGE_SECONDS.time(stage="vad"):
+            plan = plan_request(req, ctx.max_segment_s, cache_dir)
+    else:
+        plan = plan_request(req, ctx.max_segment_s, cache_dir)
+    estimated_segments = len(plan)
+    seg_ids = [segment_id(req.content_hash, round(st * 1000), round(du * 1000)) for st, du in plan]
+    keys = [transcript_key(sid, ctx.asr_model, ctx.asr_language, ctx.asr_system_content) for sid in seg_ids]
+    logger.info("[TRANSCRIBE] Starting pipeline - cache_dir: %s, estimated_segments: %s", cache_dir, estimated_segments)
+
+    def transcribe_segment(seg: SplitSegment) -> Iterator[str]:
+        # 转录成功后写入转录缓存，供后续相同片段 + 相同 ASR 配置的请求直接回放
+        text = ""
+        t0 = time.perf_counter()
+        first = True
+        with ASR_IN_FLIGHT.track():
+            if seg.data is not None:
+                chunks = ctx.asr_client.stream_transcribe_bytes(seg.data, ctx.encoding.fmt)
+            else:
+                chunks = ctx.asr_client.stream_transcribe_file(Path(seg.path))
+            for text in chunks:
+                if first:
+                    STAGE_SECONDS.observe(time.perf_counter() - t0, stage="asr_first_text")
+                    first = False
+                yield text
+        elapsed = time.perf_counter() - t0
+        STAGE_SECONDS.observe(elapsed, stage="asr")
+        if ctx.latency_model is not None:
+            ctx.latency_model.observe(seg.duration_s, elapsed)
+        if text:
+            ctx.transcript_store.put(
+                keys[seg.index], text, req.content_hash,
+                round(seg.start_s * 1000), round(seg.duration_s * 1000),
+                ctx.asr_model, ctx.asr_language,
+            )
+
+    # 分割产出的片段与 ASR 工作池的事件汇入同一个队列
+    events: "queue.Queue" = queue.Queue()
+    pool = ASRWorkerPool(
+        transcribe_segment,
+        events,
+        max_workers=ctx.max_concurrency,
+        rate_limiter=ctx.rate_limiter,
+        rate_key=getattr(ctx.asr_client, "api_key", None) or "default",
+    )
+    producer: Optional[SplitProducer] = None
+    # 转录期间固定缓存目录：已切分、尚未送往 ASR 的片段不会被其他请求触发的容量淘汰删除
+    ctx.cache_manager.pin(cache_dir)
+    try:
+        # 转录缓存命中的片段直接回放，不再切分与调用 ASR
+        stored = ctx.transcript_store.get_many(keys)
+        hits = {i: stored[k] for i, k in enumerate(keys) if k in stored}
+        misses = [i for i in range(len(plan)) if i not in hits]
+        # 其余片段中，同一内容、落在同一分割网格上、同一编码的片段文件直接复用，只切分缺失部分
+        cached_count = count_cached_segments(cache_dir, plan, only=misses, profile=ctx.encoding)
+        split_needed = len(misses) - cached_count
+        CACHE_LOOKUPS_TOTAL.inc(len(hits), cache="transcript", result="hit")
+        CACHE_LOOKUPS_TOTAL.inc(len(misses), cache="transcript", result="miss")
+        CACHE_LOOKUPS_TOTAL.inc(cached_count, cache="split", result="hit")
+        CACHE_LOOKUPS_TOTAL.inc(split_needed, cache="split", result="miss")
+        logger.info("[TRANSCRIBE] Transcript cache hits: %s/%s, cached split files: %s/%s", len(hits), estimated_segments, cached_count, len(misses))
+
+        # 预先告知分片数量
+        emit({
+            "type": "segments",
+            "segments_count": estimated_segments,
+            "segment_mode": req.segment_mode,
+            "segment_duration": segment_length_s,
+            "encoding": ctx.encoding.to_dict(),
+            # 实际送往 ASR 的音频总时长（静音感知分段时不含被去掉的静音）
+            "audio_seconds": round(sum(du for _, du in plan), 3),
+            "cached": split_needed == 0,
+            "cached_segments": cached_count,
+            "transcript_hits": len(hits),
+            "transcript_misses": len(misses),
+        })
+        for i, text in hits.items():
+            events.put(SegmentEvent(i, "done", text))
+        if split_needed:
+            emit({"type": "status", "message": "splitting"})
+        if misses:
+            logger.info("[TRANSCRIBE] Starting audio splitting - audio_path: %s, cache_dir: %s, segment_length: %s, start: %s, end: %s, storage: %s", req.audio_path, cache_dir, segment_length_s, start_s, end_s, ctx.segment_storage)
+            # 后台切分，片段写完即可开始转录
+            producer = SplitProducer(
+                iter_cached_segments(
+                    req.audio_path, cache_dir, segment_length_s, start_s, end_s,
+                    only=set(misses), index=ctx.cache_manager, plan=plan if vad else None,
+                    in_memory=ctx.segment_storage == STORAGE_MEMORY, profile=ctx.encoding,
+                ),
+                events,
+            ).start()
+        else:
+            events.put(SplitProducer.END)
+
+        # 转录：片段一就绪就提交给工作池，结果经重排缓冲按片段顺序输出
+        reorder = ReorderBuffer()
+        submitted = len(hits)
+        submitted_indices = set()
+        finished = 0
+        total = estimated_segments
+        split_finished = False
+        logger.info("[TRANSCRIBE] Starting transcription for %s segments (concurrency: %s)", total, ctx.max_concurrency)
+
+        deltas = PartialDeltas(ctx.partial_window_s)
+
+        def emit_delta(idx: int, offset: int, text: str) -> None:
+            timestamp, duration = plan[idx]
+            emit({"type": "delta", "index": idx, "timestamp": timestamp, "duration": duration,
+                  "offset": offset, "text": text})
+
+        while not split_finished or finished < submitted:
+            deadline = deltas.next_deadline()
+            try:
+                item = events.get(timeout=None if deadline is None else max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                for idx, offset, text in deltas.due(time.monotonic()):
+                    emit_delta(idx, offset, text)
+                continue
+            if item is SplitProducer.END:
+                split_finished = True
+                total = submitted
+                logger.info("[TRANSCRIBE] Audio splitting completed: %s segments", total)
+                continue
+            if isinstance(item, SplitSegment):
+                pool.submit(item.index, item)
+                submitted_indices.add(item.index)
+                submitted += 1
+                total = max(total, submitted)
+                emit({
+                    "type": "segment_ready",
+                    "index": item.index,
+                    "timestamp": plan[item.index][0],
+                    "duration": plan[item.index][1],
+                })
+                continue
+            if isinstance(item, Exception):
+                # 分割失败：已提交的片段继续转录完，未能切出的片段标记为跳过，避免阻塞重排缓冲
+                logger.error("[TRANSCRIBE] Audio splitting failed: %s", item)
+                emit({"type": "error", "message": f"音频分割失败: {item}"})
+                for i in misses:
+                    if i not in submitted_indices:
+                        events.put(SegmentEvent(i, "skipped"))
+                        submitted_indices.add(i)
+                        submitted += 1
+                split_finished = True
+                total = submitted
+                continue
+
+            for ev in reorder.push(item):
+                idx = ev.index
+                # 片段在原音频中的实际起点（静音感知分段时不再是等间隔）
+                timestamp, duration = plan[idx]
+                if ev.kind == "partial":
+                    delta = deltas.push(idx, ev.text, time.monotonic())
+                    if delta is not None:
+                        emit_delta(idx, *delta)
+                    continue
+                deltas.finish(idx)
+                if ev.kind == "done":
+                    logger.info("[TRANSCRIBE] Segment %s transcription completed - final text length: %s", idx + 1, len(ev.text))
+                    if ev.text:
+                        emit({"type": "segment_done", "index": idx, "timestamp": timestamp, "duration": duration, "text": ev.text})
+                elif ev.kind == "error":
+                    ASR_ERRORS_TOTAL.inc(error=type(ev.error).__name__)
+                    logger.error("[TRANSCRIBE] Transcription failed for segment %s: %s", idx + 1, ev.error)
+                    emit({"type": "error", "index": idx, "message": f"分段 {idx+1} 转录出错: {ev.error}"})
+                SEGMENTS_TOTAL.inc(result=ev.kind)
+                finished += 1
+                percent = int(finished / max(1, total) * 100)
+                emit({"type": "progress", "percent": percent})
+                logger.debug("[TRANSCRIBE] Progress: %s%%", percent, extra=SAMPLED)
+
+        emit({"type": "done"})
+        logger.info("[TRANSCRIBE] All transcription completed successfully")
+    finally:
+        if producer is not None:
+            producer.stop()
+        pool.shutdown(wait=False)
+        ctx.cache_manager.unpin(cache_dir)
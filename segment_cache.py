@@ -0,0 +1,249 @@
+"""按内容寻址的分片缓存。
+
+缓存目录以上传文件的内容哈希命名（cache_{hash 前 16 位}），目录内每个片段按其在原音频中的
+绝对起点与时长命名（{start_ms}_{duration_ms}.mp3，非默认编码为 {start_ms}_{duration_ms}.{编码名}.{扩展名}）。
+因此不同上传即使区间相同也不会互相复用。
+固定时长的片段落在以音频 0 秒为原点的绝对网格上，同一文件的任意区间都由相同的整格加首尾不足一格的
+边缘组成：调整区间后只需切分（与转录）缺失的边缘和新覆盖的格子。
+静音感知分段得到的片段同样按绝对起点与时长命名，与固定网格的片段共存于同一目录。
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import math
+import os
+import shutil
+import tempfile
+import threading
+from pathlib import Path
+from typing import TYPE_CHECKING, BinaryIO, Callable, Collection, Dict, Iterator, List, Optional, Tuple
+
+from audio_splitter import (
+    PROFILE_MP3_32K,
+    EncodingProfile,
+    SplitSegment,
+    iter_encode_audio_at,
+    iter_split_audio,
+    iter_split_audio_at,
+)
+from metrics import SEGMENT_BYTES_TOTAL
+
+if TYPE_CHECKING:
+    from cache_manager import CacheManager
+
+HASH_CHUNK_SIZE = 1024 * 1024
+GRID_EPSILON_S = 1e-6
+CONTENT_HASH_SUFFIX = ".sha256"
+
+_hash_memo: Dict[Tuple[str, int, int], str] = {}
+_hash_memo_lock = threading.Lock()
+
+
+# ========== 内容哈希 ==========
+def _file_signature(path: Path) -> Tuple[str, int, int]:
+    st = path.stat()
+    return str(path.resolve()), st.st_size, st.st_mtime_ns
+
+
+def _write_hash_sidecar(path: Path, content_hash: str) -> None:
+    _, size, mtime_ns = _file_signature(path)
+    sidecar = path.with_name(path.name + CONTENT_HASH_SUFFIX)
+    sidecar.write_text(json.dumps({"sha256": content_hash, "size": size, "mtime_ns": mtime_ns}), encoding="utf-8")
+
+
+def save_stream_with_hash(stream: BinaryIO, target: Path, chunk_size: int = HASH_CHUNK_SIZE) -> str:
+    # 边接收边写盘边计算 sha256，写完后原子替换目标文件，并记录哈希供后续请求直接读取
+    hasher = hashlib.sha256()
+    fd, tmp_name = tempfile.mkstemp(prefix=".upload-", dir=str(target.parent))
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = stream.read(chunk_size)
+                if not chunk:
+                    break
+                hasher.update(chunk)
+                out.write(chunk)
+        os.replace(tmp_name, target)
+    except BaseException:
+        try:
+            os.remove(tmp_name)
+        except OSError:
+            pass
+        raise
+
+    content_hash = hasher.hexdigest()
+    register_content_hash(target, content_hash)
+    return content_hash
+
+
+def register_content_hash(path: Path, content_hash: str) -> None:
+    # 记录已知文件的内容哈希（如分块上传时边接收边算出的），后续 get_content_hash 无需重新读文件
+    _write_hash_sidecar(path, content_hash)
+    with _hash_memo_lock:
+        _hash_memo[_file_signature(path)] = content_hash
+
+
+def get_content_hash(path: Path) -> str:
+    # 依次尝试：内存缓存 -> 与文件大小/修改时间一致的哈希记录 -> 重新读取文件计算
+    signature = _file_signature(path)
+    with _hash_memo_lock:
+        cached = _hash_memo.get(signature)
+    if cached:
+        return cached
+
+    sidecar = path.with_name(path.name + CONTENT_HASH_SUFFIX)
+    content_hash = None
+    try:
+        info = json.loads(sidecar.read_text(encoding="utf-8"))
+        if info.get("size") == signature[1] and info.get("mtime_ns") == signature[2]:
+            content_hash = info.get("sha256")
+    except (OSError, ValueError):
+        pass
+
+    if not content_hash:
+        hasher = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+                hasher.update(chunk)
+        content_hash = hasher.hexdigest()
+        try:
+            _write_hash_sidecar(path, content_hash)
+        except OSError:
+            pass
+
+    with _hash_memo_lock:
+        _hash_memo[signature] = content_hash
+    return content_hash
+
+
+# ========== 分片缓存 ==========
+def content_cache_dir(base_dir: Path, content_hash: str) -> Path:
+    return base_dir / f"cache_{content_hash[:16]}"
+
+
+def plan_segments(start_s: float, end_s: float, segment_s: float) -> List[Tuple[float, float]]:
+    # 区间 [start_s, end_s) 在绝对网格（0, segment_s, 2*segment_s, ...）上切分后各片段的 (起点, 时长)：
+    # 中间为整格，起点或终点不在格线上时首尾各有一个不足一格的边缘片段
+    step = max(1e-9, segment_s)
+    plan = []
+    seg_start = start_s
+    while end_s - seg_start > GRID_EPSILON_S:
+        boundary = (math.floor(seg_start / step + GRID_EPSILON_S) + 1) * step
+        seg_end = min(end_s, boundary)
+        plan.append((seg_start, seg_end - seg_start))
+        seg_start = seg_end
+    return plan
+
+
+def is_uniform_run(plan: List[Tuple[float, float]], segment_s: float) -> bool:
+    # 除最后一个外均为整格：可以从第一个片段的起点按 segment_s 等长切分
+    return all(abs(du - segment_s) <= GRID_EPSILON_S for _, du in plan[:-1])
+
+
+def segment_filename(seg_start: float, seg_duration: float, profile: EncodingProfile = PROFILE_MP3_32K) -> str:
+    stem = f"{round(seg_start * 1000)}_{round(seg_duration * 1000)}"
+    if profile == PROFILE_MP3_32K:
+        # 默认编码沿用原有文件名，已有缓存继续有效
+        return f"{stem}.mp3"
+    return f"{stem}.{profile.name}.{profile.fmt}"
+
+
+def count_cached_segments(cache_dir: Path, plan: List[Tuple[float, float]], only: Optional[Collection[int]] = None,
+                          profile: EncodingProfile = PROFILE_MP3_32K) -> int:
+    return sum(
+        1 for i, (seg_start, seg_duration) in enumerate(plan)
+        if (only is None or i in only) and (cache_dir / segment_filename(seg_start, seg_duration, profile)).exists()
+    )
+
+
+def iter_cached_segments(
+    input_file: Path,
+    cache_dir: Path,
+    segment_s: float,
+    start_s: float,
+    end_s: float,
+    split: Callable[..., Iterator[SplitSegment]] = iter_split_audio,
+    only: Optional[Collection[int]] = None,
+    index: Optional["CacheManager"] = None,
+    plan: Optional[List[Tuple[float, float]]] = None,
+    split_at: Callable[..., Iterator[SplitSegment]] = iter_split_audio_at,
+    in_memory: bool = False,
+    encode_at: Callable[..., Iterator[SplitSegment]] = iter_encode_audio_at,
+    profile: EncodingProfile = PROFILE_MP3_32K,
+) -> Iterator[SplitSegment]:
+    # 按顺序产出区间内的片段（only 给定时仅产出这些序号）：已缓存的立即产出，
+    # 连续缺失的片段合并成一次 ffmpeg 调用切分。
+    # 新片段先写入临时目录，完成后原子改名，因此中途中断不会留下不完整的缓存文件。
+    # 传入 index 时，命中与新写入的片段都会登记到缓存索引（用于容量统计与 LRU 淘汰）。
+    # 传入 plan（如静音感知的分段）时按其中的 (起点, 时长) 切分，不再使用固定网格。
+    # 固定网格下，包含不足一格的首部边缘的连续缺失片段同样按各自的 (起点, 时长) 切分。
+    # in_memory 时缺失的片段在内存中编码（SplitSegment.data），不写入缓存；已有的缓存文件照常复用。
+    # profile 决定片段的编码（采样率、声道、编码器与码率），不同编码的缓存文件互不复用。
+    fixed_grid = plan is None
+    if fixed_grid:
+        plan = plan_segments(start_s, end_s, segment_s)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def needed(idx: int) -> bool:
+        return only is None or idx in only
+
+    i = 0
+    while i < len(plan):
+        if not needed(i):
+            i += 1
+            continue
+        target = cache_dir / segment_filename(*plan[i], profile)
+        if target.exists():
+            if index is not None:
+                index.touch(target)
+            yield SplitSegment(i, str(target), *plan[i])
+            i += 1
+            continue
+
+        j = i
+        while j < len(plan) and needed(j) and not (cache_dir / segment_filename(*plan[j], profile)).exists():
+            j += 1
+        run_start = plan[i][0]
+        run_end = plan[j - 1][0] + plan[j - 1][1]
+
+        staging: Optional[Path] = None
+        if in_memory:
+            segments = encode_at(str(input_file), plan[i:j], profile=profile)
+        else:
+            staging = Path(tempfile.mkdtemp(prefix=".split-", dir=str(cache_dir)))
+            if fixed_grid and is_uniform_run(plan[i:j], segment_s):
+                segments = split(
+                    str(input_file), str(staging), segment_s, start_s=run_start, end_s=run_end, profile=profile,
+                )
+            else:
+                segments = split_at(str(input_file), str(staging), plan[i:j], profile=profile)
+        try:
+            k = i
+            for seg in segments:
+                if k >= j:
+                    # ffmpeg 按包切分时偶有末尾极短的多余片段，丢弃
+                    if seg.path:
+                        os.remove(seg.path)
+                    continue
+                if staging is None:
+                    SEGMENT_BYTES_TOTAL.inc(len(seg.data or b""), storage="memory")
+                    yield SplitSegment(k, "", *plan[k], seg.data)
+                    k += 1
+                    continue
+                target = cache_dir / segment_filename(*plan[k], profile)
+                os.replace(seg.path, target)
+                SEGMENT_BYTES_TOTAL.inc(target.stat().st_size, storage="disk")
+                if index is not None:
+                    index.add(target)
+                yield SplitSegment(k, str(target), *plan[k])
+                k += 1
+            if k < j:
+                raise RuntimeError(f"分割结果少于预期：{k - i}/{j - i} 个片段")
+        finally:
+            close = getattr(segments, "close", None)
+            if close:
+                close()
+            if staging is not None:
+                shutil.rmtree(staging, ignore_errors=True)
+        i = j
@@ -0,0 +1,95 @@
+import threading
+import types
+
+import asr_pool
+from asr_pool import KeyedRateLimiter, ReorderBuffer, SegmentEvent
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def kinds(events):
+    return [(e.index, e.kind, e.text) for e in events]
+
+
+def test_reorder_releases_in_index_order():
+    buf = ReorderBuffer()
+    assert buf.push(SegmentEvent(1, "done", "b")) == []
+    assert buf.push(SegmentEvent(2, "done", "c")) == []
+    # 片段 0 结束后，已缓存的片段 1、2 一并补发
+    assert kinds(buf.push(SegmentEvent(0, "done", "a"))) == [(0, "done", "a"), (1, "done", "b"), (2, "done", "c")]
+    assert buf.next_index == 3
+
+
+def test_reorder_passes_head_partials_and_collapses_buffered_ones():
+    buf = ReorderBuffer()
+    assert kinds(buf.push(SegmentEvent(0, "partial", "a"))) == [(0, "partial", "a")]
+    buf.push(SegmentEvent(1, "partial", "b"))
+    buf.push(SegmentEvent(1, "partial", "bb"))
+    # 片段 1 尚未结束：只补发最后一条 partial，之后片段 1 的事件直接放行
+    assert kinds(buf.push(SegmentEvent(0, "done", "ab"))) == [(0, "done", "ab"), (1, "partial", "bb")]
+    assert buf.next_index == 1
+    assert kinds(buf.push(SegmentEvent(1, "done", "bbb"))) == [(1, "done", "bbb")]
+
+
+def test_reorder_holds_events_behind_a_gap_until_it_closes():
+    buf = ReorderBuffer(first_index=5)
+    assert buf.push(SegmentEvent(7, "done", "h")) == []
+    assert kinds(buf.push(SegmentEvent(5, "done", "f"))) == [(5, "done", "f")]
+    # 片段 6 出错（或被跳过）同样结束该片段，缺口关闭后放行片段 7
+    released = buf.push(SegmentEvent(6, "error", error=RuntimeError("429")))
+    assert kinds(released) == [(6, "error", ""), (7, "done", "h")]
+    assert buf.next_index == 8
+
+
+def fake_time(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(asr_pool, "time", types.SimpleNamespace(monotonic=clock.monotonic, sleep=clock.sleep))
+    return clock
+
+
+def test_rate_limiter_rejects_when_bucket_is_empty(monkeypatch):
+    clock = fake_time(monkeypatch)
+    limiter = KeyedRateLimiter(rate_per_s=2, burst=2)
+    stop = threading.Event()
+    stop.set()
+    assert limiter.acquire("k", stop)
+    assert limiter.acquire("k", stop)
+    # 令牌用完：stop 已置位时放弃等待
+    assert not limiter.acquire("k", stop)
+    # 其他 key 有独立的配额
+    assert limiter.acquire("other", stop)
+    assert clock.now == 0.0
+
+
+def test_rate_limiter_refills_per_key(monkeypatch):
+    clock = fake_time(monkeypatch)
+    limiter = KeyedRateLimiter(rate_per_s=2, burst=2)
+    stop = threading.Event()
+    stop.set()
+    assert limiter.acquire("a", stop) and limiter.acquire("a", stop)
+    clock.now += 0.5
+    assert limiter.acquire("a", stop)
+    assert not limiter.acquire("a", stop)
+    # 空闲再久也不超过 burst
+    clock.now += 10.0
+    assert limiter.acquire("a", stop) and limiter.acquire("a", stop)
+    assert not limiter.acquire("a", stop)
+
+
+def test_rate_limiter_blocks_until_refill(monkeypatch):
+    clock = fake_time(monkeypatch)
+    limiter = KeyedRateLimiter(rate_per_s=4, burst=1)
+    assert limiter.acquire("k")
+    assert limiter.acquire("k")
+    assert clock.now == 0.25
+    # rate_per_s <= 0 表示不限速
+    assert all(KeyedRateLimiter(rate_per_s=0).acquire("k") for _ in range(100))
@@ -0,0 +1,132 @@
+import json
+import sys
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+
+import pytest
+
+from asr_resilience import (
+    BREAKER_CLOSED, BREAKER_HALF_OPEN, BREAKER_OPEN, ASRCallError, ASRTimeoutError, CircuitBreaker,
+    CircuitOpenError, RetryPolicy, resilient_stream,
+)
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "benchmarks"))
+from fake_dashscope import GENERATION_PATH, FakeDashScope  # noqa: E402
+
+NO_BACKOFF = RetryPolicy(max_retries=2, base_s=0.0, max_s=0.0)
+
+
+@pytest.fixture
+def fake():
+    server = FakeDashScope(latency_s=0.0, chunks=3, chunk_interval_s=0.0, seed=0).start()
+    yield server
+    server.stop()
+
+
+def stream_once(fake, remaining):
+    # 最小的 HTTP 客户端：非 200 响应转为 ASRCallError，未收到结束标记的流视为连接中断
+    request = urllib.request.Request(
+        fake.base_url.replace("/api/v1", "") + GENERATION_PATH, data=b"{}", method="POST",
+        headers={"Content-Type": "application/json"},
+    )
+    try:
+        response = urllib.request.urlopen(request, timeout=remaining or 10)
+    except urllib.error.HTTPError as e:
+        body = json.loads(e.read() or b"{}")
+        raise ASRCallError(body.get("message", ""), e.code, body.get("code")) from None
+    finished = False
+    with response:
+        for line in response:
+            if line.startswith(b"data:"):
+                choice = json.loads(line[5:])["output"]["choices"][0]
+                finished = choice["finish_reason"] == "stop"
+                yield choice["message"]["content"][0]["text"]
+    if not finished:
+        raise ConnectionResetError("stream closed before finish")
+
+
+def transcribe(fake, policy=NO_BACKOFF, breaker=None, timeout_s=None, sleep=lambda s: None):
+    return list(resilient_stream(lambda remaining: stream_once(fake, remaining), "test",
+                                 policy=policy, breaker=breaker, timeout_s=timeout_s, sleep=sleep))
+
+
+@pytest.mark.parametrize("kind", ["throttle", "error", "drop"])
+def test_retryable_failures_are_retried_up_to_policy(fake, kind):
+    fake.rates[kind] = 1.0
+    with pytest.raises((ASRCallError, ConnectionResetError)):
+        transcribe(fake)
+    assert fake.counts["requests"] == NO_BACKOFF.max_retries + 1
+    assert fake.counts[kind] == NO_BACKOFF.max_retries + 1
+
+
+def test_retry_succeeds_after_transient_failure(fake):
+    fake.rates["throttle"] = 1.0
+    sleeps = []
+
+    def sleep(delay):
+        # 第一次失败后服务恢复
+        sleeps.append(delay)
+        fake.rates["throttle"] = 0.0
+
+    texts = transcribe(fake, sleep=sleep)
+    assert len(sleeps) == 1
+    assert fake.counts == {"requests": 2, "ok": 1, "throttle": 1, "error": 0, "drop": 0, "stall": 0}
+    assert len(texts) == 3
+
+
+def test_non_retryable_error_is_not_retried():
+    calls = []
+
+    def attempt(remaining):
+        calls.append(remaining)
+        raise ASRCallError("bad request", 400, "InvalidParameter")
+        yield  # pragma: no cover
+
+    with pytest.raises(ASRCallError):
+        list(resilient_stream(attempt, "test", policy=NO_BACKOFF, sleep=lambda s: None))
+    assert len(calls) == 1
+
+
+def test_deadline_bounds_stalled_call(fake):
+    fake.rates["stall"] = 1.0
+    fake.stall_s = 3.0
+    t0 = time.monotonic()
+    # 底层读超时取剩余时间，超时后不再有时间重试
+    with pytest.raises((ASRTimeoutError, TimeoutError)):
+        transcribe(fake, timeout_s=0.5)
+    assert time.monotonic() - t0 < 2.0
+    assert fake.counts["requests"] == 1
+
+
+def test_breaker_opens_and_half_opens(fake):
+    now = [0.0]
+    breaker = CircuitBreaker(threshold=2, cooldown_s=10.0, clock=lambda: now[0])
+    policy = RetryPolicy(max_retries=0, base_s=0.0, max_s=0.0)
+    fake.rates["error"] = 1.0
+
+    for _ in range(2):
+        with pytest.raises(ASRCallError):
+            transcribe(fake, policy=policy, breaker=breaker)
+    assert breaker.state == BREAKER_OPEN
+
+    # 冷却期内快速失败，不发请求
+    with pytest.raises(CircuitOpenError):
+        transcribe(fake, policy=policy, breaker=breaker)
+    assert fake.counts["requests"] == 2
+
+    # 冷却结束：放行一次试探，失败则重新打开
+    now[0] += 10.0
+    assert breaker.state == BREAKER_HALF_OPEN
+    with pytest.raises(ASRCallError):
+        transcribe(fake, policy=policy, breaker=breaker)
+    assert breaker.state == BREAKER_OPEN
+    assert fake.counts["requests"] == 3
+
+    # 再次冷却后试探成功，熔断器关闭
+    now[0] += 10.0
+    fake.rates["error"] = 0.0
+    assert transcribe(fake, policy=policy, breaker=breaker)
+    assert breaker.state == BREAKER_CLOSED
+    assert fake.counts["requests"] == 4
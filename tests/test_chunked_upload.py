@@ -0,0 +1,28 @@
+import hashlib
+import io
+
+import pytest
+
+from chunked_upload import UploadError, UploadManager
+
+
+def test_incomplete_upload_does_not_create_target_dir(tmp_path):
+    manager = UploadManager(tmp_path)
+    upload_id = manager.init("a.wav", 10)["upload_id"]
+    manager.put_chunk(upload_id, 0, io.BytesIO(b"12345"), 1024)
+    target = tmp_path / "job1" / "a.wav"
+    with pytest.raises(UploadError) as exc:
+        manager.complete(upload_id, target)
+    assert exc.value.status == 409
+    assert not target.parent.exists()
+
+
+def test_complete_moves_file_into_new_dir(tmp_path):
+    manager = UploadManager(tmp_path)
+    upload_id = manager.init("a.wav", 10)["upload_id"]
+    manager.put_chunk(upload_id, 0, io.BytesIO(b"12345"), 1024)
+    manager.put_chunk(upload_id, 5, io.BytesIO(b"67890"), 1024)
+    path, content_hash = manager.complete(upload_id, tmp_path / "job1" / "a.wav")
+    assert path.read_bytes() == b"1234567890"
+    assert content_hash == hashlib.sha256(b"1234567890").hexdigest()
+    assert not list((tmp_path / ".partial").iterdir())
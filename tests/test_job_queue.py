@@ -0,0 +1,75 @@
+import json
+import time
+
+from job_queue import RUN_DONE, RUN_ERROR, TranscriptionQueue
+
+
+def wait_finished(q, run_id, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        run = q.get(run_id)
+        if run["status"] in (RUN_DONE, RUN_ERROR):
+            return run
+        q.wait(run_id, 0, 0.05)
+    raise AssertionError("run did not finish")
+
+
+def events(q, run_id, after=0):
+    return [(seq, json.loads(data)) for seq, data in q.read(run_id, after)]
+
+
+def test_run_with_segment_errors_is_rerun(tmp_path):
+    calls = []
+
+    def runner(run, emit):
+        calls.append(run["run_id"])
+        if len(calls) == 1:
+            emit({"type": "error", "index": 0, "message": "429"})
+        else:
+            emit({"type": "segment_done", "index": 0, "text": "ok"})
+        emit({"type": "done"})
+
+    q = TranscriptionQueue(tmp_path / "jobs.sqlite3", runner, workers=1)
+    first = q.submit("job-a", {"content_hash": "h"})
+    assert wait_finished(q, first["run_id"])["status"] == RUN_ERROR
+    last_seq = events(q, first["run_id"])[-1][0]
+
+    second = q.submit("job-b", {"content_hash": "h", "filename": "other.wav"})
+    assert second["run_id"] == first["run_id"]
+    assert wait_finished(q, second["run_id"])["status"] == RUN_DONE
+    assert len(calls) == 2
+    # 重跑后旧的错误事件被清除，序号接着原有日志
+    rerun = events(q, second["run_id"])
+    assert rerun[0][0] == last_seq + 1
+    assert [e["type"] for _, e in rerun] == ["status", "segment_done", "done"]
+
+    # 成功的 run 直接附着，不再调用 runner
+    q.submit("job-c", {"content_hash": "h"})
+    assert len(calls) == 2
+
+
+def test_buffered_deltas_are_readable_and_persisted(tmp_path):
+    def runner(run, emit):
+        for i in range(50):
+            emit({"type": "delta", "index": 0, "offset": i, "text": "x"})
+        emit({"type": "done"})
+
+    db = tmp_path / "jobs.sqlite3"
+    q = TranscriptionQueue(db, runner, workers=1)
+    run = q.submit("job", {"content_hash": "h"})
+    wait_finished(q, run["run_id"])
+    assert len(events(q, run["run_id"])) == 51
+    # 新进程（新连接）从 SQLite 读到全部事件
+    reopened = TranscriptionQueue(db, runner, workers=1)
+    assert len(events(reopened, run["run_id"])) == 51
+
+
+def test_prune_removes_expired_runs(tmp_path):
+    q = TranscriptionQueue(tmp_path / "jobs.sqlite3", lambda run, emit: emit({"type": "done"}), workers=1,
+                           retention_s=0.01)
+    run = q.submit("job", {"content_hash": "h"})
+    wait_finished(q, run["run_id"])
+    time.sleep(0.05)
+    assert q.prune(force=True) == 1
+    assert q.get(run["run_id"]) is None
+    assert q.read(run["run_id"]) == []
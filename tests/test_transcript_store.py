@@ -0,0 +1,58 @@
+import time
+
+import pytest
+
+import transcript_store
+from transcript_store import TranscriptStore, segment_id, transcript_key
+
+
+def put(store, start_ms, duration_ms, text, content_hash="h", model="m"):
+    key = transcript_key(segment_id(content_hash, start_ms, duration_ms), model, "", "")
+    store.put(key, text, content_hash, start_ms, duration_ms, model, "")
+    time.sleep(0.002)   # created_at 区分先后
+
+
+def spans(store, **kw):
+    return [(s["timestamp"], s["duration"], s["text"]) for s in store.iter_segments("h", **kw)]
+
+
+@pytest.fixture
+def store(tmp_path):
+    return TranscriptStore(tmp_path / "t.sqlite3")
+
+
+def test_export_keeps_coverage_when_newer_short_edge_segment_overlaps(store):
+    put(store, 0, 60_000, "a")
+    put(store, 60_000, 60_000, "b")
+    put(store, 60_000, 10_000, "b-edge")       # 较新的区间边缘短片段
+    assert spans(store) == [(0, 60, "a"), (60, 60, "b")]
+
+
+def test_export_fills_gaps_from_overlapping_segments(store):
+    put(store, 0, 60_000, "a")
+    put(store, 30_000, 60_000, "c")            # 跨越 60 秒边界、另一分段网格上的片段
+    put(store, 120_000, 60_000, "d")
+    assert spans(store) == [(0, 60, "a"), (30, 60, "c"), (120, 60, "d")]
+
+
+def test_export_prefers_newest_for_identical_span_and_respects_range(store):
+    put(store, 0, 60_000, "old")
+    put(store, 0, 60_000, "new", model="m2")
+    put(store, 60_000, 60_000, "b")
+    assert spans(store) == [(0, 60, "new"), (60, 60, "b")]
+    assert spans(store, start_ms=70_000, end_ms=80_000) == [(60, 60, "b")]
+
+
+def test_export_pages_through_many_rows(store, monkeypatch):
+    monkeypatch.setattr(transcript_store, "EXPORT_BATCH", 3)
+    for i in range(10):
+        put(store, i * 10_000, 10_000, f"s{i}")
+        put(store, i * 10_000, 5_000, f"e{i}")
+    assert [t for _, _, t in spans(store)] == [f"s{i}" for i in range(10)]
+
+
+def test_short_terms_search_without_index(store):
+    put(store, 0, 60_000, "今天开会讨论预算")
+    put(store, 60_000, 60_000, "明天出差")
+    hits = store.search("预算")
+    assert [h["timestamp"] for h in hits] == [0]
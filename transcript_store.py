@@ -0,0 +1,257 @@
+"""按片段持久化的转录结果缓存（SQLite）。
+
+键由片段标识（源音频内容哈希 + 片段绝对起点/时长）与 ASR 配置（模型、语言、上下文提示）共同决定，
+任一项变化都会视为未命中。同一片段再次转录时直接回放结果，不再调用 ASR。
+
+转录文本同时写入 FTS5 全文索引（trigram 分词，中文无需分词也能按任意子串检索），供跨录音搜索；
+SQLite 缺少 FTS5 或 trigram 分词器时退化为 LIKE 扫描。少于 3 个字符的检索词（如 1-2 个汉字）无法使用
+trigram 索引，同样用 LIKE 匹配：未限定录音时只扫描最近写入的 LIKE_SCAN_ROWS 个片段。
+"""
+from __future__ import annotations
+
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# trigram 分词按 3 个字符建索引：更短的检索词无法使用索引，改用 LIKE 过滤
+SEARCH_MIN_CHARS = 3
+# 搜索结果中命中位置前后保留的字符数
+SNIPPET_CHARS = 30
+EXPORT_BATCH = 500
+# 只有短检索词且未限定录音时，LIKE 扫描的片段数上限（按写入顺序取最近的）
+LIKE_SCAN_ROWS = 50_000
+
+
+def segment_id(content_hash: str, start_ms: int, duration_ms: int) -> str:
+    # 片段的内容标识：同一源文件的同一绝对区间，按同一编码参数切出的片段内容一致
+    return f"{content_hash}:{start_ms}:{duration_ms}"
+
+
+def transcript_key(seg_id: str, model: str, language: str, context: str) -> str:
+    raw = "\x1f".join((seg_id, model or "", language or "", context or ""))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _like_pattern(term: str) -> str:
+    return "%" + term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+
+def make_snippet(text: str, terms: List[str], width: int = SNIPPET_CHARS) -> str:
+    # 以第一个命中的检索词为中心截取文本，命中处用【】标出
+    lowered = text.lower()
+    pos = min((p for p in (lowered.find(t.lower()) for t in terms) if p >= 0), default=0)
+    start, end = max(0, pos - width), min(len(text), pos + width * 2)
+    snippet = text[start:end]
+    for term in sorted(set(terms), key=len, reverse=True):
+        i = snippet.lower().find(term.lower())
+        if i >= 0:
+            snippet = snippet[:i] + "【" + snippet[i:i + len(term)] + "】" + snippet[i + len(term):]
+    return ("…" if start > 0 else "") + snippet + ("…" if end < len(text) else "")
+
+
+class TranscriptStore:
+    """线程安全的 SQLite 存储，所有连接共享一把锁（写入量很小，无需连接池）。"""
+
+    def __init__(self, db_path: Path):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS transcripts (
+                    key TEXT PRIMARY KEY,
+                    content_hash TEXT NOT NULL,
+                    start_ms INTEGER NOT NULL,
+                    duration_ms INTEGER NOT NULL,
+                    model TEXT NOT NULL,
+                    language TEXT NOT NULL,
+                    text TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )
+                """
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_transcripts_content ON transcripts (content_hash, start_ms)"
+            )
+            self.fts = self._init_fts_locked()
+            self._conn.commit()
+
+    def _init_fts_locked(self) -> bool:
+        # 外部内容表：索引只存分词结果，文本仍在 transcripts 中；触发器保持两者同步
+        exists = self._conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'transcripts_fts'"
+        ).fetchone()
+        try:
+            self._conn.executescript(
+                """
+                CREATE VIRTUAL TABLE IF NOT EXISTS transcripts_fts USING fts5(
+                    text, content='transcripts', content_rowid='rowid', tokenize='trigram'
+                );
+                CREATE TRIGGER IF NOT EXISTS transcripts_fts_ai AFTER INSERT ON transcripts BEGIN
+                    INSERT INTO transcripts_fts (rowid, text) VALUES (new.rowid, new.text);
+                END;
+                CREATE TRIGGER IF NOT EXISTS transcripts_fts_ad AFTER DELETE ON transcripts BEGIN
+                    INSERT INTO transcripts_fts (transcripts_fts, rowid, text) VALUES ('delete', old.rowid, old.text);
+                END;
+                CREATE TRIGGER IF NOT EXISTS transcripts_fts_au AFTER UPDATE OF text ON transcripts BEGIN
+                    INSERT INTO transcripts_fts (transcripts_fts, rowid, text) VALUES ('delete', old.rowid, old.text);
+                    INSERT INTO transcripts_fts (rowid, text) VALUES (new.rowid, new.text);
+                END;
+                """
+            )
+        except sqlite3.OperationalError as e:
+            logger.warning("[STORE] Full-text index unavailable, search falls back to LIKE: %s", e)
+            return False
+        if not exists:
+            # 为已有的转录结果建立索引
+            self._conn.execute("INSERT INTO transcripts_fts (transcripts_fts) VALUES ('rebuild')")
+        return True
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT text FROM transcripts WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, str]:
+        keys = list(keys)
+        found: Dict[str, str] = {}
+        # SQLite 默认最多 999 个绑定参数
+        for i in range(0, len(keys), 500):
+            batch = keys[i:i + 500]
+            placeholders = ",".join("?" * len(batch))
+            with self._lock:
+                rows = self._conn.execute(
+                    f"SELECT key, text FROM transcripts WHERE key IN ({placeholders})", batch
+                ).fetchall()
+            found.update(rows)
+        return found
+
+    def put(self, key: str, text: str, content_hash: str, start_ms: int, duration_ms: int,
+            model: str, language: str) -> None:
+        # 用 UPSERT 而不是 INSERT OR REPLACE：REPLACE 删除旧行时不触发删除触发器，会在全文索引中留下旧文本
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO transcripts "
+                "(key, content_hash, start_ms, duration_ms, model, language, text, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET text = excluded.text, created_at = excluded.created_at",
+                (key, content_hash, start_ms, duration_ms, model, language or "", text, time.time()),
+            )
+            self._conn.commit()
+
+    def search(self, query: str, limit: int = 20, content_hash: Optional[str] = None,
+               model: Optional[str] = None) -> List[Dict]:
+        # 按空白分隔的检索词取交集；同一片段被多个 ASR 配置转录时只返回一条
+        terms = query.split()
+        if not terms:
+            return []
+        indexed = [t for t in terms if len(t) >= SEARCH_MIN_CHARS] if self.fts else []
+        where, args = [], []
+        for term in terms:
+            if term not in indexed:
+                where.append("t.text LIKE ? ESCAPE '\\'")
+                args.append(_like_pattern(term))
+        if content_hash:
+            where.append("t.content_hash = ?")
+            args.append(content_hash)
+        elif not indexed:
+            # 全表 LIKE 扫描：限定在最近写入的片段内
+            where.append("t.rowid > (SELECT COALESCE(MAX(rowid), 0) FROM transcripts) - ?")
+            args.append(LIKE_SCAN_ROWS)
+        if model:
+            where.append("t.model = ?")
+            args.append(model)
+        columns = "t.content_hash, t.start_ms, t.duration_ms, t.model, t.language, t.text"
+        if indexed:
+            match = " AND ".join('"' + t.replace('"', '""') + '"' for t in indexed)
+            sql = (f"SELECT {columns} FROM transcripts_fts f JOIN transcripts t ON t.rowid = f.rowid "
+                   f"WHERE transcripts_fts MATCH ? {''.join(' AND ' + w for w in where)} ORDER BY f.rank LIMIT ?")
+            args = [match, *args]
+        else:
+            sql = f"SELECT {columns} FROM transcripts t WHERE {' AND '.join(where)} ORDER BY t.created_at DESC LIMIT ?"
+        with self._lock:
+            rows = self._conn.execute(sql, (*args, max(1, int(limit)) * 2)).fetchall()
+
+        hits, seen = [], set()
+        for content, start_ms, duration_ms, seg_model, language, text in rows:
+            if (content, start_ms, duration_ms) in seen:
+                continue
+            seen.add((content, start_ms, duration_ms))
+            hits.append({
+                "content_hash": content,
+                "timestamp": start_ms / 1000,
+                "duration": duration_ms / 1000,
+                "model": seg_model,
+                "language": language,
+                "text": text,
+                "snippet": make_snippet(text, terms),
+            })
+            if len(hits) >= limit:
+                break
+        return hits
+
+    def iter_segments(self, content_hash: str, start_ms: int = 0, end_ms: Optional[int] = None,
+                      model: Optional[str] = None) -> Iterator[Dict]:
+        # 按时间顺序产出与 [start_ms, end_ms) 有交集的转录片段（导出用），分批读取，不一次载入全部结果。
+        # 不同分段时长或 ASR 配置的结果可能相互重叠（如区间边缘的短片段）：按覆盖范围贪心选取，
+        # 每一步在覆盖当前位置的片段中取结束最晚的（相同时取最近转录的），完全被已选片段覆盖的跳过，不丢失音频
+        cursor = start_ms
+        best = None
+        for seg in self._rows_by_start(content_hash, start_ms, end_ms, model):
+            seg_start, seg_end = seg[0], seg[0] + max(1, seg[1])
+            if best is not None and seg_start > cursor:
+                # 当前位置之前的候选已全部读到：产出覆盖最远的一条
+                yield {"timestamp": best[0] / 1000, "duration": best[1] / 1000, "text": best[2]}
+                cursor, best = best[0] + max(1, best[1]), None
+            if seg_end <= cursor:
+                continue
+            if seg_start > cursor:
+                # 没有片段覆盖的空档：从下一个片段的起点继续
+                cursor = seg_start
+            if best is None or seg_end > best[0] + max(1, best[1]):
+                best = seg
+        if best is not None:
+            yield {"timestamp": best[0] / 1000, "duration": best[1] / 1000, "text": best[2]}
+
+    def _rows_by_start(self, content_hash: str, start_ms: int, end_ms: Optional[int],
+                       model: Optional[str]) -> Iterator[tuple]:
+        # 按起点（同一起点最近转录的在前）分页产出 (start_ms, duration_ms, text)；同一起点的行不跨页拆分
+        sql = ("SELECT start_ms, duration_ms, text FROM transcripts "
+               "WHERE content_hash = ? AND start_ms >= ? AND start_ms + duration_ms > ?"
+               + (" AND start_ms < ?" if end_ms is not None else "")
+               + (" AND model = ?" if model else "")
+               + " ORDER BY start_ms, created_at DESC")
+        extra = [*([end_ms] if end_ms is not None else []), *([model] if model else [])]
+        page_start = 0
+        while True:
+            with self._lock:
+                rows = self._conn.execute(sql + " LIMIT ?", (content_hash, page_start, start_ms, *extra, EXPORT_BATCH)).fetchall()
+            if len(rows) < EXPORT_BATCH:
+                yield from rows
+                return
+            last = rows[-1][0]
+            head = [r for r in rows if r[0] < last]
+            if not head:
+                # 整页同一起点：该起点的行一次读完
+                with self._lock:
+                    head = self._conn.execute(
+                        sql.replace("start_ms >= ?", "start_ms = ?", 1), (content_hash, last, start_ms, *extra),
+                    ).fetchall()
+                last += 1
+            yield from head
+            page_start = last
+
+    def clear(self) -> int:
+        with self._lock:
+            cur = self._conn.execute("DELETE FROM transcripts")
+            self._conn.commit()
+        return cur.rowcount
@@ -0,0 +1,201 @@
+"""基于帧能量的静音检测（VAD）与静音感知的分段规划。
+
+把所选区间解码为 16kHz 单声道 PCM，按帧计算能量（NumPy 向量化，逐块读取，内存只与帧数有关），
+在目标时长附近的静音处切分，较长的静音整体丢弃，每个片段不超过 ASR 单次允许的最长时长。
+分析按以 0 秒为原点的固定时间块（VAD_BLOCK_S）进行并按块缓存，再裁剪到请求的区间：
+同一文件的不同区间得到一致的片段边界，区间内部的片段可以复用已有的切分与转录结果。
+"""
+from __future__ import annotations
+
+import json
+import math
+import shutil
+import subprocess
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+VAD_SAMPLE_RATE = 16000
+FRAME_S = 0.03
+READ_FRAMES = 2048            # 每次从 ffmpeg 读取的帧数（约 1 分钟音频）
+SILENCE_FLOOR_DB = -55.0      # 整段能量都低于此值视为无语音
+MARGIN_DB = 10.0              # 语音阈值高出噪声底的幅度
+MIN_DYNAMIC_RANGE_DB = 8.0    # 能量起伏小于此值时不区分语音与静音（整段视为语音）
+MIN_SILENCE_S = 0.3           # 短于此值的停顿视为语音的一部分
+MAX_SILENCE_S = 2.0           # 长于此值的静音从送往 ASR 的音频中去掉
+PAD_S = 0.2                   # 语音段两侧保留的静音，避免截断首尾音节
+MIN_SPEECH_S = 0.2            # 短于此值的孤立能量峰（咔哒声等）忽略
+VAD_BLOCK_S = 600.0           # 静音分析的绝对时间块长度，片段不跨越块边界
+
+
+def frame_energy_db(input_file, start_s: float, end_s: float, frame_s: float = FRAME_S) -> np.ndarray:
+    # 返回区间内每帧的 RMS 能量（dBFS）
+    if not shutil.which("ffmpeg"):
+        raise EnvironmentError("未找到 ffmpeg，请确认其已安装并在 PATH 中")
+    cmd = [
+        "ffmpeg", "-hide_banner", "-loglevel", "error",
+        "-ss", f"{start_s:.6f}", "-t", f"{end_s - start_s:.6f}",
+        "-i", str(input_file),
+        "-vn", "-ac", "1", "-ar", str(VAD_SAMPLE_RATE),
+        "-f", "s16le", "pipe:1",
+    ]
+    frame_len = int(round(VAD_SAMPLE_RATE * frame_s))
+    frame_bytes = frame_len * 2
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    parts: List[np.ndarray] = []
+    rest = b""
+    try:
+        while True:
+            buf = proc.stdout.read(frame_bytes * READ_FRAMES)
+            if not buf:
+                break
+            data = rest + buf
+            n = len(data) // frame_bytes
+            if n:
+                samples = np.frombuffer(data[:n * frame_bytes], dtype="<i2").reshape(n, frame_len).astype(np.float32)
+                parts.append(np.sqrt(np.mean(samples * samples, axis=1)))
+            rest = data[n * frame_bytes:]
+        if len(rest) >= 2:
+            tail = np.frombuffer(rest[:len(rest) // 2 * 2], dtype="<i2").astype(np.float32)
+            parts.append(np.sqrt(np.mean(tail * tail, keepdims=True)))
+        _, stderr = proc.communicate()
+        if proc.returncode != 0:
+            raise RuntimeError(f"ffmpeg 解码失败: {stderr.decode('utf-8', 'replace').strip()}")
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+            proc.communicate()
+
+    rms = np.concatenate(parts) if parts else np.zeros(0, dtype=np.float32)
+    return 20.0 * np.log10(np.maximum(rms, 1.0) / 32768.0)
+
+
+def _runs(mask: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    # mask 中连续 True 段的 [起点, 终点) 帧序号
+    edges = np.diff(np.concatenate(([0], mask.astype(np.int8), [0])))
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+
+def plan_vad_segments(
+    energy_db: np.ndarray,
+    start_s: float,
+    end_s: float,
+    target_s: float,
+    max_s: float,
+    frame_s: float = FRAME_S,
+    threshold_db: Optional[float] = None,
+) -> List[Tuple[float, float]]:
+    # 返回各片段在原音频中的 (起点, 时长)，与 segment_cache.plan_segments 的格式一致
+    n = len(energy_db)
+    if n == 0:
+        return []
+    if threshold_db is None:
+        p10, p90 = np.percentile(energy_db, [10, 90])
+        if p90 < SILENCE_FLOOR_DB:
+            return []
+        if p90 - p10 < MIN_DYNAMIC_RANGE_DB:
+            threshold_db = -np.inf
+        else:
+            # 动态范围不大时取中点，避免把语音整体判为静音
+            threshold_db = min(p10 + MARGIN_DB, (p10 + p90) / 2)
+    speech = energy_db > threshold_db
+
+    # 静音段：过短的停顿并入语音；足够长的静音作为候选切点，更长的静音直接去掉
+    sil_starts, sil_ends = _runs(~speech)
+    sil_len = sil_ends - sil_starts
+    at_edge = (sil_starts == 0) | (sil_ends == n)
+    keep = (sil_len >= MIN_SILENCE_S / frame_s) | at_edge
+    sil_starts, sil_ends, sil_len, at_edge = sil_starts[keep], sil_ends[keep], sil_len[keep], at_edge[keep]
+    gap = (sil_len >= MAX_SILENCE_S / frame_s) | at_edge
+    cut_mid = ((sil_starts + sil_ends) // 2)[~gap]
+    cut_len = sil_len[~gap]
+
+    # 被长静音隔开的语音岛，两侧各保留少量静音
+    bounds = np.concatenate(([0], np.column_stack((sil_starts[gap], sil_ends[gap])).ravel(), [n]))
+    pad = int(round(PAD_S / frame_s))
+    target = max(1, int(round(target_s / frame_s)))
+    limit = max(1, int(max_s / frame_s))
+    last = min(limit, int(target * 1.5))
+
+    segments: List[Tuple[int, int]] = []
+    for a, b in bounds.reshape(-1, 2):
+        if b - a < MIN_SPEECH_S / frame_s:
+            continue
+        a, b = max(0, a - pad), min(n, b + pad)
+        cur = a
+        while b - cur > last:
+            lo, hi = cur + target // 2, cur + last
+            in_window = (cut_mid > lo) & (cut_mid <= hi)
+            if in_window.any():
+                # 取离目标长度最近的停顿，距离相同时取较长的停顿
+                mids = cut_mid[in_window]
+                score = np.abs(mids - (cur + target)) - cut_len[in_window] * 0.5
+                cut = int(mids[np.argmin(score)])
+            else:
+                # 窗口内没有停顿：在目标长度附近（±10%）能量最低的帧处切
+                near_lo = max(lo, cur + target - target // 10)
+                near_hi = min(hi, cur + target + target // 10)
+                cut = near_lo + 1 + int(np.argmin(energy_db[near_lo + 1:near_hi + 1]))
+            segments.append((cur, cut))
+            cur = cut
+        segments.append((cur, b))
+
+    plan = []
+    for a, b in segments:
+        seg_start = round(start_s + int(a) * frame_s, 3)
+        seg_end = round(min(end_s, start_s + int(b) * frame_s), 3)
+        if seg_end > seg_start:
+            plan.append((seg_start, round(seg_end - seg_start, 3)))
+    return plan
+
+
+def clip_plan(plan: List[Tuple[float, float]], start_s: float, end_s: float) -> List[Tuple[float, float]]:
+    # 保留与 [start_s, end_s) 重叠的片段，跨越区间端点的片段裁剪为区间内的部分（过短的丢弃）
+    clipped = []
+    for seg_start, seg_duration in plan:
+        a, b = max(seg_start, start_s), min(seg_start + seg_duration, end_s)
+        if b - a >= MIN_SPEECH_S:
+            clipped.append((round(a, 3), round(b - a, 3)))
+    return clipped
+
+
+def _block_plan(input_file, block_start: float, block_s: float, target_s: float, max_s: float,
+                cache_path: Optional[Path]) -> List[Tuple[float, float]]:
+    # 解码 + 规划一个时间块；给定 cache_path 时结果以 JSON 保存，同一内容同一块不再重复解码
+    if cache_path is not None:
+        try:
+            return [tuple(p) for p in json.loads(Path(cache_path).read_text(encoding="utf-8"))]
+        except (OSError, ValueError):
+            pass
+    # 最后一个块可能超出音频结尾：解码到结尾为止，片段终点不会超出实际音频
+    energy = frame_energy_db(input_file, block_start, block_start + block_s)
+    plan = plan_vad_segments(energy, block_start, block_start + block_s, target_s, max_s)
+    if cache_path is not None:
+        Path(cache_path).parent.mkdir(parents=True, exist_ok=True)
+        Path(cache_path).write_text(json.dumps(plan), encoding="utf-8")
+    return plan
+
+
+def vad_plan(
+    input_file,
+    start_s: float,
+    end_s: float,
+    target_s: float,
+    max_s: float,
+    cache_dir: Optional[Path] = None,
+    block_s: float = VAD_BLOCK_S,
+) -> List[Tuple[float, float]]:
+    # 对区间覆盖的每个时间块分别规划（给定 cache_dir 时按块缓存），拼接后裁剪到 [start_s, end_s)
+    plan: List[Tuple[float, float]] = []
+    block = math.floor(start_s / block_s)
+    while block * block_s < end_s:
+        block_start = block * block_s
+        cache_path = None
+        if cache_dir is not None:
+            cache_path = Path(cache_dir) / (
+                f"vad_{round(block_start * 1000)}_{round(block_s * 1000)}_{target_s:g}_{max_s:g}.json"
+            )
+        plan += _block_plan(input_file, block_start, block_s, target_s, max_s, cache_path)
+        block += 1
+    return clip_plan(plan, start_s, end_s)